@@ -0,0 +1,67 @@
+"""
+Throughput of BlockingJSONRPCClient with 1, 8 and 64 calling threads against
+a loopback server running in the same reactor thread.
+
+    python benchmarks/bench_blocking.py [--calls N] [--pool-size N]
+"""
+import argparse
+import threading
+import time
+
+from twisted.internet import reactor, threads
+
+from txjason import handler
+from txjason.blocking import BlockingJSONRPCClient, ReactorThread
+from txjason.netstring import JSONRPCServerFactory
+
+
+class Bench(handler.Handler):
+    @handler.exportRPC()
+    def echo(self, x):
+        return x
+
+
+def listen():
+    factory = JSONRPCServerFactory()
+    factory.addHandler(Bench(), 'bench')
+    return reactor.listenTCP(0, factory, interface='127.0.0.1')
+
+
+def run(client, threadCount, calls):
+    perThread = calls // threadCount
+
+    def worker():
+        for i in xrange(perThread):
+            client.callRemote('bench.echo', i)
+
+    workers = [threading.Thread(target=worker) for i in range(threadCount)]
+    start = time.time()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return perThread * threadCount / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--pool-size', type=int, default=4)
+    args = parser.parse_args()
+
+    reactorThread = ReactorThread(reactor)
+    reactorThread.start()
+    port = threads.blockingCallFromThread(reactor, listen)
+    client = BlockingJSONRPCClient(
+        'tcp:127.0.0.1:%d' % (port.getHost().port,),
+        poolSize=args.pool_size)
+    client.callRemote('bench.echo', 'warmup')
+    for threadCount in (1, 8, 64):
+        rate = run(client, threadCount, args.calls)
+        print '%3d threads: %10.1f calls/s' % (threadCount, rate)
+    client.close()
+    reactorThread.stop()
+
+
+if __name__ == '__main__':
+    main()
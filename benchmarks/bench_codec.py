@@ -0,0 +1,54 @@
+"""
+Payload size and encode/decode time of the JSON and MessagePack codecs on
+representative JSON-RPC messages.
+
+    python benchmarks/bench_codec.py [--repeat N]
+"""
+import argparse
+import random
+import timeit
+
+from txjason import codec
+
+
+def messages():
+    rand = random.Random(0)
+    cdrs = [{'id': 1000000 + i,
+             'from': '+1206%07d' % rand.randrange(10 ** 7),
+             'to': '+1425%07d' % rand.randrange(10 ** 7),
+             'start': 1400000000 + rand.randrange(86400),
+             'duration': rand.random() * 600,
+             'rate': rand.random() / 100,
+             'route': [rand.randrange(1000) for j in range(4)]}
+            for i in range(500)]
+    matrix = [[rand.random() for j in range(100)] for i in range(100)]
+    return [
+        ('small call', {'jsonrpc': '2.0', 'id': 1, 'method': 'main.echo',
+                        'params': ['foo', 42]}),
+        ('CDR page', {'jsonrpc': '2.0', 'id': 2, 'result': cdrs}),
+        ('float matrix', {'jsonrpc': '2.0', 'id': 3, 'result': matrix}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    codecs = [codec.get(name) for name in sorted(codec.CODECS)]
+    print '%-14s %-8s %10s %12s %12s' % (
+        'message', 'codec', 'bytes', 'encode us', 'decode us')
+    for name, message in messages():
+        for c in codecs:
+            data = c.dumps(message)
+            encode = min(timeit.repeat(
+                lambda: c.dumps(message), number=args.repeat, repeat=3))
+            decode = min(timeit.repeat(
+                lambda: c.loads(data), number=args.repeat, repeat=3))
+            print '%-14s %-8s %10d %12.1f %12.1f' % (
+                name, c.name, len(data),
+                encode / args.repeat * 1e6, decode / args.repeat * 1e6)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Receive and send throughput of txjason's BufferedNetstringReceiver against
+Twisted's NetstringReceiver, for frame sizes from 100 bytes to 8MB. Frames
+are fed to the receivers in 64KB chunks, like reads from a socket.
+
+    python benchmarks/bench_netstring.py [--chunk BYTES] [--total BYTES]
+"""
+import argparse
+import time
+
+from twisted.protocols.basic import NetstringReceiver
+
+from txjason.framing import BufferedNetstringReceiver
+
+
+SIZES = (100, 1000, 10000, 100000, 1000000, 8000000)
+
+
+class NullTransport(object):
+    disconnecting = False
+
+    def write(self, data):
+        pass
+
+    def writeSequence(self, data):
+        pass
+
+    def loseConnection(self):
+        raise RuntimeError('receiver dropped the connection')
+
+
+class StockReceiver(NetstringReceiver):
+    MAX_LENGTH = max(SIZES)
+
+    def stringReceived(self, string):
+        self.received += 1
+
+
+class BufferedReceiver(BufferedNetstringReceiver):
+    MAX_LENGTH = max(SIZES)
+
+    def stringReceived(self, string):
+        self.received += 1
+
+
+def receive(cls, chunks, frames):
+    proto = cls()
+    proto.received = 0
+    proto.makeConnection(NullTransport())
+    start = time.time()
+    for chunk in chunks:
+        proto.dataReceived(chunk)
+    elapsed = time.time() - start
+    assert proto.received == frames, (proto.received, frames)
+    return elapsed
+
+
+def send(cls, payload, frames):
+    proto = cls()
+    proto.makeConnection(NullTransport())
+    start = time.time()
+    for i in range(frames):
+        proto.sendString(payload)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--chunk', type=int, default=65536)
+    parser.add_argument('--total', type=int, default=32 * 1024 * 1024,
+                        help='approximate bytes to transfer per size')
+    args = parser.parse_args()
+
+    print '%10s %7s %-9s %12s %12s' % (
+        'frame', 'frames', 'receiver', 'recv MB/s', 'send MB/s')
+    for size in SIZES:
+        payload = 'x' * size
+        frames = max(1, args.total // size)
+        data = ('%d:%s,' % (size, payload)) * frames
+        chunks = [data[i:i + args.chunk]
+                  for i in range(0, len(data), args.chunk)]
+        mb = len(data) / 1e6
+        for name, cls in (('stock', StockReceiver),
+                          ('buffered', BufferedReceiver)):
+            recv = receive(cls, chunks, frames)
+            sent = send(cls, payload, frames)
+            print '%10d %7d %-9s %12.1f %12.1f' % (
+                size, frames, name, mb / recv, mb / sent)
+
+
+if __name__ == '__main__':
+    main()
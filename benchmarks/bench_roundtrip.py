@@ -0,0 +1,98 @@
+"""
+Round trips between JSONRPCClientFactory and JSONRPCServerFactory over
+loopback TCP and a UNIX socket in the same reactor: one caller at a time
+(latency) and 32 concurrent callers (throughput), with small and 64KB
+results, and calls answered with errors.
+
+    python benchmarks/bench_roundtrip.py [--count N]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+from twisted.internet import defer, endpoints, task
+
+from txjason import client, handler
+from txjason.netstring import JSONRPCClientFactory, JSONRPCServerFactory
+
+import harness
+
+
+CONCURRENCY = 32
+
+
+class Bench(handler.Handler):
+    @handler.exportRPC()
+    def echo(self, x):
+        return x
+
+    @handler.exportRPC()
+    def fail(self):
+        raise ValueError('fail')
+
+
+class _Quiet(object):
+    def report(self, method, failure):
+        pass
+
+
+def _ignoreError(failure):
+    failure.trap(client.JSONRPCClientError)
+
+
+@defer.inlineCallbacks
+def benchmarks(reactor, count, names=None):
+    factory = JSONRPCServerFactory()
+    factory.service.errorReporter = _Quiet()
+    factory.addHandler(Bench(), 'bench')
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'bench.sock')
+    tcp = reactor.listenTCP(0, factory, interface='127.0.0.1')
+    unix = reactor.listenUNIX(path, factory)
+    transports = [
+        ('tcp', endpoints.TCP4ClientEndpoint(
+            reactor, '127.0.0.1', tcp.getHost().port)),
+        ('unix', endpoints.UNIXClientEndpoint(reactor, path)),
+    ]
+    big = 'x' * 65536
+    results = []
+    try:
+        for transport, endpoint in transports:
+            clientFactory = JSONRPCClientFactory(endpoint, reactor=reactor)
+            cases = [
+                ('echo', lambda: clientFactory.callRemote('bench.echo', 1),
+                 count),
+                ('echo 64KB', lambda: clientFactory.callRemote(
+                    'bench.echo', big), count // 10),
+                ('error', lambda: clientFactory.callRemote(
+                    'bench.fail').addErrback(_ignoreError), count),
+            ]
+            for case, op, ops in cases:
+                for concurrency in (1, CONCURRENCY):
+                    name = '%s: %s x%d' % (transport, case, concurrency)
+                    if names is not None and not names(name):
+                        continue
+                    results.append((yield harness.measureAsync(
+                        name, op, max(ops, concurrency * 10),
+                        concurrency=concurrency)))
+            clientFactory.disconnect()
+    finally:
+        yield tcp.stopListening()
+        yield unix.stopListening()
+        shutil.rmtree(directory)
+    defer.returnValue(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--count', type=int, default=5000)
+    args = parser.parse_args()
+
+    def run(reactor):
+        return benchmarks(reactor, args.count).addCallback(harness.report)
+    task.react(run)
+
+
+if __name__ == '__main__':
+    main()
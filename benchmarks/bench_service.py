@@ -0,0 +1,97 @@
+"""
+Dispatch throughput of JSONRPCService.call, without any transport: single,
+batch and notification requests to synchronous and Deferred-returning
+methods, methods with and without type validation, and requests answered
+with errors.
+
+    python benchmarks/bench_service.py [--count N]
+"""
+import argparse
+import json
+
+from twisted.internet import defer
+
+from txjason import service
+
+import harness
+
+
+BATCH = 100
+
+
+def makeService():
+    svc = service.JSONRPCService()
+    svc.add(lambda a, b: a + b, name='sync')
+    svc.add(lambda a, b: defer.succeed(a + b), name='deferred')
+    svc.add(lambda a, b: a + b, name='typed', types=[int, int])
+    svc.add(lambda a, b: a + b, name='named', types={'a': int, 'b': int})
+
+    def fail(a, b):
+        raise ValueError(a)
+    svc.add(fail, name='fail')
+    return svc
+
+
+def request(method, params=(1, 2), id=1):
+    request = {'jsonrpc': '2.0', 'method': method, 'params': params}
+    if id is not None:
+        request['id'] = id
+    return request
+
+
+def cases():
+    """
+    Returns (name, payload) for each benchmarked request.
+    """
+    dumps = json.dumps
+    return [
+        ('single sync', dumps(request('sync', [1, 2]))),
+        ('single deferred', dumps(request('deferred', [1, 2]))),
+        ('notification sync', dumps(request('sync', [1, 2], None))),
+        ('notification deferred', dumps(request('deferred', [1, 2], None))),
+        ('batch %d sync' % BATCH, dumps(
+            [request('sync', [1, 2], i) for i in range(BATCH)])),
+        ('batch %d deferred' % BATCH, dumps(
+            [request('deferred', [1, 2], i) for i in range(BATCH)])),
+        ('validated positional', dumps(request('typed', [1, 2]))),
+        ('validated named', dumps(request('named', {'a': 1, 'b': 2}))),
+        ('error: method raises', dumps(request('fail', [1, 2]))),
+        ('error: method not found', dumps(request('missing', [1, 2]))),
+        ('error: invalid params', dumps(request('sync', [1, 2, 3]))),
+        ('error: wrong type', dumps(request('typed', ['1', 2]))),
+        ('error: parse', '{"jsonrpc": "2.0", "method"'),
+    ]
+
+
+class _Quiet(object):
+    """
+    Keeps the method exceptions of the error benchmarks out of the log, so
+    that the benchmark measures dispatch rather than log formatting.
+    """
+    def report(self, method, failure):
+        pass
+
+
+def benchmarks(count, names=None):
+    svc = makeService()
+    svc.errorReporter = _Quiet()
+    results = []
+    for name, payload in cases():
+        name = 'service: ' + name
+        if names is not None and not names(name):
+            continue
+        ops = count // BATCH if 'batch' in name else count
+        results.append(harness.measure(
+            name, lambda: svc.call(payload), max(ops, 10)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--count', type=int, default=20000)
+    args = parser.parse_args()
+    harness.report(benchmarks(args.count))
+
+
+if __name__ == '__main__':
+    main()
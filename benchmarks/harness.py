@@ -0,0 +1,197 @@
+"""
+Measurement, reporting and baseline comparison shared by the benchmarks run
+by run.py.
+
+Each benchmark runs an operation ``count`` times after ``warmup`` untimed
+runs and reports:
+
+- ops/s: operations per second over the timed runs;
+- p50, p90, p99 and max: latency of single operations in microseconds;
+- objs/op: GC-tracked objects (dicts, lists, Deferreds, ...) left allocated
+  per operation, measured with the collector disabled over a separate run.
+  Steady growth here is garbage the collector will have to clean up, or a
+  leak.
+- calls/op: Python function calls made by one synchronous operation. Unlike
+  the timings it does not depend on the machine or its load, so any growth
+  is a real change to the code path.
+"""
+import gc
+import json
+import sys
+import timeit
+
+from twisted.internet import defer
+
+
+clock = timeit.default_timer
+
+# Metrics compared against the baseline, and whether higher is better.
+COMPARED = (('ops', True), ('p50', False), ('calls', False))
+
+
+def percentile(sortedValues, p):
+    index = int(round(p / 100.0 * (len(sortedValues) - 1)))
+    return sortedValues[index]
+
+
+class Result(object):
+    def __init__(self, name, latencies, elapsed, objects, calls=None):
+        latencies = sorted(latencies)
+        self.name = name
+        self.count = len(latencies)
+        self.ops = self.count / elapsed
+        self.p50 = percentile(latencies, 50) * 1e6
+        self.p90 = percentile(latencies, 90) * 1e6
+        self.p99 = percentile(latencies, 99) * 1e6
+        self.max = latencies[-1] * 1e6
+        self.objects = objects
+        self.calls = calls
+
+    def toDict(self):
+        return {'ops': self.ops, 'p50': self.p50, 'p90': self.p90,
+                'p99': self.p99, 'max': self.max, 'objects': self.objects,
+                'calls': self.calls}
+
+
+def _checkSync(result, name):
+    if isinstance(result, defer.Deferred):
+        if not result.called:
+            raise RuntimeError('%s did not complete synchronously' % (name,))
+        result.addErrback(lambda f: None)
+
+
+def _objects(op, count):
+    gc.collect()
+    gc.disable()
+    try:
+        before = gc.get_count()[0]
+        for i in xrange(count):
+            op()
+        return float(gc.get_count()[0] - before) / count
+    finally:
+        gc.enable()
+
+
+def _calls(op, name):
+    calls = [0]
+
+    def profile(frame, event, arg):
+        if event == 'call':
+            calls[0] += 1
+    sys.setprofile(profile)
+    try:
+        result = op()
+    finally:
+        sys.setprofile(None)
+    _checkSync(result, name)
+    return calls[0]
+
+
+def measure(name, op, count, warmup=None):
+    """
+    Measures ``op``, which must complete synchronously (it may return a
+    Deferred that has already fired).
+    """
+    if warmup is None:
+        warmup = max(1, count // 10)
+    for i in xrange(warmup):
+        _checkSync(op(), name)
+    latencies = []
+    append = latencies.append
+    start = clock()
+    for i in xrange(count):
+        t = clock()
+        op()
+        append(clock() - t)
+    elapsed = clock() - start
+    return Result(name, latencies, elapsed,
+                  _objects(op, min(count, 1000)), _calls(op, name))
+
+
+@defer.inlineCallbacks
+def measureAsync(name, op, count, warmup=None, concurrency=1):
+    """
+    Measures ``op``, which returns a Deferred, with ``concurrency`` callers
+    each waiting for the previous operation before starting the next. Must
+    be called with the reactor running.
+    """
+    if warmup is None:
+        warmup = max(1, count // 10)
+    for i in xrange(warmup):
+        yield op()
+    latencies = []
+    perCaller = max(1, count // concurrency)
+
+    @defer.inlineCallbacks
+    def caller():
+        for i in xrange(perCaller):
+            t = clock()
+            yield op()
+            latencies.append(clock() - t)
+    start = clock()
+    yield defer.gatherResults([caller() for i in range(concurrency)],
+                              consumeErrors=True)
+    elapsed = clock() - start
+    gc.collect()
+    gc.disable()
+    try:
+        before = gc.get_count()[0]
+        objectCount = min(count, 1000)
+        for i in xrange(objectCount):
+            yield op()
+        objects = float(gc.get_count()[0] - before) / objectCount
+    finally:
+        gc.enable()
+    defer.returnValue(Result(name, latencies, elapsed, objects))
+
+
+def report(results, baseline=None):
+    print '%-36s %10s %8s %8s %8s %9s %8s %8s %8s' % (
+        'benchmark', 'ops/s', 'p50 us', 'p90 us', 'p99 us', 'max us',
+        'objs/op', 'calls/op', 'vs base')
+    for r in results:
+        change = ''
+        if baseline and r.name in baseline:
+            change = '%+.1f%%' % (
+                (r.ops / baseline[r.name]['ops'] - 1) * 100)
+        calls = '-' if r.calls is None else r.calls
+        print '%-36s %10.0f %8.1f %8.1f %8.1f %9.1f %8.2f %8s %8s' % (
+            r.name, r.ops, r.p50, r.p90, r.p99, r.max, r.objects, calls,
+            change)
+
+
+def loadBaseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def saveBaseline(path, results):
+    with open(path, 'w') as f:
+        json.dump(dict((r.name, r.toDict()) for r in results), f,
+                  indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns a description of each metric in COMPARED that is more than
+    ``threshold`` (a fraction) worse than in ``baseline``.
+    """
+    regressions = []
+    for r in results:
+        base = baseline.get(r.name)
+        if base is None:
+            continue
+        for metric, higherIsBetter in COMPARED:
+            value, old = getattr(r, metric), base.get(metric)
+            if value is None or old is None:
+                # Not measured for async benchmarks, or by older baselines.
+                continue
+            if higherIsBetter:
+                worse = value < old * (1 - threshold)
+            else:
+                worse = value > old * (1 + threshold)
+            if worse:
+                regressions.append('%s: %s %.1f, baseline %.1f' % (
+                    r.name, metric, value, old))
+    return regressions
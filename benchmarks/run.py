@@ -0,0 +1,77 @@
+"""
+Runs the service dispatch and round trip benchmarks and compares them with
+a stored baseline.
+
+    python benchmarks/run.py [--count N] [--filter TEXT] [--save]
+                             [--baseline PATH] [--threshold FRACTION]
+
+Results are printed with their change in ops/s from the baseline. With
+``--save`` they become the new baseline. Otherwise the run exits with status
+1 if any benchmark's ops/s dropped, or its p50 latency grew, by more than
+``--threshold`` (10% by default) compared to the baseline.
+
+Baselines depend on the machine, so record one on the machine that compares
+against it, e.g. before upgrading txjason:
+
+    python benchmarks/run.py --save
+    pip install -U txjason
+    python benchmarks/run.py
+"""
+import argparse
+import os
+
+from twisted.internet import defer, task
+
+import bench_roundtrip
+import bench_service
+import harness
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'baseline.json')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--count', type=int, default=20000,
+                        help='operations per benchmark (round trips run a '
+                        'quarter as many)')
+    parser.add_argument('--filter', action='append',
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save', action='store_true',
+                        help='save the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+
+    names = None
+    if args.filter:
+        names = lambda name: any(f in name for f in args.filter)
+    baseline = None
+    if not args.save and os.path.exists(args.baseline):
+        baseline = harness.loadBaseline(args.baseline)
+
+    @defer.inlineCallbacks
+    def run(reactor):
+        results = bench_service.benchmarks(args.count, names)
+        results.extend((yield bench_roundtrip.benchmarks(
+            reactor, args.count // 4, names)))
+        harness.report(results, baseline)
+        if args.save:
+            harness.saveBaseline(args.baseline, results)
+            print 'Saved baseline to %s' % (args.baseline,)
+        elif baseline is None:
+            print 'No baseline at %s; run with --save to record one.' % (
+                args.baseline,)
+        else:
+            regressions = harness.compare(results, baseline, args.threshold)
+            for regression in regressions:
+                print 'REGRESSION', regression
+            if regressions:
+                raise SystemExit(1)
+    task.react(run)
+
+
+if __name__ == '__main__':
+    main()
@@ -11,4 +11,9 @@ setup(
     install_requires=[
         'Twisted',
     ],
+    extras_require={
+        'msgpack': ['msgpack'],
+        'zstd': ['zstandard'],
+        'lz4': ['lz4'],
+    },
 )
@@ -0,0 +1,121 @@
+"""
+A blocking, thread-safe JSON-RPC client for code that does not run inside the
+Twisted reactor (e.g. Django views or worker threads).
+
+Calls are handed to a reactor running in a background thread and the calling
+thread blocks until the result arrives. Any number of threads may call
+concurrently; their requests are multiplexed over a pool of
+JSONRPCClientFactory connections, which keep their reconnection and timeout
+behaviour.
+
+Example:
+
+    from txjason.blocking import BlockingJSONRPCClient
+
+    client = BlockingJSONRPCClient('tcp:127.0.0.1:7080', poolSize=4)
+    print client.callRemote('main.echo', 'foo')
+    client.close()
+"""
+import threading
+
+from twisted.internet import endpoints, threads
+from twisted.python import threadable
+
+from txjason import netstring
+
+
+class ReactorThread(object):
+    """
+    Runs a reactor in a daemon thread, unless it is already running.
+    """
+    def __init__(self, reactor):
+        self.reactor = reactor
+        self.thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.thread is not None or self.reactor.running:
+                return
+            self.thread = threading.Thread(
+                target=self.reactor.run, name='txjason-reactor',
+                kwargs={'installSignalHandlers': False})
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        with self._lock:
+            if self.thread is None:
+                return
+            self.reactor.callFromThread(self.reactor.stop)
+            self.thread.join()
+            self.thread = None
+
+
+class BlockingJSONRPCClient(object):
+    """
+    A blocking facade over a JSONRPCClientPool.
+
+    ``endpoint`` is a client endpoint or an endpoint description string as
+    accepted by ``endpoints.clientFromString``. ``poolSize`` connections are
+    shared by all calling threads. ``timeout`` bounds each call, including
+    the time spent waiting for a connection, and may be overridden per call.
+    """
+    def __init__(self, endpoint, poolSize=1, timeout=5, reactor=None):
+        if reactor is None:
+            from twisted.internet import reactor
+        if isinstance(endpoint, basestring):
+            endpoint = endpoints.clientFromString(reactor, endpoint)
+        self.reactor = reactor
+        self.timeout = timeout
+        self.pool = netstring.JSONRPCClientPool(
+            netstring.JSONRPCClientFactory(
+                endpoint, timeout=timeout, reactor=reactor)
+            for i in range(poolSize))
+        self.reactorThread = ReactorThread(reactor)
+
+    def _blockingCall(self, f, *args, **kwargs):
+        if threadable.isInIOThread():
+            raise RuntimeError(
+                'BlockingJSONRPCClient cannot be used from the reactor thread')
+        self.reactorThread.start()
+        return threads.blockingCallFromThread(self.reactor, f, *args, **kwargs)
+
+    def _callRemote(self, method, args, kwargs, timeout):
+        d = self.pool.callRemote(method, timeout=timeout, *args, **kwargs)
+        # The client's own timeout only starts once connected.
+        timer = self.reactor.callLater(timeout, d.cancel)
+
+        def done(result):
+            if timer.active():
+                timer.cancel()
+            return result
+        return d.addBoth(done)
+
+    def callRemote(self, __method, *args, **kwargs):
+        """
+        Call a remote method and block until its result arrives. Error
+        responses raise JSONRPCClientError and timeouts raise
+        defer.CancelledError.
+        """
+        timeout = kwargs.pop('timeout', self.timeout)
+        return self._blockingCall(
+            self._callRemote, __method, args, kwargs, timeout)
+
+    def notifyRemote(self, __method, *args, **kwargs):
+        """
+        Send a notification, blocking until it has been written.
+        """
+        return self._blockingCall(
+            self.pool.notifyRemote, __method, *args, **kwargs)
+
+    def close(self):
+        """
+        Disconnect the pool and stop the reactor thread, if we started it.
+        """
+        if threadable.isInIOThread():
+            self.pool.disconnect()
+            return
+        if self.reactor.running:
+            threads.blockingCallFromThread(self.reactor, self.pool.disconnect)
+        self.reactorThread.stop()
@@ -1,5 +1,6 @@
-import json
 from twisted.internet import defer, reactor, error
+from txjason import codec as _codec, metrics as _metrics, stream as _stream, \
+    trace as _trace
 
 
 class JSONRPCClientError(Exception):
@@ -11,11 +12,47 @@ class JSONRPCProtocolError(Exception):
 
 
 class JSONRPCClient(object):
-    def __init__(self, timeout=5, reactor=reactor):
+    """
+    Builds JSON-RPC requests and matches responses to them.
+
+    Per method and endpoint request counts, latencies (from building the
+    request to receiving its response), error responses and timeouts are
+    recorded in ``metrics``, a MetricsRegistry.
+
+    With a ``tracer`` (a txjason.trace.Tracer), a sample of the requests
+    start a trace that the server adopts, and record a ``call`` span.
+    """
+    def __init__(self, timeout=5, reactor=reactor, metrics=None,
+                 endpoint=None, tracer=None):
         self.requests = {}
         self.id = 0
         self.timeout = timeout
         self.reactor = reactor
+        if metrics is None:
+            metrics = _metrics.MetricsRegistry()
+        self.metrics = metrics
+        self.endpoint = endpoint
+        self.tracer = tracer
+        self._sent = {}
+        # id -> (ChunkStream, timeout call, timeout) for streamed calls
+        self.streams = {}
+        # method -> callable for notifications sent by the server
+        self.notificationHandlers = {}
+        self._methodMetrics = {}
+        self._protocolErrors = metrics.counter(
+            'client_protocol_errors', endpoint=endpoint)
+
+    def _getMethodMetrics(self, method):
+        try:
+            return self._methodMetrics[method]
+        except KeyError:
+            labels = {'method': method, 'endpoint': self.endpoint}
+            m = self._methodMetrics[method] = (
+                self.metrics.counter('client_requests', **labels),
+                self.metrics.histogram('client_latency_seconds', **labels),
+                self.metrics.counter('client_error_responses', **labels),
+                self.metrics.counter('client_timeouts', **labels))
+            return m
 
     def _next_id(self):
         _id = self.id
@@ -29,10 +66,14 @@ class JSONRPCClient(object):
     def cancelRequests(self):
         for id, d in self.requests.items():
             d.cancel()
-            del self.requests[id]
+            self.requests.pop(id, None)
+        self._sent.clear()
 
     def getRequest(self, __method, *args, **kwargs):
         timeout = kwargs.pop('timeout', self.timeout)
+        codec = kwargs.pop('codec', _codec.JSON)
+        onCancel = kwargs.pop('onCancel', None)
+        stream = kwargs.pop('stream', None)
         if kwargs:
             raise TypeError('got extra keyword arguments', kwargs)
         def cancel(r, t):
@@ -42,23 +83,72 @@ class JSONRPCClient(object):
                 pass
             return r
         id = self._next_id()
-        payload = self._getPayload(__method, id, *args)
-        d = defer.Deferred()
+        trace = None
+        if self.tracer is not None and self.tracer.sample():
+            trace = {'traceId': _trace.newId(128), 'spanId': _trace.newId()}
+        payload = self._getPayload(__method, id, codec=codec,
+                                   stream=stream is not None, trace=trace,
+                                   *args)
+        canceller = None
+        if onCancel is not None:
+            def canceller(d):
+                # No response is expected once the server is told.
+                self.requests.pop(id, None)
+                self._sent.pop(id, None)
+                onCancel(id)
+        d = defer.Deferred(canceller)
         self.requests[id] = d
-        t = self.reactor.callLater(timeout, d.cancel)
+        metrics = self._getMethodMetrics(__method)
+        metrics[0].inc()
+        t = self.reactor.callLater(timeout, self._timedOut, d, metrics)
         d.addBoth(cancel, t)
+        self._sent[id] = self.reactor.seconds(), metrics
+        if stream is not None:
+            self.streams[id] = (stream, t, timeout)
+            d.addBoth(self._streamDone, id)
+        if trace is not None:
+            d.addBoth(self._traced, trace, __method, self.tracer.clock())
         return (payload, d)
 
-    def getNotification(self, __method, *args):
-        return self._getPayload(__method, None, *args)
+    def _streamDone(self, result, id):
+        self.streams.pop(id, None)
+        return result
+
+    def _traced(self, result, trace, method, start):
+        self.tracer.record(trace['traceId'], None, 'call', start,
+                           self.tracer.clock(), method, trace['spanId'])
+        return result
+
+    def _timedOut(self, d, metrics):
+        metrics[3].inc()
+        d.cancel()
+
+    def getNotification(self, __method, *args, **kwargs):
+        codec = kwargs.pop('codec', _codec.JSON)
+        if kwargs:
+            raise TypeError('got extra keyword arguments', kwargs)
+        return self._getPayload(__method, None, codec=codec, *args)
+
+    def handleResponse(self, payload, codec=_codec.JSON):
+        try:
+            self._handleResponse(payload, codec)
+        except JSONRPCProtocolError:
+            self._protocolErrors.inc()
+            raise
 
-    def handleResponse(self, payload):
+    def _handleResponse(self, payload, codec):
         try:
-            response = json.loads(payload)
+            response = codec.loads(payload)
         except ValueError:
-            raise JSONRPCProtocolError('server response is not valid json:\n%s' % payload)
+            raise JSONRPCProtocolError('server response is not valid %s:\n%s' % (codec.name, payload))
         if 'jsonrpc' not in response or response['jsonrpc'] != '2.0':
             raise JSONRPCProtocolError('not a valid jsonrpc response (no version):\n%s' % payload)
+        if response.get('method') == _stream.STREAM:
+            self._handleChunk(response.get('params'), payload)
+            return
+        if 'method' in response:
+            self._handleNotification(response['method'], response.get('params'))
+            return
         try:
             id = response['id']
         except KeyError:
@@ -67,15 +157,44 @@ class JSONRPCClient(object):
             deferred = self.requests[id]
         except KeyError:
             raise JSONRPCClientError('invalid id in response:\n%s' % payload)
+        sent, metrics = self._sent[id]
         if 'result' in response:
+            metrics[1].observe(self.reactor.seconds() - sent)
             deferred.callback(response['result'])
         elif 'error' in response:
+            metrics[1].observe(self.reactor.seconds() - sent)
+            metrics[2].inc()
             deferred.errback(JSONRPCClientError(response['error']))
         else:
             raise JSONRPCProtocolError('No result or error in response:\n%s' % payload)
         del self.requests[id]
+        del self._sent[id]
+
+    def _handleNotification(self, method, params):
+        f = self.notificationHandlers.get(method)
+        if f is None:
+            return
+        if isinstance(params, dict):
+            f(**params)
+        elif isinstance(params, list):
+            f(*params)
+        else:
+            f()
+
+    def _handleChunk(self, params, payload):
+        if not isinstance(params, list) or len(params) != 2:
+            raise JSONRPCProtocolError('not a valid stream chunk:\n%s' % payload)
+        try:
+            stream, timer, timeout = self.streams[params[0]]
+        except (KeyError, TypeError):
+            # The call was cancelled or has timed out.
+            return
+        if timer.active():
+            timer.reset(timeout)
+        stream._received(params[1])
 
-    def _getPayload(self, __method, id, *args):
+    def _getPayload(self, __method, id, *args, **kwargs):
+        codec = kwargs.get('codec', _codec.JSON)
         if len(args) == 1 and isinstance(args[0], dict):
             params = args[0]
         else:
@@ -86,4 +205,8 @@ class JSONRPCClient(object):
                    'params': params}
         if id:
             payload['id'] = id
-        return json.dumps(payload)
+        if kwargs.get('stream'):
+            payload[_stream.STREAM] = True
+        if kwargs.get('trace'):
+            payload[_trace.TRACE] = kwargs['trace']
+        return codec.dumps(payload)
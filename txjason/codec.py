@@ -0,0 +1,79 @@
+"""
+Wire formats for JSON-RPC messages.
+
+JSON is always available. MessagePack is used when the optional ``msgpack``
+package is installed and both ends of a connection agree to it: a client that
+prefers another codec sends a ``txjason.negotiate`` request as the first frame
+on a new connection, listing the codecs it accepts in order of preference.
+A server that understands the request answers (in JSON) with the codec it
+picked and both ends switch to it for every later frame; older servers answer
+with a Method not found error and the connection stays on JSON.
+"""
+import json
+
+
+NEGOTIATE = 'txjason.negotiate'
+
+
+class JSONCodec(object):
+    name = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj)
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class MsgpackCodec(object):
+    """
+    MessagePack serialization. Strings are packed as UTF-8 str and byte
+    strings as bin, so they round trip like they do through JSON.
+    """
+    name = 'msgpack'
+
+    def __init__(self):
+        import msgpack
+        self._packb = msgpack.packb
+        self._unpackb = msgpack.unpackb
+
+    def dumps(self, obj):
+        return self._packb(obj, use_bin_type=True)
+
+    def loads(self, data):
+        try:
+            return self._unpackb(data, raw=False)
+        except Exception as e:
+            # Match json.loads, which raises ValueError for bad input.
+            raise ValueError(str(e))
+
+
+JSON = JSONCodec()
+
+CODECS = {JSON.name: JSON}
+
+try:
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+except ImportError:
+    pass
+
+
+def get(name):
+    """
+    Returns the codec called ``name``, or None if it is not available.
+    """
+    return CODECS.get(name)
+
+
+def choose(offered, allowed=None):
+    """
+    Returns the first codec in ``offered`` (a list of codec names in the
+    peer's order of preference) that is available and in ``allowed`` (all
+    available codecs if None). Falls back to JSON.
+    """
+    for name in offered:
+        if allowed is not None and name not in allowed:
+            continue
+        if name in CODECS:
+            return CODECS[name]
+    return JSON
@@ -0,0 +1,114 @@
+"""
+Per-frame compression for netstring connections.
+
+Compression is negotiated together with the codec (see txjason.codec): the
+client lists the algorithms it accepts in order of preference and the server
+picks one. Once a connection has agreed on an algorithm every frame starts
+with a flag byte, RAW or COMPRESSED, and each side only compresses frames at
+or above its own size threshold, so small calls pay nothing but the flag.
+
+zlib is always available; zstd and lz4 are used when the ``zstandard`` and
+``lz4`` packages are installed. Every algorithm decompresses incrementally and
+stops as soon as a frame exceeds the receiver's maximum length, so a small
+frame cannot expand into an arbitrarily large string.
+"""
+import io
+import zlib
+
+
+RAW = '\x00'
+COMPRESSED = '\x01'
+
+
+class ZlibCompressor(object):
+    name = 'zlib'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data, maxLength):
+        d = zlib.decompressobj()
+        result = d.decompress(data, maxLength)
+        if d.unconsumed_tail:
+            raise ValueError('decompressed frame is too long')
+        return result
+
+
+class ZstdCompressor(object):
+    name = 'zstd'
+
+    def __init__(self, level=3):
+        import zstandard
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def decompress(self, data, maxLength):
+        # decompress() trusts the content size in the frame header, so read
+        # the output a bounded amount at a time instead.
+        reader = self._decompressor.stream_reader(io.BytesIO(data))
+        chunks = []
+        length = 0
+        while True:
+            chunk = reader.read(maxLength + 1 - length)
+            if not chunk:
+                return ''.join(chunks)
+            chunks.append(chunk)
+            length += len(chunk)
+            if length > maxLength:
+                raise ValueError('decompressed frame is too long')
+
+
+class LZ4Compressor(object):
+    name = 'lz4'
+
+    def __init__(self):
+        import lz4.frame
+        self._frame = lz4.frame
+
+    def compress(self, data):
+        return self._frame.compress(data)
+
+    def decompress(self, data, maxLength):
+        d = self._frame.LZ4FrameDecompressor()
+        result = d.decompress(data, maxLength + 1)
+        if len(result) > maxLength:
+            raise ValueError('decompressed frame is too long')
+        if not d.eof:
+            raise ValueError('truncated frame')
+        return result
+
+
+COMPRESSORS = {}
+
+for _cls in (ZlibCompressor, ZstdCompressor, LZ4Compressor):
+    try:
+        COMPRESSORS[_cls.name] = _cls()
+    except ImportError:
+        pass
+del _cls
+
+
+def get(name):
+    """
+    Returns the compressor called ``name``, or None if it is not available.
+    """
+    return COMPRESSORS.get(name)
+
+
+def choose(offered, allowed=None):
+    """
+    Returns the first compressor in ``offered`` that is available and in
+    ``allowed`` (all available compressors if None), or None.
+    """
+    for name in offered:
+        if allowed is not None and name not in allowed:
+            continue
+        if name in COMPRESSORS:
+            return COMPRESSORS[name]
+    return None
@@ -0,0 +1,165 @@
+"""
+Adaptive concurrency limiting for JSONRPCService.
+
+ConcurrencyLimiter is an interceptor that caps the number of requests in
+flight. Requests over the cap are answered straight away with an
+OverloadedError (-32095) and the method is not called. The cap is not fixed.
+After each request, a limit algorithm adjusts it from the observed latency:
+
+- GradientLimit (the default) compares each request's latency with a
+  long-term average. It grows the limit while latency stays near the average
+  and shrinks it when latency rises, which is the sign that requests are
+  queueing.
+- AIMDLimit adds one after each request that finished in time while the
+  limit was in use. It multiplies the limit by ``backoff`` after a timeout,
+  a cancellation, or a request slower than ``timeout`` seconds.
+
+By default a single limit covers the whole service. Pass ``key=byMethod``
+(from txjason.ratelimit) or another function of the request for separate
+limits:
+
+    limiter = ConcurrencyLimiter(metrics=factory.service.metrics)
+    factory.service.addInterceptor(limiter)
+    limiter.limits()    # -> {None: 20}
+"""
+import math
+
+from twisted.internet import defer
+from twisted.python import failure
+
+from txjason import interceptor, service
+
+
+class GradientLimit(object):
+    """
+    Moves the limit towards ``limit * gradient + sqrt(limit)``. The gradient
+    is the long-term average latency, times ``tolerance``, divided by the
+    latest latency. It is clamped to [0.5, 1], and the move is smoothed by
+    ``smoothing``. The limit is kept as a float so that small steps add up.
+    """
+    def __init__(self, initial=20, minLimit=1, maxLimit=1000, smoothing=0.2,
+                 tolerance=1.5, window=600, warmup=10):
+        self.limit = initial
+        self.minLimit = minLimit
+        self.maxLimit = maxLimit
+        self.smoothing = smoothing
+        self.tolerance = tolerance
+        self.warmup = warmup
+        self._alpha = 2.0 / (window + 1)
+        self._samples = 0
+        self.longRtt = 0.0
+
+    def update(self, rtt, inflight, dropped):
+        if rtt <= 0:
+            return
+        self._samples += 1
+        if self._samples <= self.warmup:
+            self.longRtt += (rtt - self.longRtt) / self._samples
+        else:
+            self.longRtt += (rtt - self.longRtt) * self._alpha
+        if self.longRtt / rtt > 2:
+            # Latency has dropped a lot; let the average catch up quickly.
+            self.longRtt *= 0.95
+        if inflight < self.limit / 2.0:
+            # Too little traffic to learn anything about the limit.
+            return
+        gradient = max(0.5, min(1.0, self.tolerance * self.longRtt / rtt))
+        target = self.limit * gradient + math.sqrt(self.limit)
+        limit = self.limit * (1 - self.smoothing) + target * self.smoothing
+        self.limit = max(self.minLimit, min(self.maxLimit, limit))
+
+
+class AIMDLimit(object):
+    """
+    Additive increase, multiplicative decrease.
+    """
+    def __init__(self, initial=20, minLimit=1, maxLimit=1000, backoff=0.9,
+                 timeout=None):
+        self.limit = initial
+        self.minLimit = minLimit
+        self.maxLimit = maxLimit
+        self.backoff = backoff
+        self.timeout = timeout
+
+    def update(self, rtt, inflight, dropped):
+        if dropped or (self.timeout is not None and rtt > self.timeout):
+            self.limit = max(self.minLimit, int(self.limit * self.backoff))
+        elif inflight * 2 >= self.limit:
+            self.limit = min(self.maxLimit, self.limit + 1)
+
+
+class _State(object):
+    __slots__ = ('limit', 'inflight', 'gauge')
+
+    def __init__(self, limit, gauge):
+        self.limit = limit
+        self.inflight = 0
+        self.gauge = gauge
+
+
+class ConcurrencyLimiter(interceptor.Interceptor):
+    """
+    Limits the requests in flight for each key, using a limit algorithm
+    created by calling ``limit``. ``key`` is None for one limit covering the
+    whole service. With ``methods``, only requests for those methods are
+    limited.
+
+    With ``metrics``, each key's limit is reported in the
+    ``concurrency_limit`` gauge and rejections are counted in
+    ``concurrency_rejected``.
+    """
+    def __init__(self, limit=GradientLimit, key=None, methods=None,
+                 metrics=None, reactor=None):
+        if reactor is None:
+            from twisted.internet import reactor
+        self.limitFactory = limit
+        self.key = key
+        self.methods = frozenset(methods) if methods is not None else None
+        self.metrics = metrics
+        self.reactor = reactor
+        self._states = {}
+        if metrics is not None:
+            self._rejected = metrics.counter('concurrency_rejected')
+
+    def limits(self):
+        """
+        Returns a dict of the current limit for each key.
+        """
+        return dict(
+            (key, state.limit.limit) for key, state in self._states.items())
+
+    def _getState(self, key):
+        state = self._states.get(key)
+        if state is None:
+            gauge = None
+            if self.metrics is not None:
+                gauge = self.metrics.gauge(
+                    'concurrency_limit', key='' if key is None else str(key))
+            state = self._states[key] = _State(self.limitFactory(), gauge)
+            if gauge is not None:
+                gauge.set(state.limit.limit)
+        return state
+
+    def aroundCall(self, request, proceed):
+        if self.methods is not None and request['method'] not in self.methods:
+            return proceed(request)
+        key = self.key(request) if self.key is not None else None
+        state = self._getState(key)
+        if state.inflight >= state.limit.limit:
+            if self.metrics is not None:
+                self._rejected.inc()
+            raise service.OverloadedError()
+        state.inflight += 1
+        start = self.reactor.seconds()
+
+        def done(result):
+            inflight = state.inflight
+            state.inflight -= 1
+            dropped = (isinstance(result, failure.Failure) and
+                       result.check(defer.CancelledError) is not None)
+            state.limit.update(self.reactor.seconds() - start, inflight,
+                               dropped)
+            if state.gauge is not None:
+                state.gauge.set(state.limit.limit)
+            return result
+        return proceed(request).addBoth(done)
@@ -0,0 +1,138 @@
+"""
+Batching of backend lookups made by concurrent requests.
+
+A handler that looks up one key per call issues one backend query per
+request. A DataLoader collects the keys asked for during a reactor turn (or
+a longer ``window``), calls ``batchLoad`` once with all of them and hands each
+caller its value. A key asked for twice is loaded once, and values stay
+cached until the reactor turn after they were loaded:
+
+    class Users(handler.Handler):
+        def __init__(self, db):
+            self.users = DataLoader(db.getUsers)
+
+        @handler.exportRPC()
+        def name(self, id):
+            return self.users.load(id).addCallback(lambda user: user['name'])
+
+``batchLoad`` is called with a list of keys and returns (or returns a
+Deferred firing with) either a list of values in the same order or a dict
+of key to value; keys missing from a dict fail with KeyError.
+
+DataLoaders found on a Handler use the service's reactor once the handler is
+added to it; ``JSONRPCService.dataLoader`` creates one bound to the service.
+"""
+import collections
+
+from twisted.internet import defer
+from twisted.python import failure
+
+
+class DataLoader(object):
+    def __init__(self, batchLoad, window=0, maxBatchSize=None, cache=True,
+                 reactor=None):
+        self.batchLoad = batchLoad
+        self.window = window
+        self.maxBatchSize = maxBatchSize
+        self.cache = cache
+        self.reactor = reactor
+        # key -> Deferreds waiting for the next batch
+        self._queue = collections.OrderedDict()
+        # key -> Deferreds waiting for a batch being loaded
+        self._loading = {}
+        # key -> value or Failure, until the next reactor turn
+        self._cache = {}
+        self._call = None
+        self._clearCall = None
+
+    def _getReactor(self):
+        if self.reactor is None:
+            from twisted.internet import reactor
+            self.reactor = reactor
+        return self.reactor
+
+    def load(self, key):
+        """
+        Returns a Deferred that fires with the value for ``key``.
+        """
+        if key in self._cache:
+            result = self._cache[key]
+            if isinstance(result, failure.Failure):
+                return defer.fail(result)
+            return defer.succeed(result)
+        d = defer.Deferred()
+        waiting = self._loading.get(key)
+        if waiting is not None:
+            waiting.append(d)
+            return d
+        self._queue.setdefault(key, []).append(d)
+        if self._call is None:
+            self._call = self._getReactor().callLater(
+                self.window, self._dispatch)
+        return d
+
+    def loadMany(self, keys):
+        """
+        Returns a Deferred that fires with the list of values for ``keys``.
+        """
+        return defer.gatherResults(
+            [self.load(key) for key in keys], consumeErrors=True)
+
+    def clear(self, key=None):
+        """
+        Forgets the cached value for ``key``, or every cached value.
+        """
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(key, None)
+
+    def _dispatch(self):
+        self._call = None
+        queue, self._queue = self._queue, collections.OrderedDict()
+        self._loading.update(queue)
+        keys = list(queue)
+        size = self.maxBatchSize or len(keys)
+        for i in range(0, len(keys), size):
+            batch = keys[i:i + size]
+            d = defer.maybeDeferred(self.batchLoad, batch)
+            d.addCallback(self._loaded, batch)
+            d.addErrback(self._failed, batch)
+
+    def _loaded(self, values, keys):
+        if isinstance(values, dict):
+            for key in keys:
+                if key in values:
+                    self._deliver(key, values[key])
+                else:
+                    self._deliver(key, failure.Failure(KeyError(key)))
+        elif len(values) != len(keys):
+            self._failed(failure.Failure(ValueError(
+                'batchLoad returned %d values for %d keys' % (
+                    len(values), len(keys)))), keys)
+        else:
+            for key, value in zip(keys, values):
+                self._deliver(key, value)
+
+    def _failed(self, reason, keys):
+        for key in keys:
+            self._deliver(key, reason)
+
+    def _deliver(self, key, result):
+        waiting = self._loading.pop(key, None)
+        if waiting is None:
+            return
+        if self.cache:
+            self._cache[key] = result
+            if self._clearCall is None:
+                self._clearCall = self._getReactor().callLater(
+                    0, self._clearCache)
+        for d in waiting:
+            if isinstance(result, failure.Failure):
+                d.errback(result)
+            else:
+                d.callback(result)
+
+    def _clearCache(self):
+        self._clearCall = None
+        self._cache.clear()
@@ -0,0 +1,87 @@
+"""
+Reporting of exceptions raised by RPC methods.
+
+JSONRPCService hands each exception raised by a method (answered with a
+ServerError) to its ``errorReporter``. The default ErrorReporter logs every
+one with its traceback. When a backend breaks and every request fails the
+same way, formatting and writing those tracebacks can take longer than the
+requests themselves; SampledErrorReporter groups exceptions by method,
+exception type and the line that raised them, logs the first
+``tracebacks`` of each group per ``interval`` seconds in full, and then only
+logs how many more there were at the end of the interval:
+
+    factory = JSONRPCServerFactory(
+        errorReporter=SampledErrorReporter(tracebacks=5, interval=60))
+
+Any object with a ``report(method, failure)`` method can be used instead,
+e.g. to send errors to an external service.
+"""
+from twisted.python import log
+
+
+class ErrorReporter(object):
+    """
+    Logs every exception with its traceback.
+    """
+    def report(self, method, failure):
+        log.msg('Exception raised while invoking RPC method "{}".'.format(
+                method))
+        log.err(failure)
+
+
+def errorKey(method, failure):
+    """
+    Returns the group of an exception: the method, the exception's type and
+    the file and line that raised it.
+    """
+    location = None
+    if failure.frames:
+        frame = failure.frames[-1]
+        location = '%s:%d' % (frame[1], frame[2])
+    return method, failure.type, location
+
+
+class SampledErrorReporter(ErrorReporter):
+    """
+    Logs the first ``tracebacks`` exceptions of each group per ``interval``
+    seconds, and counts the others.
+    """
+    def __init__(self, tracebacks=5, interval=60, reactor=None):
+        if reactor is None:
+            from twisted.internet import reactor
+        self.tracebacks = tracebacks
+        self.interval = interval
+        self.reactor = reactor
+        # group -> exceptions seen during the current interval
+        self.counts = {}
+        self._call = None
+
+    def report(self, method, failure):
+        key = errorKey(method, failure)
+        count = self.counts.get(key, 0) + 1
+        self.counts[key] = count
+        if count <= self.tracebacks:
+            ErrorReporter.report(self, method, failure)
+        if self._call is None:
+            self._call = self.reactor.callLater(self.interval, self.flush)
+
+    def flush(self):
+        """
+        Logs how many exceptions of each group were not logged, and starts a
+        new interval.
+        """
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+        counts, self.counts = self.counts, {}
+        for (method, type_, location), count in sorted(counts.items()):
+            suppressed = count - self.tracebacks
+            if suppressed > 0:
+                log.msg('{} more {} exceptions raised by RPC method "{}" at '
+                        '{} in the last {}s.'.format(
+                            suppressed, _typeName(type_), method, location,
+                            self.interval))
+
+
+def _typeName(type_):
+    return getattr(type_, '__name__', str(type_))
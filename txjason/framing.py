@@ -0,0 +1,123 @@
+"""
+Netstring framing with fewer copies than twisted.protocols.basic's
+NetstringReceiver.
+
+Incoming data is appended to a bytearray that grows geometrically and is
+only compacted when it has to grow, so a large frame arriving in many chunks
+is copied into the buffer once. Each complete payload is copied out of the
+buffer once, through a memoryview, into the string handed to
+``stringReceived``. The stock receiver instead re-slices its buffer for each
+chunk and copies the payload again when it is done. Outgoing frames are
+written as header, payload and trailer with ``writeSequence``, so the payload
+is not concatenated into a new string.
+"""
+from twisted.internet import protocol
+
+
+class BufferedNetstringReceiver(protocol.Protocol):
+    """
+    A drop-in replacement for NetstringReceiver: override ``stringReceived``
+    and call ``sendString``. Frames longer than ``MAX_LENGTH`` call
+    ``lengthLimitExceeded``, and malformed frames set ``brokenPeer`` and drop
+    the connection with ``loseConnection``.
+    """
+    MAX_LENGTH = 99999
+    brokenPeer = 0
+
+    initialBufferSize = 16384
+    # Buffers larger than this are released once they are empty, rather than
+    # kept for the lifetime of the connection.
+    maxIdleBufferSize = 1024 * 1024
+
+    _buffer = None
+    _start = 0
+    _end = 0
+
+    def stringReceived(self, string):
+        raise NotImplementedError()
+
+    def lengthLimitExceeded(self, length):
+        self.loseConnection()
+
+    def _parseError(self):
+        self.brokenPeer = 1
+        self.loseConnection()
+
+    def loseConnection(self):
+        """
+        Drops the connection after a framing error.
+        """
+        self.transport.loseConnection()
+
+    def sendString(self, string):
+        self.transport.writeSequence((str(len(string)), ':', string, ','))
+
+    def sendStrings(self, strings):
+        """
+        Sends the concatenation of ``strings`` as one netstring, without
+        concatenating them.
+        """
+        length = sum(len(s) for s in strings)
+        self.transport.writeSequence(
+            [str(length), ':'] + list(strings) + [','])
+
+    def _append(self, data):
+        buf = self._buffer
+        start, end = self._start, self._end
+        needed = end + len(data)
+        if buf is None:
+            buf = self._buffer = bytearray(
+                max(self.initialBufferSize, len(data)))
+        elif needed > len(buf):
+            used = end - start
+            size = len(buf)
+            while used + len(data) > size:
+                size *= 2
+            if size == len(buf):
+                buf[:used] = buf[start:end]
+            else:
+                grown = bytearray(size)
+                grown[:used] = buf[start:end]
+                buf = self._buffer = grown
+            start, end = 0, used
+        buf[end:end + len(data)] = data
+        self._start, self._end = start, end + len(data)
+
+    def dataReceived(self, data):
+        if self.brokenPeer:
+            return
+        self._append(data)
+        buf = self._buffer
+        view = None
+        while self._start < self._end and not self.brokenPeer:
+            start, end = self._start, self._end
+            colon = buf.find(b':', start, end)
+            if colon == -1:
+                if end - start > len(str(self.MAX_LENGTH)):
+                    self._parseError()
+                break
+            header = buf[start:colon]
+            if not header.isdigit() or (header[0] == 48 and len(header) > 1):
+                self._parseError()
+                break
+            length = int(header)
+            if length > self.MAX_LENGTH:
+                self.lengthLimitExceeded(length)
+                self.brokenPeer = 1
+                break
+            trailer = colon + 1 + length
+            if trailer >= end:
+                break
+            if buf[trailer] != 44:  # ','
+                self._parseError()
+                break
+            if view is None:
+                view = memoryview(buf)
+            self._start = trailer + 1
+            self.stringReceived(view[colon + 1:trailer].tobytes())
+        del view
+        if self._start == self._end:
+            self._start = self._end = 0
+            if self._buffer is not None and \
+                    len(self._buffer) > self.maxIdleBufferSize:
+                self._buffer = None
@@ -1,22 +1,30 @@
 import collections
 import inspect
 
+from txjason import dataloader
+
 
 class exportRPC(object):
     """
     Decorator to indicate a method should be exported via RPC.
     To export with the method's name, use as @exportRPC().
     Optionally, provde an argument to indicate the name to export as:
-    @exportRPC("foo").
+    @exportRPC("foo"), and a scheduling priority (see txjason.scheduler):
+    @exportRPC(priority=scheduler.CONTROL). Methods that return an iterator
+    of chunks to stream (see txjason.stream) use @exportRPC(stream=True).
     """
-    def __init__(self, name=None):
+    def __init__(self, name=None, priority=0, stream=False):
         self.name=name
+        self.priority = priority
+        self.stream = stream
 
     def __call__(self, f):
         if self.name:
             f.export_rpc = self.name
         else:
             f.export_rpc = f.__name__
+        f.export_priority = self.priority
+        f.export_stream = self.stream
         return f
 
 
@@ -44,16 +52,24 @@ class Handler(object):
     def addToService(self, service, namespace=None, seperator='.'):
         """
         Add this Handler's exported methods to an RPC Service instance.
+        DataLoaders created without a reactor use the service's.
         """
         if namespace is None:
             namespace = []
         if isinstance(namespace, basestring):
             namespace = [namespace]
 
+        for value in vars(self).values():
+            if isinstance(value, dataloader.DataLoader) and \
+                    value.reactor is None:
+                value.reactor = service.reactor
+
         for n, m in inspect.getmembers(self, inspect.ismethod):
             if hasattr(m, 'export_rpc'):
                 try:
                     name = seperator.join(namespace + m.export_rpc)
                 except TypeError:
                     name = seperator.join(namespace + [m.export_rpc])
-                service.add(m, name)
+                service.add(m, name,
+                            priority=getattr(m, 'export_priority', 0),
+                            stream=getattr(m, 'export_stream', False))
@@ -0,0 +1,78 @@
+"""
+Interceptors hook into JSONRPCService dispatch without subclassing it.
+
+Subclass Interceptor and override any of its hooks:
+
+- ``beforeParse(data)`` gets each raw incoming frame and returns the data to
+  decode (possibly the same).
+- ``afterParse(request)`` gets each parsed request (a dict with ``jsonrpc``,
+  ``id``, ``method`` and ``params``) before it is dispatched.
+- ``aroundCall(request, proceed)`` wraps the method invocation; it must return
+  ``proceed(request)`` (a Deferred), something derived from it, or its own
+  result to skip the method.
+- ``beforeSerialize(response)`` gets each response (a dict, or a list for
+  batches) and returns the response to encode.
+
+Any hook may raise a JSONRPCError to answer with that error. Then:
+
+    factory.service.addInterceptor(AuthInterceptor())
+
+The service compiles its interceptors into flat tuples of the hooks they
+actually override, and a single chain of closures for ``aroundCall``, each
+time one is added. A service without interceptors calls its methods exactly
+as before, and each interceptor costs one function call per hook it
+overrides.
+"""
+
+
+class Interceptor(object):
+    """
+    Base class for interceptors. Hooks that are not overridden are left out
+    of the compiled chain.
+    """
+    def beforeParse(self, data):
+        return data
+
+    def afterParse(self, request):
+        pass
+
+    def aroundCall(self, request, proceed):
+        return proceed(request)
+
+    def beforeSerialize(self, response):
+        return response
+
+
+HOOKS = ('beforeParse', 'afterParse', 'aroundCall', 'beforeSerialize')
+
+
+def _function(method):
+    return getattr(method, '__func__', method)
+
+
+def hooks(interceptors, name):
+    """
+    Returns a tuple of the bound ``name`` hooks of ``interceptors`` that
+    override Interceptor's default.
+    """
+    default = _function(getattr(Interceptor, name))
+    return tuple(
+        getattr(i, name) for i in interceptors
+        if getattr(i, name, None) is not None
+        and _function(getattr(type(i), name, None)) is not default)
+
+
+def chain(hooks, call):
+    """
+    Returns a callable taking a request that runs each ``aroundCall`` hook in
+    ``hooks``, outermost first, around ``call``.
+    """
+    for hook in reversed(hooks):
+        call = _link(hook, call)
+    return call
+
+
+def _link(hook, proceed):
+    def call(request):
+        return hook(request, proceed)
+    return call
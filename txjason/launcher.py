@@ -0,0 +1,350 @@
+"""
+Run a JSON-RPC server factory in several worker processes.
+
+Each worker is a separate Python process that builds its own server factory
+(from the same import path, so every worker has the same handlers) and
+accepts connections on a shared port, either through its own SO_REUSEPORT
+socket or through a listening socket created by the launcher and inherited by
+every worker.
+
+Stopping the launcher (SIGTERM, SIGINT or reactor.stop) stops every worker
+gracefully: each one closes its listening socket, calls
+``JSONRPCService.stopServing`` and exits once its pending requests are done
+(or ``shutdownTimeout`` seconds have passed).
+
+Each worker also serves ``txjason.stats`` on a UNIX socket in
+``statsDirectory``; ``collectStats`` queries every worker and merges their
+metrics.
+
+From the command line:
+
+    python -m txjason.launcher run --factory myapp.rpc.makeFactory \\
+        --port 7080 --workers 4 --stats-dir /var/run/myapp
+    python -m txjason.launcher stats --stats-dir /var/run/myapp
+
+or from Python:
+
+    launcher = Launcher('myapp.rpc.makeFactory', 7080, workers=4)
+    launcher.start()
+    reactor.run()
+
+``myapp.rpc.makeFactory`` may name a server factory instance or a callable
+returning one.
+"""
+import copy
+import glob
+import os
+import socket
+import sys
+
+from twisted.internet import defer, endpoints, protocol, task
+from twisted.python import log, reflect, usage
+
+from txjason import handler, netstring
+
+
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15)
+
+
+def _family(interface):
+    return socket.AF_INET6 if ':' in interface else socket.AF_INET
+
+
+def listeningSocket(port, interface='', reusePort=False, backlog=50):
+    """
+    Returns a non-blocking listening TCP socket, optionally with SO_REUSEPORT
+    set so that several processes can listen on the same port.
+    """
+    sock = socket.socket(_family(interface), socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reusePort:
+        sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+    sock.bind((interface, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+def loadFactory(name):
+    """
+    Returns the server factory named by ``name``, calling it if it is a
+    callable rather than a factory.
+    """
+    obj = reflect.namedAny(name)
+    if not hasattr(obj, 'buildProtocol'):
+        obj = obj()
+    return obj
+
+
+def statsPath(directory, index):
+    return os.path.join(directory, 'worker-%d.sock' % (index,))
+
+
+class StatsHandler(handler.Handler):
+    """
+    Exports a worker's metrics as ``txjason.stats``.
+    """
+    def __init__(self, factory, index):
+        self.factory = factory
+        self.index = index
+
+    @handler.exportRPC('txjason.stats')
+    def stats(self):
+        return {'worker': self.index,
+                'pid': os.getpid(),
+                'metrics': self.factory.service.metrics.snapshot()}
+
+
+class Worker(object):
+    """
+    Serves a factory in the current process; the body of a worker process.
+    """
+    def __init__(self, reactor, factory, index, shutdownTimeout=30):
+        self.reactor = reactor
+        self.factory = factory
+        self.index = index
+        self.shutdownTimeout = shutdownTimeout
+        self.ports = []
+
+    def listen(self, port=None, interface='', fd=None, statsDirectory=None):
+        if fd is None:
+            sock = listeningSocket(port, interface, reusePort=True)
+            fd = sock.fileno()
+        else:
+            # The inherited socket was opened for the same interface.
+            sock = socket.fromfd(fd, _family(interface), socket.SOCK_STREAM)
+            os.close(fd)
+        self.ports.append(self.reactor.adoptStreamPort(
+            sock.fileno(), sock.family, self.factory))
+        sock.close()
+        if statsDirectory is not None:
+            statsFactory = netstring.JSONRPCServerFactory()
+            statsFactory.addHandler(StatsHandler(self.factory, self.index))
+            path = statsPath(statsDirectory, self.index)
+            if os.path.exists(path):
+                os.unlink(path)
+            self.ports.append(self.reactor.listenUNIX(path, statsFactory))
+        self.reactor.addSystemEventTrigger('before', 'shutdown', self.stop)
+
+    def stop(self):
+        """
+        Stop accepting connections and wait for pending requests, cancelling
+        any that are still running after ``shutdownTimeout`` seconds.
+        """
+        service = self.factory.service
+        stopped = service.stopServing()
+        timer = self.reactor.callLater(
+            self.shutdownTimeout, service.cancelPending)
+        stopped.addBoth(
+            lambda ign: timer.active() and timer.cancel())
+        ports, self.ports = self.ports, []
+        return defer.gatherResults(
+            [stopped] + [defer.maybeDeferred(p.stopListening) for p in ports])
+
+
+class _WorkerProcess(protocol.ProcessProtocol):
+    def __init__(self, index):
+        self.index = index
+        self.ended = defer.Deferred()
+
+    def errReceived(self, data):
+        sys.stderr.write(data)
+
+    def outReceived(self, data):
+        sys.stdout.write(data)
+
+    def processEnded(self, reason):
+        log.msg('txjason worker %d exited: %s' % (
+            self.index, reason.getErrorMessage()))
+        self.ended.callback(None)
+
+
+class Launcher(object):
+    """
+    Starts ``workers`` worker processes serving the factory named by
+    ``factory`` on ``port``.
+
+    With ``shareSocket`` the launcher opens the listening socket itself and
+    every worker inherits it; otherwise each worker opens its own socket with
+    SO_REUSEPORT and the kernel balances connections between them.
+    """
+    def __init__(self, factory, port, workers=None, interface='',
+                 shareSocket=False, statsDirectory=None, shutdownTimeout=30,
+                 reactor=None):
+        if reactor is None:
+            from twisted.internet import reactor
+        if workers is None:
+            import multiprocessing
+            workers = multiprocessing.cpu_count()
+        self.factory = factory
+        self.port = port
+        self.workers = workers
+        self.interface = interface
+        self.shareSocket = shareSocket
+        self.statsDirectory = statsDirectory
+        self.shutdownTimeout = shutdownTimeout
+        self.reactor = reactor
+        self.processes = []
+        self.socket = None
+        self._trigger = None
+
+    def _workerArgs(self, index):
+        args = [sys.executable, '-m', 'txjason.launcher', 'worker',
+                '--factory', self.factory, '--index', str(index),
+                '--shutdown-timeout', str(self.shutdownTimeout)]
+        if self.socket is not None:
+            args += ['--fd', '3']
+        else:
+            args += ['--port', str(self.port)]
+        args += ['--interface', self.interface]
+        if self.statsDirectory is not None:
+            args += ['--stats-dir', self.statsDirectory]
+        return args
+
+    def start(self):
+        if self.shareSocket:
+            self.socket = listeningSocket(self.port, self.interface)
+            self.port = self.socket.getsockname()[1]
+        childFDs = {0: 'w', 1: 'r', 2: 'r'}
+        if self.socket is not None:
+            childFDs[3] = self.socket.fileno()
+        env = copy.copy(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(sys.path)
+        for index in range(self.workers):
+            proc = _WorkerProcess(index)
+            proc.transport = self.reactor.spawnProcess(
+                proc, sys.executable, self._workerArgs(index), env=env,
+                childFDs=childFDs)
+            self.processes.append(proc)
+        self._trigger = self.reactor.addSystemEventTrigger(
+            'before', 'shutdown', self.stop)
+
+    def stop(self):
+        """
+        Ask every worker to shut down gracefully and return a Deferred that
+        fires once they have all exited.
+        """
+        if self._trigger is not None:
+            self.reactor.removeSystemEventTrigger(self._trigger)
+            self._trigger = None
+        for proc in self.processes:
+            try:
+                proc.transport.signalProcess('TERM')
+            except Exception:
+                pass
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+        return defer.gatherResults([p.ended for p in self.processes])
+
+
+def mergeSnapshots(snapshots):
+    """
+    Merges MetricsRegistry snapshots (e.g. from several workers) by summing
+    metrics with the same name and labels.
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for entry in snapshot:
+            key = (entry['name'], tuple(sorted(entry['labels'].items())))
+            if key not in merged:
+                merged[key] = copy.deepcopy(entry)
+                continue
+            total = merged[key]
+            if entry['type'] == 'histogram':
+                total['count'] += entry['count']
+                total['sum'] += entry['sum']
+                total['counts'] = [
+                    a + b for a, b in zip(total['counts'], entry['counts'])]
+            else:
+                total['value'] += entry['value']
+    return [merged[key] for key in sorted(merged)]
+
+
+@defer.inlineCallbacks
+def collectStats(reactor, statsDirectory, timeout=5):
+    """
+    Queries every worker's stats socket in ``statsDirectory``. Returns a
+    Deferred firing with a dict of the per-worker results and the merged
+    metrics.
+    """
+    paths = sorted(glob.glob(os.path.join(statsDirectory, 'worker-*.sock')))
+    clients = [
+        netstring.JSONRPCClientFactory(
+            endpoints.UNIXClientEndpoint(reactor, path),
+            timeout=timeout, reactor=reactor)
+        for path in paths]
+    results = yield defer.DeferredList(
+        [c.callRemote('txjason.stats') for c in clients])
+    for c in clients:
+        c.disconnect()
+    workers = [r for ok, r in results if ok]
+    defer.returnValue({
+        'workers': workers,
+        'metrics': mergeSnapshots([w['metrics'] for w in workers])})
+
+
+class _RunOptions(usage.Options):
+    optParameters = [
+        ['factory', 'f', None, 'Import path of the server factory.'],
+        ['port', 'p', 7080, 'Port to listen on.', int],
+        ['interface', 'i', '', 'Interface to listen on.'],
+        ['workers', 'w', None, 'Number of workers (default: CPU count).',
+         int],
+        ['stats-dir', None, None, 'Directory for worker stats sockets.'],
+        ['shutdown-timeout', None, 30, 'Seconds to wait for pending requests '
+         'on shutdown.', float],
+    ]
+    optFlags = [
+        ['share-socket', None, 'Share one inherited listening socket '
+         'instead of using SO_REUSEPORT.'],
+    ]
+
+
+class _WorkerOptions(_RunOptions):
+    optParameters = [
+        ['index', None, 0, 'Worker number.', int],
+        ['fd', None, None, 'Inherited listening socket.', int],
+    ]
+
+
+class _StatsOptions(usage.Options):
+    optParameters = [
+        ['stats-dir', None, None, 'Directory for worker stats sockets.'],
+    ]
+
+
+class Options(usage.Options):
+    subCommands = [
+        ['run', None, _RunOptions, 'Start the workers.'],
+        ['worker', None, _WorkerOptions, 'Run a single worker (internal).'],
+        ['stats', None, _StatsOptions, 'Print merged worker stats.'],
+    ]
+
+
+def main(reactor, *argv):
+    options = Options()
+    options.parseOptions(argv)
+    sub = options.subOptions
+    if options.subCommand == 'stats':
+        import json
+
+        def show(stats):
+            print json.dumps(stats, indent=2, sort_keys=True)
+        return collectStats(reactor, sub['stats-dir']).addCallback(show)
+
+    log.startLogging(sys.stderr)
+    if options.subCommand == 'worker':
+        worker = Worker(reactor, loadFactory(sub['factory']), sub['index'],
+                        sub['shutdown-timeout'])
+        worker.listen(sub['port'], sub['interface'], sub['fd'],
+                      sub['stats-dir'])
+    else:
+        Launcher(sub['factory'], sub['port'], sub['workers'],
+                 sub['interface'], sub['share-socket'], sub['stats-dir'],
+                 sub['shutdown-timeout'], reactor).start()
+    return defer.Deferred()
+
+
+if __name__ == '__main__':
+    task.react(main, sys.argv[1:])
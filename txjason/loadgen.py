@@ -0,0 +1,379 @@
+"""
+An open-loop load generator for JSON-RPC servers.
+
+Closed-loop tools (a fixed number of callers, each waiting for its response
+before sending the next request) slow down with the server they measure, so
+the requests that would have queued behind a slow response are never sent
+and the queueing delay never shows up in their latencies. This generator
+sends requests at the times a fixed or Poisson arrival process says, whether
+or not earlier ones have been answered, and measures each request's latency
+from the time it should have been sent. When the generator itself falls
+behind, the requests it sends late still count the delay (correcting for
+"coordinated omission"); the service time measured from the actual send is
+reported separately.
+
+Requests are spread round-robin over ``--connections`` connections to any
+endpoint ``endpoints.clientFromString`` accepts. Methods and params are
+either given on the command line or picked at random from a spec file, a
+JSON list of weighted requests:
+
+    [{"method": "main.echo", "params": ["hello"], "weight": 9},
+     {"method": "main.lookup", "params": {"id": 42}, "weight": 1}]
+
+From the command line:
+
+    python -m txjason.loadgen --rate 2000 --duration 60 --connections 8 \\
+        --poisson --spec requests.json tcp:host=127.0.0.1:port=7080
+
+The report has the throughput, the error rate by kind (error codes,
+timeouts, connection failures, and requests dropped because
+``--max-outstanding`` were already waiting) and latency percentiles for all
+requests and for each method. ``--json`` prints it as JSON instead.
+"""
+import json
+import math
+import random
+import sys
+
+from twisted.internet import defer, endpoints, task
+from twisted.python import usage
+
+from txjason import client, netstring
+
+
+PERCENTILES = (50, 75, 90, 99, 99.9, 99.99, 100)
+
+
+class Histogram(object):
+    """
+    Latencies in logarithmic buckets about 1% wide, from 1us up.
+    """
+    resolution = 100
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        key = int(math.log(max(seconds, 1e-6) * 1e6) * self.resolution)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """
+        Returns the latency in seconds that ``p`` percent of the recorded
+        latencies do not exceed.
+        """
+        if not self.count:
+            return 0.0
+        if p >= 100:
+            return self.max
+        rank = max(1, int(math.ceil(p / 100.0 * self.count)))
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= rank:
+                return min(math.exp((key + 1.0) / self.resolution) / 1e6,
+                           self.max)
+        return self.max
+
+    def summary(self):
+        mean = self.total / self.count if self.count else 0.0
+        summary = {'count': self.count, 'mean': mean}
+        for p in PERCENTILES:
+            summary['p%g' % (p,)] = self.percentile(p)
+        return summary
+
+
+class Spec(object):
+    """
+    Weighted (method, params) requests to pick from.
+    """
+    def __init__(self, requests, random=random):
+        self.requests = []
+        self.weights = []
+        total = 0
+        for request in requests:
+            if not isinstance(request.get('method'), basestring):
+                raise ValueError('request without a method: %r' % (request,))
+            params = request.get('params', [])
+            if not isinstance(params, (list, dict)):
+                raise ValueError('params must be a list or an object: %r' % (
+                    request,))
+            total += request.get('weight', 1)
+            self.requests.append((request['method'], params))
+            self.weights.append(total)
+        if not self.requests:
+            raise ValueError('no requests in spec')
+        self.random = random
+
+    @classmethod
+    def fromFile(cls, path, random=random):
+        with open(path) as f:
+            return cls(json.load(f), random)
+
+    def choose(self):
+        if len(self.requests) == 1:
+            return self.requests[0]
+        point = self.random.random() * self.weights[-1]
+        for i, weight in enumerate(self.weights):
+            if point < weight:
+                return self.requests[i]
+        return self.requests[-1]
+
+
+def _classify(reason):
+    if reason.check(client.JSONRPCClientError):
+        error = reason.value.args[0] if reason.value.args else None
+        if isinstance(error, dict) and 'code' in error:
+            return 'error %s' % (error['code'],)
+        return 'error'
+    if reason.check(defer.CancelledError):
+        return 'timeout'
+    return reason.type.__name__
+
+
+class LoadGenerator(object):
+    """
+    Sends requests picked from ``spec`` with ``client`` (anything with a
+    ``callRemote``, e.g. a JSONRPCClientFactory or JSONRPCClientPool) at
+    ``rate`` per second for ``duration`` seconds.
+    """
+    def __init__(self, reactor, client, spec, rate, duration, poisson=False,
+                 maxOutstanding=10000, random=random):
+        self.reactor = reactor
+        self.client = client
+        self.spec = spec
+        self.rate = rate
+        self.duration = duration
+        self.poisson = poisson
+        self.maxOutstanding = maxOutstanding
+        self.random = random
+        self.latency = Histogram()
+        self.serviceTime = Histogram()
+        self.methods = {}
+        self.errors = {}
+        self.sent = 0
+        self.outstanding = 0
+        # How late the generator sent its requests, at worst.
+        self.maxLag = 0.0
+        self.start = self.sendingEnded = None
+        self._sending = False
+        self._call = None
+        self._done = None
+
+    def _advance(self):
+        self._index += 1
+        if self.poisson:
+            self._next += self.random.expovariate(self.rate)
+        else:
+            # Not a running sum, which would drift.
+            self._next = self.start + self._index / float(self.rate)
+
+    def run(self):
+        """
+        Returns a Deferred firing with the report once every request has been
+        sent and answered (or has failed).
+        """
+        self._done = defer.Deferred()
+        self.start = self.reactor.seconds()
+        self._end = self.start + self.duration
+        self._next = self.start
+        self._index = 0
+        self._sending = True
+        self._tick()
+        return self._done
+
+    def _tick(self):
+        self._call = None
+        now = self.reactor.seconds()
+        while self._next <= now and self._next < self._end:
+            self.maxLag = max(self.maxLag, now - self._next)
+            self._send(self._next, now)
+            self._advance()
+        if self._next < self._end:
+            self._call = self.reactor.callLater(self._next - now, self._tick)
+        else:
+            self._sending = False
+            self.sendingEnded = now
+            self._maybeDone()
+
+    def _send(self, intended, now):
+        method, params = self.spec.choose()
+        stats = self.methods.get(method)
+        if stats is None:
+            stats = self.methods[method] = [Histogram(), 0]
+        self.sent += 1
+        if self.outstanding >= self.maxOutstanding:
+            self._error('dropped', stats)
+            return
+        self.outstanding += 1
+        if isinstance(params, dict):
+            d = self.client.callRemote(method, params)
+        else:
+            d = self.client.callRemote(method, *params)
+        d.addCallbacks(self._answered, self._failed,
+                       (intended, now, stats), None, (stats,))
+
+    def _answered(self, result, intended, sent, stats):
+        now = self.reactor.seconds()
+        self.latency.record(now - intended)
+        self.serviceTime.record(now - sent)
+        stats[0].record(now - intended)
+        self._completed()
+
+    def _failed(self, reason, stats):
+        self._error(_classify(reason), stats)
+        self._completed()
+
+    def _error(self, kind, stats):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+        stats[1] += 1
+
+    def _completed(self):
+        self.outstanding -= 1
+        self._maybeDone()
+
+    def _maybeDone(self):
+        if not self._sending and not self.outstanding and \
+                self._done is not None:
+            done, self._done = self._done, None
+            done.callback(self.report())
+
+    def stop(self):
+        """
+        Stops sending; the report is delivered once outstanding requests are
+        answered.
+        """
+        if self._sending:
+            if self._call is not None:
+                self._call.cancel()
+                self._call = None
+            self._sending = False
+            self.sendingEnded = self.reactor.seconds()
+            self._maybeDone()
+
+    def report(self):
+        elapsed = max(self.reactor.seconds() - self.start, 1e-9)
+        errors = sum(self.errors.values())
+        return {
+            'rate': self.rate,
+            'duration': self.sendingEnded - self.start,
+            'elapsed': elapsed,
+            'sent': self.sent,
+            'ok': self.latency.count,
+            'errors': dict(self.errors),
+            'errorRate': float(errors) / self.sent if self.sent else 0.0,
+            'throughput': self.latency.count / elapsed,
+            'maxLag': self.maxLag,
+            'latency': self.latency.summary(),
+            'serviceTime': self.serviceTime.summary(),
+            'methods': dict(
+                (method, {'errors': stats[1], 'latency': stats[0].summary()})
+                for method, stats in self.methods.items()),
+        }
+
+
+def formatReport(report):
+    lines = [
+        'Sent %d requests in %.1fs (target %g/s), %d ok, %.2f%% errors' % (
+            report['sent'], report['duration'], report['rate'], report['ok'],
+            report['errorRate'] * 100),
+        'Throughput: %.1f responses/s, sender fell behind by up to %.1fms' % (
+            report['throughput'], report['maxLag'] * 1000),
+    ]
+    for kind, count in sorted(report['errors'].items()):
+        lines.append('  %-24s %d' % (kind, count))
+    lines.append('')
+    lines.append('%-24s %7s %7s' % ('latency (ms)', 'ok', 'errors') +
+                 ''.join('%10s' % ('p%g' % (p,) if p < 100 else 'max')
+                         for p in PERCENTILES))
+    errors = sum(report['errors'].values())
+    rows = [('corrected', report['latency'], errors),
+            ('service time', report['serviceTime'], errors)]
+    rows.extend(sorted((method, stats['latency'], stats['errors'])
+                       for method, stats in report['methods'].items()))
+    for name, summary, errors in rows:
+        lines.append('%-24s %7d %7d' % (name, summary['count'], errors) +
+                     ''.join('%10.2f' % (summary['p%g' % (p,)] * 1000,)
+                             for p in PERCENTILES))
+    return '\n'.join(lines)
+
+
+class Options(usage.Options):
+    synopsis = 'Usage: python -m txjason.loadgen [options] <endpoint>'
+    optParameters = [
+        ['rate', 'r', 100, 'Requests per second.', float],
+        ['duration', 'd', 10, 'Seconds to send requests for.', float],
+        ['connections', 'c', 1, 'Number of connections.', int],
+        ['spec', 's', None, 'JSON file of weighted requests to send.'],
+        ['method', 'm', None, 'Method to call, without --spec.'],
+        ['params', 'p', '[]', 'JSON params for --method.'],
+        ['timeout', 't', 5, 'Seconds before a request times out.', float],
+        ['max-outstanding', None, 10000, 'Drop requests while this many are '
+         'waiting for a response.', int],
+        ['seed', None, None, 'Seed for the arrival times and request mix.',
+         int],
+    ]
+    optFlags = [
+        ['poisson', None, 'Poisson arrivals instead of a fixed interval.'],
+        ['json', None, 'Print the report as JSON.'],
+    ]
+
+    def parseArgs(self, endpoint):
+        self['endpoint'] = endpoint
+
+    def postOptions(self):
+        if (self['spec'] is None) == (self['method'] is None):
+            raise usage.UsageError('give exactly one of --spec and --method')
+        if self['rate'] <= 0 or self['connections'] < 1:
+            raise usage.UsageError('--rate and --connections must be '
+                                   'positive')
+
+
+@defer.inlineCallbacks
+def main(reactor, *argv):
+    options = Options()
+    try:
+        options.parseOptions(argv)
+    except usage.UsageError, e:
+        raise SystemExit('%s\n%s' % (e, options))
+    rand = random.Random(options['seed'])
+    if options['spec'] is not None:
+        spec = Spec.fromFile(options['spec'], rand)
+    else:
+        spec = Spec([{'method': options['method'],
+                      'params': json.loads(options['params'])}], rand)
+    factories = [
+        netstring.JSONRPCClientFactory(
+            endpoints.clientFromString(reactor, options['endpoint']),
+            timeout=options['timeout'], reactor=reactor)
+        for i in range(options['connections'])]
+    yield defer.gatherResults([f.connect() for f in factories])
+    generator = LoadGenerator(
+        reactor, netstring.JSONRPCClientPool(factories), spec,
+        options['rate'], options['duration'], options['poisson'],
+        options['max-outstanding'], rand)
+    try:
+        report = yield generator.run()
+    finally:
+        # Factories whose connection is already gone would never notify.
+        disconnected = defer.DeferredList(
+            [f.notifyDisconnect() for f in factories if f._proto is not None],
+            consumeErrors=True)
+        for f in factories:
+            f.disconnect()
+        yield disconnected
+    if options['json']:
+        print json.dumps(report, indent=2, sort_keys=True)
+    else:
+        print formatReport(report)
+
+
+if __name__ == '__main__':
+    task.react(main, sys.argv[1:])
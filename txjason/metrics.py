@@ -0,0 +1,152 @@
+"""
+Low overhead in-process metrics.
+
+A MetricsRegistry hands out counters, gauges and histograms keyed by name and
+labels. Looking a metric up costs a dict access, so callers on hot paths
+should look their metrics up once and keep them; updating a metric is then a
+single attribute increment (or a bisect, for histograms).
+
+Example:
+
+    registry = MetricsRegistry()
+    calls = registry.counter('calls', method='echo')
+    latency = registry.histogram('latency_seconds', method='echo')
+
+    calls.inc()
+    latency.observe(0.0042)
+
+    registry.snapshot()  # a JSON serializable list of every metric
+"""
+import bisect
+
+
+# Latency buckets in seconds, from 100us to a minute.
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Counter(object):
+    """
+    A monotonically increasing count.
+    """
+    __slots__ = ('value',)
+    kind = 'counter'
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def snapshot(self):
+        return {'value': self.value}
+
+
+class Gauge(object):
+    """
+    A value that can go up and down.
+    """
+    __slots__ = ('value',)
+    kind = 'gauge'
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def snapshot(self):
+        return {'value': self.value}
+
+
+class Histogram(object):
+    """
+    A distribution of observed values counted into fixed buckets.
+
+    ``buckets`` are the inclusive upper bounds of each bucket, in increasing
+    order; values above the last bound are counted in an overflow bucket.
+    """
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+    kind = 'histogram'
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, p):
+        """
+        Estimate the ``p``th percentile as the upper bound of the bucket it
+        falls in. Returns None if nothing has been observed.
+        """
+        if not self.count:
+            return None
+        rank = self.count * p / 100.0
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        return {'buckets': list(self.buckets),
+                'counts': list(self.counts),
+                'count': self.count,
+                'sum': self.sum}
+
+
+class MetricsRegistry(object):
+    """
+    A collection of metrics keyed by name and labels.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _get(self, cls, name, labels, *args):
+        key = (name, tuple(sorted(labels.items())))
+        try:
+            metric = self._metrics[key]
+        except KeyError:
+            metric = self._metrics[key] = cls(*args)
+        if not isinstance(metric, cls):
+            raise TypeError('metric %r is a %s, not a %s' % (
+                name, metric.kind, cls.kind))
+        return metric
+
+    def counter(self, name, **labels):
+        return self._get(Counter, name, labels)
+
+    def gauge(self, name, **labels):
+        return self._get(Gauge, name, labels)
+
+    def histogram(self, name, buckets=DEFAULT_BUCKETS, **labels):
+        return self._get(Histogram, name, labels, buckets)
+
+    def snapshot(self):
+        """
+        Returns a list of dictionaries describing every metric, suitable for
+        JSON serialization (e.g. from an admin RPC method).
+        """
+        result = []
+        for (name, labels), metric in sorted(self._metrics.items()):
+            entry = metric.snapshot()
+            entry.update({'name': name,
+                          'type': metric.kind,
+                          'labels': dict(labels)})
+            result.append(entry)
+        return result
@@ -1,20 +1,121 @@
-from twisted.internet import defer
-from twisted.protocols.basic import NetstringReceiver
+import collections
+import itertools
+import time
+
+from twisted.internet import defer, error
 from twisted.python import failure, log
-from txjason import protocol, client
+from txjason import protocol, client, codec, compression, service, stream
+from txjason.framing import BufferedNetstringReceiver
+
+
+class _FramingMixin(object):
+    """
+    Encoding state shared by the client and server protocols: the codec and,
+    if one was negotiated, the compressor applied to each frame.
+    """
+    codec = codec.JSON
+    compressor = None
+    compressionThreshold = 16384
+
+    def setCompressor(self, compressor, threshold, metrics, side):
+        """
+        Start compressing outgoing frames of at least ``threshold`` bytes with
+        ``compressor``, and expect a flag byte on every incoming frame.
+        """
+        self.compressor = compressor
+        self.compressionThreshold = threshold
+        labels = {'algorithm': compressor.name, 'side': side}
+        self._compressionMetrics = (
+            metrics.counter('compression_bytes_in', **labels),
+            metrics.counter('compression_bytes_out', **labels),
+            metrics.histogram('compression_ratio', _RATIO_BUCKETS, **labels),
+            metrics.histogram('compression_seconds', **labels),
+            metrics.histogram('decompression_seconds', **labels))
+
+    def sendPayload(self, data):
+        """
+        Send an encoded message, compressing it if it is large enough.
+        """
+        if self.compressor is None:
+            self.sendString(data)
+        else:
+            self.sendStrings(self.framePayload(data))
+
+    def framePayload(self, data):
+        """
+        Returns the parts of the frame carrying an encoded message when a
+        compressor is in use: a flag byte, then the message, compressed if
+        it is large enough and that makes it smaller.
+        """
+        if len(data) >= self.compressionThreshold:
+            bytesIn, bytesOut, ratio, seconds, ign = self._compressionMetrics
+            start = time.time()
+            compressed = self.compressor.compress(data)
+            seconds.observe(time.time() - start)
+            bytesIn.inc(len(data))
+            bytesOut.inc(len(compressed))
+            ratio.observe(float(len(compressed)) / len(data))
+            if len(compressed) < len(data):
+                return (compression.COMPRESSED, compressed)
+        return (compression.RAW, data)
+
+    def decodeFrame(self, string):
+        """
+        Returns the encoded message carried by a received frame. Raises
+        ValueError if the frame cannot be decompressed.
+        """
+        if self.compressor is None:
+            return string
+        flag = string[:1]
+        if flag == compression.RAW:
+            return string[1:]
+        if flag != compression.COMPRESSED:
+            raise ValueError('bad frame flag %r' % (flag,))
+        start = time.time()
+        try:
+            return self.compressor.decompress(string[1:], self.MAX_LENGTH)
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(str(e))
+        finally:
+            self._compressionMetrics[4].observe(time.time() - start)
+
 
+_RATIO_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1)
 
-class JSONRPCClientProtocol(NetstringReceiver):
+
+class JSONRPCClientProtocol(_FramingMixin, BufferedNetstringReceiver):
     """
     A JSON RPC Client Protocol for TCP/Netstring connections.
     """
     def __init__(self, factory):
         self.factory = factory
         self.deferred = defer.Deferred()
+        self._readPauses = 0
+
+    def pauseReading(self):
+        """
+        Stops reading from the connection until every pauseReading call has
+        been matched by a resumeReading call.
+        """
+        self._readPauses += 1
+        if self._readPauses == 1:
+            self.transport.pauseProducing()
+
+    def resumeReading(self):
+        self._readPauses -= 1
+        if self._readPauses == 0 and self.connected:
+            self.transport.resumeProducing()
 
     def stringReceived(self, string):
         try:
-            self.factory.client.handleResponse(string)
+            try:
+                string = self.decodeFrame(string)
+            except ValueError as e:
+                raise client.JSONRPCProtocolError(
+                    'could not decompress frame: %s' % (e,))
+            self.factory.client.handleResponse(string, self.codec)
         except client.JSONRPCProtocolError:
             log.err()
             self.transport.loseConnection()
@@ -22,6 +123,7 @@ class JSONRPCClientProtocol(NetstringReceiver):
             log.err()
 
     def connectionLost(self, reason):
+        self.connected = False
         if self.brokenPeer:
             log.msg('Disconencted from server because of a broken peer.')
         else:
@@ -29,32 +131,329 @@ class JSONRPCClientProtocol(NetstringReceiver):
         self.deferred.errback(reason)
 
 
-class JSONRPCServerProtocol(NetstringReceiver):
+class JSONRPCServerProtocol(_FramingMixin, BufferedNetstringReceiver):
     """
     A JSON RPC Server Protocol for TCP/Netstring connections.
+
+    The first frame on a connection may be a negotiation request (see
+    txjason.codec and txjason.compression); later frames are decoded with the
+    codec and compression agreed on.
     """
     def __init__(self, service):
         self.service = service
+        self._negotiable = True
+        self._readingPaused = False
+        self._writePaused = False
+        self._writeWaiters = []
+        self._producing = False
+        self._heldMemory = 0
+
+    def connectionMade(self):
+        # Let the transport tell us when its write buffer is full.
+        self.transport.registerProducer(self, True)
+        self._producing = True
+        self.factory.addConnection(self)
+
+    def loseConnection(self):
+        # TLS transports do not close while a producer is registered.
+        if self._producing:
+            self._producing = False
+            self.transport.unregisterProducer()
+        self.transport.loseConnection()
 
     @defer.inlineCallbacks
     def stringReceived(self, string):
-        result = yield self.service.call(string)
-        if result is not None:
-            self.sendString(result)
+        if self._negotiable:
+            self._negotiable = False
+            if codec.NEGOTIATE in string and self._negotiate(string):
+                return
+        try:
+            string = self.decodeFrame(string)
+        except ValueError:
+            log.err(None, 'bad frame from %r' % (self.transport.getPeer(),))
+            self.loseConnection()
+            return
+        d = self.service.call(string, self.codec, self)
+        self._checkBudget()
+        result = yield d
+        if result is not None and self.connected:
+            self._send(result)
+
+    def _send(self, data):
+        self.sendPayload(data)
+        if self._writePaused:
+            # The transport buffers what it cannot send yet; count it
+            # against the memory budget until it can.
+            self._heldMemory += len(data)
+            self.service.holdMemory(len(data))
+            self._checkBudget()
+
+    def _releaseHeldMemory(self):
+        held, self._heldMemory = self._heldMemory, 0
+        if held:
+            self.service.releaseMemory(held)
+
+    def _checkBudget(self):
+        if not self._readingPaused and self.service.overBudget():
+            # Stop reading until the service has memory for more requests.
+            self._readingPaused = True
+            self.transport.pauseProducing()
+            self.service.whenMemoryAvailable().addCallback(
+                self._resumeReading)
+
+    def _resumeReading(self, ign):
+        self._readingPaused = False
+        if self.connected:
+            self.transport.resumeProducing()
+
+    def sendChunk(self, id, chunk):
+        """
+        Sends a chunk of the streamed result of request ``id`` (see
+        txjason.stream). Returns a Deferred that fires once the transport can
+        take more data.
+        """
+        if not self.connected:
+            return defer.fail(error.ConnectionDone())
+        self._send(self.codec.dumps({
+            'jsonrpc': '2.0', 'method': stream.STREAM, 'params': [id, chunk]}))
+        if not self._writePaused:
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self._writeWaiters.append(d)
+        return d
+
+    def pauseProducing(self):
+        self._writePaused = True
+
+    def resumeProducing(self):
+        self._writePaused = False
+        self._releaseHeldMemory()
+        waiters, self._writeWaiters = self._writeWaiters, []
+        for d in waiters:
+            d.callback(None)
+
+    def stopProducing(self):
+        self._releaseHeldMemory()
+        waiters, self._writeWaiters = self._writeWaiters, []
+        for d in waiters:
+            d.errback(error.ConnectionDone())
+
+    def connectionLost(self, reason):
+        self.connected = False
+        self.stopProducing()
+        BufferedNetstringReceiver.connectionLost(self, reason)
+        self.factory.removeConnection(self)
+        self.service.connectionLost(self)
+
+    def _negotiate(self, string):
+        """
+        Answers a codec negotiation request and switches to the chosen codec.
+        Returns False if ``string`` is not a negotiation request.
+        """
+        try:
+            request = codec.JSON.loads(string)
+        except ValueError:
+            return False
+        if not (isinstance(request, dict) and
+                request.get('method') == codec.NEGOTIATE and
+                request.get('id') is not None):
+            return False
+        params = request.get('params')
+        if not isinstance(params, dict):
+            params = {}
+        chosen = codec.choose(
+            _names(params.get('codecs')),
+            getattr(self.factory, 'codecs', None))
+        compressor = compression.choose(
+            _names(params.get('compression')),
+            getattr(self.factory, 'compression', None))
+        self.sendString(codec.JSON.dumps({
+            'jsonrpc': '2.0',
+            'id': request['id'],
+            'result': {'codec': chosen.name,
+                       'compression': compressor and compressor.name}}))
+        self.codec = chosen
+        if compressor is not None:
+            self.setCompressor(
+                compressor,
+                getattr(self.factory, 'compressionThreshold',
+                        self.compressionThreshold),
+                self.service.metrics, 'server')
+        return True
+
+
+def _names(offered):
+    """
+    Returns the strings in a list of names offered by a peer.
+    """
+    if not isinstance(offered, list):
+        return []
+    return [name for name in offered if isinstance(name, basestring)]
+
+
+def _describeEndpoint(endpoint):
+    """
+    Returns a short description of a client endpoint for labelling metrics.
+    """
+    host = getattr(endpoint, '_host', None)
+    if host is not None:
+        return '%s:%s' % (host, getattr(endpoint, '_port', ''))
+    path = getattr(endpoint, '_path', None)
+    if path is not None:
+        return 'unix:%s' % (path,)
+    return endpoint.__class__.__name__
+
+
+class _IdempotentCall(object):
+    """
+    A callRemote for an idempotent method, which may be hedged onto a second
+    client factory and retried after connection loss or a Service Unavailable
+    error.
+    """
+    def __init__(self, factory, method, args, kwargs):
+        self.factory = factory
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.retriesLeft = factory.retries
+        self.retryDelay = factory.retryDelay
+        self.attempts = []
+        self.timer = None
+        self.done = False
+        self.deferred = defer.Deferred(self._cancel)
+
+    def start(self):
+        delay = self.factory.hedgeDelay()
+        self._attempt(self.factory)
+        if self.factory.hedgeFactory is not None and delay is not None:
+            self.timer = self.factory.reactor.callLater(delay, self._hedge)
+        return self.deferred
+
+    def _attempt(self, factory):
+        disconnects = factory._disconnects
+        d = factory._callRemote(self.method, *self.args, **self.kwargs)
+        self.attempts.append(d)
+        d.addBoth(self._attemptDone, d, factory, disconnects)
+
+    def _hedge(self):
+        self.timer = None
+        if not self.done:
+            self._attempt(self.factory.hedgeFactory)
+
+    def _retry(self):
+        self.timer = None
+        if not self.done:
+            self.start()
+
+    def _attemptDone(self, result, d, factory, disconnects):
+        if d in self.attempts:
+            self.attempts.remove(d)
+        if self.done:
+            return None
+        if isinstance(result, failure.Failure):
+            if self.attempts:
+                # A hedged attempt is still in flight; let it answer.
+                return None
+            if self.retriesLeft and factory._isRetryable(result, disconnects):
+                self.retriesLeft -= 1
+                self._stopTimer()
+                self.timer = self.factory.reactor.callLater(
+                    self.retryDelay, self._retry)
+                self.retryDelay = min(self.retryDelay * 2,
+                                      self.factory.retryMaxDelay)
+                return None
+        self._finish()
+        self.deferred.callback(result)
+        return None
+
+    def _stopTimer(self):
+        if self.timer is not None and self.timer.active():
+            self.timer.cancel()
+        self.timer = None
+
+    def _finish(self):
+        self.done = True
+        self._stopTimer()
+        attempts, self.attempts = self.attempts, []
+        for d in attempts:
+            d.cancel()
+
+    def _cancel(self, d):
+        self._finish()
 
 
 class JSONRPCClientFactory(protocol.BaseClientFactory):
-    def __init__(self, endpoint, timeout=5, reactor=None):
+    """
+    A JSON RPC client factory which connects (and reconnects) to ``endpoint``
+    on demand.
+
+    Calls made with ``idempotent=True`` may be hedged: if no response arrives
+    within the ``hedgePercentile`` latency observed for this factory, the call
+    is duplicated on ``hedgeFactory`` (a factory for another connection or
+    endpoint) and whichever answers first wins. Idempotent calls are also
+    retried up to ``retries`` times, with exponential backoff starting at
+    ``retryDelay`` seconds, after a connection failure or loss or a
+    ServiceUnavailableError from the server.
+
+    Connection attempts, failures, reconnections and the time callers spend
+    waiting for a connection are recorded in ``metrics`` (shared with
+    ``client``), labelled with ``name``.
+
+    ``codecs`` is a list of codec names (see txjason.codec) to offer the
+    server on each new connection, in order of preference; by default
+    connections use JSON without negotiating. Likewise ``compression`` lists
+    the compression algorithms (see txjason.compression) to offer; frames of
+    at least ``compressionThreshold`` bytes are then compressed.
+
+    With ``cancelRemote``, a call that times out or is cancelled sends a
+    ``txjason.cancel`` notification so that the server can stop working on
+    it. Servers that do not support it ignore the notification.
+
+    A ``tracer`` (see txjason.trace) starts traces for a sample of the calls.
+    """
+    hedgeMinDelay = 0.005
+    hedgeMinSamples = 20
+    latencyWindow = 100
+    retryMaxDelay = 5
+
+    def __init__(self, endpoint, timeout=5, reactor=None, hedgeFactory=None,
+                 hedgePercentile=95, retries=0, retryDelay=0.1, name=None,
+                 metrics=None, codecs=None, compression=None,
+                 compressionThreshold=16384, cancelRemote=False, tracer=None):
         if reactor is None:
             from twisted.internet import reactor
-        self.client = client.JSONRPCClient(timeout=timeout, reactor=reactor)
+        if name is None:
+            name = _describeEndpoint(endpoint)
+        self.name = name
+        self.client = client.JSONRPCClient(
+            timeout=timeout, reactor=reactor, metrics=metrics, endpoint=name,
+            tracer=tracer)
+        self.metrics = self.client.metrics
+        self._connectAttempts = self.metrics.counter(
+            'client_connect_attempts', endpoint=name)
+        self._connectFailures = self.metrics.counter(
+            'client_connect_failures', endpoint=name)
+        self._reconnects = self.metrics.counter(
+            'client_reconnects', endpoint=name)
+        self._connectionWait = self.metrics.histogram(
+            'client_connection_wait_seconds', endpoint=name)
         self.endpoint = endpoint
+        self.codecs = codecs
+        self.compression = compression
+        self.compressionThreshold = compressionThreshold
+        self.cancelRemote = cancelRemote
         self._proto = None
         self._waiting = []
         self._notifyOnDisconnect = []
         self._connecting = False
         self._connectionDeferred = None
+        self._disconnects = 0
         self.reactor = reactor
+        self.hedgeFactory = hedgeFactory
+        self.hedgePercentile = hedgePercentile
+        self.retries = retries
+        self.retryDelay = retryDelay
+        self.latencies = collections.deque(maxlen=self.latencyWindow)
 
     def buildProtocol(self, addr):
         return JSONRPCClientProtocol(self)
@@ -67,18 +466,78 @@ class JSONRPCClientFactory(protocol.BaseClientFactory):
         if self._proto is not None:
             return defer.succeed(self._proto)
         d = defer.Deferred(self._cancel)
+        d.addCallback(self._recordConnectionWait, self.reactor.seconds())
         self._waiting.append(d)
         if not self._connecting:
             self._connecting = True
+            self._connectAttempts.inc()
+            if self._disconnects:
+                self._reconnects.inc()
             self._connectionDeferred = (
                 self.endpoint.connect(self)
+                .addCallback(self._negotiate)
                 .addBoth(self._gotResult)
                 .addErrback(log.err, 'error connecting %r' % (self,)))
         return d
 
+    def _negotiate(self, proto):
+        """
+        Offers ``codecs`` and ``compression`` to the server on a new
+        connection, and returns a Deferred that fires with the connection once
+        the server has picked. Servers that do not support negotiation leave
+        the connection on uncompressed JSON. If negotiation times out, is
+        cancelled or the connection is lost first, the connection is dropped
+        and the Deferred fails.
+        """
+        if not (self.codecs or self.compression):
+            return proto
+        offered = list(self.codecs or [])
+        if codec.JSON.name not in offered:
+            offered.append(codec.JSON.name)
+        payload, d = self.client.getRequest(
+            codec.NEGOTIATE,
+            {'codecs': offered, 'compression': list(self.compression or [])})
+        proto.sendString(payload)
+        lost = []
+
+        def disconnected(reason):
+            if d.called:
+                # Negotiated; _gotResult watches the connection from now on.
+                return reason
+            lost.append(reason)
+            self.client.cancelRequests()
+        proto.deferred.addErrback(disconnected)
+
+        def negotiated(result):
+            if not isinstance(result, dict):
+                result = {}
+            proto.codec = codec.get(result.get('codec')) or codec.JSON
+            compressor = compression.get(result.get('compression'))
+            if compressor is not None:
+                proto.setCompressor(compressor, self.compressionThreshold,
+                                    self.metrics, 'client')
+            return proto
+
+        def failed(reason):
+            if reason.check(client.JSONRPCClientError):
+                # The server answered, but does not know how to negotiate.
+                return proto
+            if lost:
+                return lost[0]
+            proto.deferred.addErrback(lambda reason: None)
+            proto.transport.abortConnection()
+            return reason
+        return d.addCallbacks(negotiated, failed)
+
+    def _recordConnectionWait(self, result, start):
+        self._connectionWait.observe(self.reactor.seconds() - start)
+        return result
+
     def _gotResult(self, result):
         self._connecting = False
-        if not isinstance(result, failure.Failure):
+        if isinstance(result, failure.Failure):
+            self._connectFailures.inc()
+        else:
             self._proto = result
             self._proto.deferred.addErrback(self._lostProtocol)
         waiting, self._waiting = self._waiting, []
@@ -92,26 +551,108 @@ class JSONRPCClientFactory(protocol.BaseClientFactory):
         for d in deferreds:
             d.errback(reason)
         self._proto = None
+        self._disconnects += 1
         self.client.cancelRequests()
 
+    def hedgeDelay(self):
+        """
+        Return the delay after which an idempotent call is hedged, or None if
+        too few responses have been seen to estimate it.
+        """
+        if len(self.latencies) < self.hedgeMinSamples:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(int(len(ordered) * self.hedgePercentile / 100.0),
+                    len(ordered) - 1)
+        return max(ordered[index], self.hedgeMinDelay)
+
+    def _isRetryable(self, reason, disconnects):
+        if reason.check(error.ConnectError, error.ConnectionClosed):
+            return True
+        if reason.check(defer.CancelledError):
+            # Pending requests are cancelled when the connection is lost.
+            return self._disconnects != disconnects
+        if reason.check(client.JSONRPCClientError):
+            err = reason.value.args[0] if reason.value.args else None
+            return (isinstance(err, dict) and
+                    err.get('code') == service.ServiceUnavailableError.code)
+        return False
+
     def callRemote(self, __method, *args, **kwargs):
+        """
+        Call a remote method, returning a Deferred that fires with its result.
+
+        Pass ``idempotent=True`` to allow the call to be hedged and retried.
+        """
+        idempotent = kwargs.pop('idempotent', False)
+        if idempotent and (self.hedgeFactory is not None or self.retries):
+            return _IdempotentCall(self, __method, args, kwargs).start()
+        return self._callRemote(__method, *args, **kwargs)
+
+    def _recordLatency(self, result, start, timeout):
+        latency = self.reactor.seconds() - start
+        if latency < timeout and isinstance(result, failure.Failure) and \
+                result.check(defer.CancelledError):
+            # Cancelled by the caller (e.g. a hedged attempt that lost) rather
+            # than timed out: how long it would have taken is unknown.
+            return result
+        self.latencies.append(latency)
+        return result
+
+    def callRemoteStream(self, __method, *args, **kwargs):
+        """
+        Call a streaming remote method (see txjason.stream), returning a
+        ChunkStream of the chunks it sends. With ``timeout``, the call times
+        out if no chunk arrives for that many seconds.
+        """
+        chunks = stream.ChunkStream()
+        chunks._attach(self._callRemote(
+            __method, *args, **dict(kwargs, stream=chunks)))
+        return chunks
+
+    def _callRemote(self, __method, *args, **kwargs):
         connectionDeferred = self._getConnection()
 
         def gotConnection(connection):
+            options = dict(kwargs, codec=connection.codec)
+            if 'stream' in options:
+                options['stream'].protocol = connection
+            if self.cancelRemote:
+                options['onCancel'] = lambda id: self._cancelRemote(
+                    connection, id)
             payload, requestDeferred = self.client.getRequest(
-                __method, *args, **kwargs)
-            connection.sendString(payload)
+                __method, *args, **options)
+            connection.sendPayload(payload)
+            # Failures count too, or slow calls that time out would leave
+            # the hedge delay tuned to the fast ones.
+            requestDeferred.addBoth(
+                self._recordLatency, self.reactor.seconds(),
+                kwargs.get('timeout', self.client.timeout))
             return requestDeferred
 
         connectionDeferred.addCallback(gotConnection)
         return connectionDeferred
 
+    def addNotificationHandler(self, method, f):
+        """
+        Calls ``f`` with the params of each ``method`` notification sent by
+        the server (see JSONRPCServerFactory.broadcast). Other notifications
+        are ignored.
+        """
+        self.client.notificationHandlers[method] = f
+
+    def _cancelRemote(self, connection, id):
+        if connection.connected:
+            connection.sendPayload(self.client.getNotification(
+                service.CANCEL, id, codec=connection.codec))
+
     def notifyRemote(self, __method, *args, **kwargs):
         connectionDeferred = self._getConnection()
 
         def gotConnection(connection):
-            payload = self.client.getNotification(__method, *args, **kwargs)
-            connection.sendString(payload)
+            payload = self.client.getNotification(
+                __method, codec=connection.codec, *args, **kwargs)
+            connection.sendPayload(payload)
 
         connectionDeferred.addCallback(gotConnection)
         return connectionDeferred
@@ -131,5 +672,70 @@ class JSONRPCClientFactory(protocol.BaseClientFactory):
         return d
 
 
+class JSONRPCClientPool(object):
+    """
+    Spreads calls round-robin over several JSONRPCClientFactory instances,
+    each of which keeps its own connection.
+    """
+    def __init__(self, factories):
+        self.factories = list(factories)
+        self._cycle = itertools.cycle(self.factories)
+
+    def callRemote(self, __method, *args, **kwargs):
+        return next(self._cycle).callRemote(__method, *args, **kwargs)
+
+    def notifyRemote(self, __method, *args, **kwargs):
+        return next(self._cycle).notifyRemote(__method, *args, **kwargs)
+
+    def connect(self):
+        return defer.gatherResults(
+            [f.connect() for f in self.factories], consumeErrors=True)
+
+    def disconnect(self):
+        for f in self.factories:
+            f.disconnect()
+
+
 class JSONRPCServerFactory(protocol.BaseServerFactory):
     protocol = JSONRPCServerProtocol
+
+    def broadcast(self, method, params=None, group=None):
+        """
+        Sends a notification to every connection, or to the connections in
+        ``group``. The notification is encoded and framed once for each codec
+        and compression setting in use, and the same bytes are written to
+        every connection.
+
+        Connections whose write buffer is full are skipped, or disconnected
+        if ``dropSlowConnections`` is set. Returns the number of connections
+        the notification was written to.
+        """
+        if group is None:
+            targets = self.connections
+        else:
+            targets = self.groups.get(group, ())
+        message = {'jsonrpc': '2.0', 'method': method,
+                   'params': params if params is not None else []}
+        frames = {}
+        sent = 0
+        for proto in list(targets):
+            if not proto.connected:
+                continue
+            if proto._writePaused:
+                if self.dropSlowConnections:
+                    self._broadcastDropped.inc()
+                    proto.transport.abortConnection()
+                else:
+                    self._broadcastSkipped.inc()
+                continue
+            key = (proto.codec, proto.compressor, proto.compressionThreshold)
+            frame = frames.get(key)
+            if frame is None:
+                data = proto.codec.dumps(message)
+                if proto.compressor is not None:
+                    data = ''.join(proto.framePayload(data))
+                frame = frames[key] = '%d:%s,' % (len(data), data)
+            proto.transport.write(frame)
+            sent += 1
+        self._broadcastSent.inc(sent)
+        return sent
@@ -3,12 +3,65 @@ import service, client
 
 
 class BaseServerFactory(protocol.ServerFactory):
-    def __init__(self, seperator='.', timeout=None):
-        self.service = service.JSONRPCService(timeout)
+    def __init__(self, seperator='.', timeout=None, codecs=None,
+                 compression=None, compressionThreshold=16384,
+                 scheduler=None, cancelOnDisconnect=False, batchQuantum=None,
+                 maxBatchSize=None, memoryBudget=None, writeBufferSize=None,
+                 dropSlowConnections=False, slowLog=None, tracer=None,
+                 errorReporter=None):
+        self.service = service.JSONRPCService(
+            timeout, scheduler=scheduler,
+            cancelOnDisconnect=cancelOnDisconnect,
+            batchQuantum=batchQuantum, maxBatchSize=maxBatchSize,
+            memoryBudget=memoryBudget, slowLog=slowLog, tracer=tracer,
+            errorReporter=errorReporter)
         self.seperator = seperator
+        # Names of the codecs and compression algorithms clients may
+        # negotiate; None allows every available one.
+        self.codecs = codecs
+        self.compression = compression
+        self.compressionThreshold = compressionThreshold
+        # Live connections, and the named groups they have joined.
+        self.connections = set()
+        self.groups = {}
+        self.writeBufferSize = writeBufferSize
+        self.dropSlowConnections = dropSlowConnections
+        metrics = self.service.metrics
+        self._broadcastSent = metrics.counter('broadcast_sent')
+        self._broadcastSkipped = metrics.counter('broadcast_skipped')
+        self._broadcastDropped = metrics.counter('broadcast_dropped')
 
     def buildProtocol(self, addr):
-        return self.protocol(self.service)
+        p = self.protocol(self.service)
+        p.factory = self
+        return p
+
+    def addConnection(self, connection):
+        self.connections.add(connection)
+        connection.groups = set()
+        if self.writeBufferSize is not None and \
+                hasattr(connection.transport, 'bufferSize'):
+            connection.transport.bufferSize = self.writeBufferSize
+
+    def removeConnection(self, connection):
+        self.connections.discard(connection)
+        for group in list(getattr(connection, 'groups', ())):
+            self.leave(connection, group)
+
+    def join(self, connection, group):
+        """
+        Adds ``connection`` to ``group``, until it leaves or disconnects.
+        """
+        self.groups.setdefault(group, set()).add(connection)
+        connection.groups.add(group)
+
+    def leave(self, connection, group):
+        connection.groups.discard(group)
+        members = self.groups.get(group)
+        if members is not None:
+            members.discard(connection)
+            if not members:
+                del self.groups[group]
 
     def addHandler(self, handler, namespace=None):
         handler.addToService(self.service, namespace=namespace, seperator=self.seperator)
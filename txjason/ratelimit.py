@@ -0,0 +1,108 @@
+"""
+Token bucket rate limiting for JSONRPCService.
+
+RateLimiter is an interceptor: requests whose bucket is empty are answered
+with a RateLimitedError (-32096) before the method runs. Buckets are keyed by
+a function of the request; ``byPeer`` (the default), ``byConnection`` and
+``byMethod`` are provided and any callable taking the request may be used.
+Requests for which the key function returns None are not limited.
+
+Buckets are refilled lazily from the time elapsed since they were last used,
+so each request costs a few dict operations and a little arithmetic, and no
+timers are ever scheduled:
+
+    factory.service.addInterceptor(RateLimiter(rate=100, burst=200))
+    factory.service.addInterceptor(
+        RateLimiter(rate=5, key=byMethod, methods=['main.expensive']))
+"""
+import collections
+
+from txjason import interceptor, service
+
+
+def byConnection(request):
+    return request['connection']
+
+
+def byPeer(request):
+    """
+    Keys requests by the peer's host, so that several connections from one
+    client share a bucket.
+    """
+    connection = request['connection']
+    if connection is None or connection.transport is None:
+        return None
+    peer = connection.transport.getPeer()
+    return getattr(peer, 'host', peer)
+
+
+def byMethod(request):
+    return request['method']
+
+
+class TokenBucket(object):
+    """
+    Holds up to ``burst`` tokens, refilled at ``rate`` tokens per second.
+    """
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst, now):
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, rate, burst, now):
+        """
+        Takes a token, returning 0 on success or else the number of seconds
+        until one will be available.
+        """
+        tokens = self.tokens + (now - self.updated) * rate
+        if tokens > burst:
+            tokens = burst
+        self.updated = now
+        if tokens < 1:
+            self.tokens = tokens
+            return (1 - tokens) / rate
+        self.tokens = tokens - 1
+        return 0
+
+
+class RateLimiter(interceptor.Interceptor):
+    """
+    Limits each key to ``rate`` requests per second, allowing bursts of up
+    to ``burst`` requests (``rate`` by default). With ``methods``, only
+    requests for those methods are counted.
+
+    At most ``maxBuckets`` buckets are kept: a new key evicts the bucket
+    that was used least recently, whose key starts over with a full burst if
+    it is seen again.
+    """
+    maxBuckets = 10000
+
+    def __init__(self, rate, burst=None, key=byPeer, methods=None,
+                 reactor=None):
+        if reactor is None:
+            from twisted.internet import reactor
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self.key = key
+        self.methods = frozenset(methods) if methods is not None else None
+        self.reactor = reactor
+        # key -> TokenBucket, least recently used first.
+        self.buckets = collections.OrderedDict()
+
+    def afterParse(self, request):
+        if self.methods is not None and request['method'] not in self.methods:
+            return
+        key = self.key(request)
+        if key is None:
+            return
+        now = self.reactor.seconds()
+        bucket = self.buckets.pop(key, None)
+        if bucket is None:
+            if len(self.buckets) >= self.maxBuckets:
+                self.buckets.popitem(last=False)
+            bucket = TokenBucket(self.burst, now)
+        self.buckets[key] = bucket
+        wait = bucket.take(self.rate, self.burst, now)
+        if wait:
+            raise service.RateLimitedError(round(wait, 3))
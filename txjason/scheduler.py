@@ -0,0 +1,120 @@
+"""
+Fair scheduling of JSON-RPC requests across connections.
+
+Without a scheduler, JSONRPCService starts every request as soon as it is
+parsed, so a client sending large batches can starve everybody else. A
+FairScheduler admits at most ``concurrency`` requests at a time and queues
+the rest:
+
+- Queued requests are started strictly by method priority, highest first.
+  Set a method's priority with ``@exportRPC(priority=...)`` or
+  ``service.add(f, priority=...)``.
+- Requests of the same priority are taken round-robin from each connection,
+  one at a time.
+- At most ``quantum`` requests are started per reactor turn, so the reactor
+  reads other connections between chunks of a large batch.
+- Methods with priority CONTROL or above (health checks, admin calls) are
+  never queued.
+
+    factory = JSONRPCServerFactory(scheduler=FairScheduler(concurrency=64))
+"""
+import collections
+
+from twisted.internet import defer
+
+
+BULK = -10
+NORMAL = 0
+INTERACTIVE = 10
+CONTROL = 100
+
+
+class FairScheduler(object):
+    def __init__(self, concurrency=64, quantum=None, reactor=None):
+        if reactor is None:
+            from twisted.internet import reactor
+        self.concurrency = concurrency
+        self.quantum = quantum if quantum is not None else concurrency
+        self.reactor = reactor
+        self.active = 0
+        self.queued = 0
+        # priority -> OrderedDict of connection -> deque of waiting Deferreds
+        self._classes = {}
+        self._priorities = []
+        self._budget = self.quantum
+        self._call = None
+
+    def acquire(self, priority, connection):
+        """
+        Returns a Deferred that fires when a request may start. Call
+        ``release`` when it has finished. Cancelling the Deferred removes the
+        request from the queue.
+        """
+        if priority >= CONTROL:
+            self.active += 1
+            return defer.succeed(None)
+        if not self.queued and self.active < self.concurrency and \
+                self._budget > 0:
+            self._grant()
+            return defer.succeed(None)
+        connections = self._classes.get(priority)
+        if connections is None:
+            connections = self._classes[priority] = collections.OrderedDict()
+            self._priorities = sorted(self._classes, reverse=True)
+        waiters = connections.get(connection)
+        if waiters is None:
+            waiters = connections[connection] = collections.deque()
+        d = defer.Deferred(
+            lambda d: self._remove(priority, connection, d))
+        waiters.append(d)
+        self.queued += 1
+        self._schedule()
+        return d
+
+    def release(self):
+        self.active -= 1
+        if self.queued:
+            self._schedule()
+
+    def _grant(self):
+        self.active += 1
+        self._budget -= 1
+        if self._budget == 0:
+            self._schedule()
+
+    def _remove(self, priority, connection, d):
+        connections = self._classes[priority]
+        waiters = connections[connection]
+        waiters.remove(d)
+        self.queued -= 1
+        if not waiters:
+            del connections[connection]
+
+    def _schedule(self):
+        if self._call is None:
+            self._call = self.reactor.callLater(0, self._run)
+
+    def _run(self):
+        self._call = None
+        self._budget = self.quantum
+        while self.queued and self.active < self.concurrency and \
+                self._budget > 0:
+            self._next().callback(None)
+        if self.queued and self.active < self.concurrency:
+            self._schedule()
+
+    def _next(self):
+        """
+        Dequeues the next waiter: the highest priority class, the connection
+        that has waited longest within it.
+        """
+        for priority in self._priorities:
+            connections = self._classes[priority]
+            if connections:
+                connection, waiters = connections.popitem(last=False)
+                d = waiters.popleft()
+                if waiters:
+                    connections[connection] = waiters
+                self.queued -= 1
+                self._grant()
+                return d
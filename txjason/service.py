@@ -81,31 +81,164 @@ Example:
         # Send back results.
         my_socket.send(result)
 """
+import collections
+import inspect
+import itertools
 import types
-import json
 
 from twisted.application import service
-from twisted.internet import defer, reactor
-from twisted.python import log
+from twisted.internet import defer, reactor, task
+from twisted.python import failure, log
 
+from txjason import codec as _codec, interceptor as _interceptor, \
+    metrics as _metrics, stream as _stream, \
+    dataloader as _dataloader, trace as _trace, errorlog as _errorlog
 
 DEFAULT_JSONRPC = '2.0'
 
+# Notification sent by clients to cancel one of their pending requests.
+CANCEL = 'txjason.cancel'
+
+def _validId(id):
+    """
+    Returns True if ``id`` has a type allowed for request ids.
+    """
+    return id is None or isinstance(id, (basestring, int, long, float))
+
+
+_getargspec = getattr(inspect, 'getfullargspec', None) or inspect.getargspec
+
+
+def _unwrap(f):
+    """
+    Returns (function, bound) for a callable, following decorators that set
+    __wrapped__ and looking through bound methods and callable instances.
+    Returns (None, False) if the callable cannot be introspected.
+    """
+    bound = False
+    for i in range(100):
+        if isinstance(f, types.MethodType):
+            if f.__self__ is not None:
+                bound = True
+            f = f.__func__
+        elif getattr(f, '__wrapped__', None) is not None:
+            f = f.__wrapped__
+        elif isinstance(f, types.FunctionType):
+            return f, bound
+        elif hasattr(f, '__call__') and not isinstance(f, type):
+            f = f.__call__
+        else:
+            break
+    return None, False
+
+
+def positional_args(f):
+    """
+    Returns (mandatory, maximum) numbers of positional arguments accepted by
+    callable ``f``. ``maximum`` is None if ``f`` takes variadic positional
+    arguments; both are None if ``f`` cannot be introspected.
+    """
+    func, bound = _unwrap(f)
+    if func is None:
+        return None, None
+    spec = _getargspec(func)
+    args, varargs, defaults = spec[0], spec[1], spec[3]
+    maximum = len(args) - bound
+    mandatory = maximum - len(defaults or ())
+    if varargs is not None:
+        maximum = None
+    return max(mandatory, 0), maximum
+
+
+def estimateSize(obj, limit):
+    """
+    Returns a rough estimate of the encoded size of ``obj``, or ``limit`` as
+    soon as the estimate reaches it, so that the cost is bounded by ``limit``
+    rather than by the size of ``obj``.
+    """
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, basestring):
+            size += len(obj) + 2
+        elif isinstance(obj, dict):
+            # Every item takes at least a few bytes.
+            size += 2 + 4 * len(obj)
+            if size >= limit:
+                return limit
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            size += 2 + len(obj)
+            if size >= limit:
+                return limit
+            stack.extend(obj)
+        else:
+            size += 8
+        if size >= limit:
+            return limit
+    return size
+
 
 class JSONRPCService(object):
     """
     The JSONRPCService class is a JSON-RPC
     """
 
-    def __init__(self, timeout=None, reactor=reactor):
+    def __init__(self, timeout=None, reactor=reactor, scheduler=None,
+                 cancelOnDisconnect=False, batchQuantum=None,
+                 maxBatchSize=None, memoryBudget=None, slowLog=None,
+                 tracer=None, errorReporter=None):
         self.method_data = {}
         self.serve_exception = None
         self.out_of_service_deferred = None
         self.pending = set()
+        # connection -> {request id (or the Deferred, for notifications):
+        #                (Deferred, request, start time)}
+        self.connections = {}
         self.timeout = timeout
         self.reactor = reactor
-
-    def add(self, f, name=None, types=None, required=None):
+        self.metrics = _metrics.MetricsRegistry()
+        self.scheduler = scheduler
+        self.cancelOnDisconnect = cancelOnDisconnect
+        # Batches larger than maxBatchSize are rejected. Batches larger than
+        # batchQuantum are started batchQuantum requests per reactor turn.
+        self.batchQuantum = batchQuantum
+        self.maxBatchSize = maxBatchSize
+        self._cooperator = None
+        if batchQuantum is not None:
+            self._cooperator = task.Cooperator(
+                terminationPredicateFactory=self._quantum,
+                scheduler=lambda f: self.reactor.callLater(0, f))
+        # Bytes of the requests and responses being handled. Requests that
+        # do not fit in memoryBudget wait until enough of it is released.
+        self.memoryBudget = memoryBudget
+        self.memoryUsage = 0
+        self._memoryQueue = collections.deque()
+        self._memoryWaiters = []
+        self._memoryGauge = self.metrics.gauge('memory_usage')
+        self._memoryRejected = self.metrics.counter('memory_rejected')
+        # A txjason.slowlog.SlowLog recording the stage timings of sampled
+        # calls.
+        self.slowLog = slowLog
+        # A txjason.trace.Tracer recording spans for traced requests.
+        self.tracer = tracer
+        # Exceptions raised by methods are handed to errorReporter (see
+        # txjason.errorlog).
+        if errorReporter is None:
+            errorReporter = _errorlog.ErrorReporter()
+        self.errorReporter = errorReporter
+        self._cancelled = self.metrics.counter(
+            'requests_cancelled', reason='disconnect')
+        self._clientCancelled = self.metrics.counter(
+            'requests_cancelled', reason='client')
+        self._savedSeconds = self.metrics.counter('cancelled_seconds_saved')
+        self.interceptors = []
+        self._compileInterceptors()
+
+    def add(self, f, name=None, types=None, required=None, priority=0,
+            stream=False):
         """
         Adds a new method to the jsonrpc service.
 
@@ -114,6 +247,9 @@ class JSONRPCService(object):
         name -- name of the method in the jsonrpc service
         types -- list or dictionary of the types of accepted arguments
         required -- list of required keyword arguments
+        priority -- scheduling priority (see txjason.scheduler), higher first
+        stream -- whether f returns an iterator of chunks to stream (see
+                  txjason.stream) instead of a result
 
         If name argument is not given, function's own name will be used.
 
@@ -128,7 +264,10 @@ class JSONRPCService(object):
         else:
             fname = name
 
-        self.method_data[fname] = {'method': f}
+        self.method_data[fname] = {'method': f,
+                                   'args': positional_args(f),
+                                   'priority': priority,
+                                   'stream': stream}
 
         if types is not None:
             self.method_data[fname]['types'] = types
@@ -136,6 +275,81 @@ class JSONRPCService(object):
             if required is not None:
                 self.method_data[fname]['required'] = required
 
+    def dataLoader(self, batchLoad, **kwargs):
+        """
+        Returns a txjason.dataloader.DataLoader for ``batchLoad`` that uses
+        this service's reactor. Keyword arguments are passed to DataLoader.
+        """
+        kwargs.setdefault('reactor', self.reactor)
+        return _dataloader.DataLoader(batchLoad, **kwargs)
+
+    def addInterceptor(self, interceptor):
+        """
+        Adds a txjason.interceptor.Interceptor. Interceptors run in the order
+        they were added; for aroundCall the first added is the outermost.
+        """
+        self.interceptors.append(interceptor)
+        self._compileInterceptors()
+
+    def _compileInterceptors(self):
+        interceptors = self.interceptors
+        self._beforeParse = _interceptor.hooks(interceptors, 'beforeParse')
+        self._afterParse = _interceptor.hooks(interceptors, 'afterParse')
+        self._beforeSerialize = _interceptor.hooks(
+            interceptors, 'beforeSerialize')
+        around = _interceptor.hooks(interceptors, 'aroundCall')
+        if around:
+            call = _interceptor.chain(around, self._call_method)
+            self._invoke = lambda request: self._intercept(call, request)
+        else:
+            self._invoke = self._call_method
+        if self.scheduler is not None:
+            self._start = self._schedule
+        else:
+            self._start = self._invoke
+
+    def _schedule(self, request):
+        """
+        Waits for the scheduler to admit the request, then invokes it.
+        """
+        scheduler = self.scheduler
+        d = scheduler.acquire(
+            self.method_data[request['method']]['priority'],
+            request['connection'])
+
+        def release(result):
+            scheduler.release()
+            return result
+        d.addCallback(lambda ign: self._invoke(request).addBoth(release))
+        return d
+
+    def _intercept(self, call, request):
+        d = defer.maybeDeferred(call, request)
+        d.addErrback(self._interceptorError)
+        return d
+
+    def _interceptorError(self, failure):
+        if failure.check(JSONRPCError, defer.CancelledError):
+            return failure
+        log.err(failure, 'Exception raised by a JSON-RPC interceptor')
+        raise ServerError
+
+    def _runHook(self, hook, value):
+        try:
+            return hook(value)
+        except JSONRPCError:
+            raise
+        except Exception:
+            log.err(None, 'Exception raised by a JSON-RPC interceptor')
+            raise ServerError
+
+    def _get_hook_err(self, e):
+        """
+        Returns the error response for an exception raised where the request
+        id is unknown, e.g. by a beforeParse or beforeSerialize hook.
+        """
+        return {'jsonrpc': DEFAULT_JSONRPC, 'id': None, 'error': e.dumps()}
+
     def stopServing(self, exception=None):
         """
         Returns a deferred that will fire immediately if there are
@@ -159,23 +373,218 @@ class JSONRPCService(object):
         for i in pending:
             i.cancel()
 
-    @defer.inlineCallbacks
-    def call(self, jsondata):
+    def connectionLost(self, connection):
+        """
+        Forgets the requests running for ``connection``, and cancels them if
+        cancelOnDisconnect is set. Each cancellation is counted in the
+        requests_cancelled metric. The time it saved is estimated from the
+        method's average duration and added to cancelled_seconds_saved.
+        """
+        self._dropReservations(connection)
+        inflight = self.connections.pop(connection, None)
+        if not inflight or not self.cancelOnDisconnect:
+            return
+        now = self.reactor.seconds()
+        for d, request, start in inflight.values():
+            average = self.method_data[request['method']].get('duration', 0)
+            self._cancelled.inc()
+            self._savedSeconds.inc(max(0, average - (now - start)))
+            d.cancel()
+
+    def cancelRequest(self, connection, id):
+        """
+        Cancels the pending request ``id`` from ``connection`` without
+        responding to it. Returns False if there is no such request.
+        """
+        inflight = self.connections.get(connection)
+        if not inflight or not _validId(id) or id not in inflight:
+            return False
+        d, request, start = inflight[id]
+        request['cancelled'] = True
+        self._clientCancelled.inc()
+        d.cancel()
+        return True
+
+    def overBudget(self):
+        """
+        Returns True if memory usage has reached memoryBudget or requests are
+        waiting for memory. Protocols stop reading while it is.
+        """
+        return self.memoryBudget is not None and (
+            self.memoryUsage >= self.memoryBudget or bool(self._memoryQueue))
+
+    def whenMemoryAvailable(self):
+        """
+        Returns a Deferred that fires once overBudget() is False.
+        """
+        if not self.overBudget():
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self._memoryWaiters.append(d)
+        return d
+
+    def holdMemory(self, size):
+        """
+        Counts ``size`` more bytes against memoryBudget, even if that goes
+        over it, until they are given back with releaseMemory. Protocols hold
+        the responses their transports have not been able to send yet.
+        Does nothing without a memoryBudget.
+        """
+        if self.memoryBudget is not None:
+            self._useMemory(size)
+
+    def releaseMemory(self, size):
+        """
+        Gives back ``size`` bytes held with holdMemory.
+        """
+        if self.memoryBudget is not None:
+            self._releaseMemory(size)
+
+    def _useMemory(self, size):
+        self.memoryUsage += size
+        self._memoryGauge.set(self.memoryUsage)
+
+    def _reserveMemory(self, size, connection=None):
+        """
+        Returns a Deferred that fires once ``size`` bytes have been reserved.
+        Reservations are granted in the order they were asked for; those
+        still waiting when ``connection`` is lost are cancelled.
+        """
+        if self.memoryBudget is None or (
+                not self._memoryQueue and
+                self.memoryUsage + size <= self.memoryBudget):
+            self._useMemory(size)
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self._memoryQueue.append((size, d, connection))
+        return d
+
+    def _dropReservations(self, connection):
+        if not self._memoryQueue:
+            return
+        dropped = [r for r in self._memoryQueue if r[2] is connection]
+        if not dropped:
+            return
+        self._memoryQueue = collections.deque(
+            r for r in self._memoryQueue if r[2] is not connection)
+        for size, d, owner in dropped:
+            d.cancel()
+        # The requests behind them may fit now.
+        self._releaseMemory(0)
+
+    def _releaseMemory(self, size):
+        self._useMemory(-size)
+        if self.memoryBudget is None:
+            return
+        queue = self._memoryQueue
+        while queue and self.memoryUsage + queue[0][0] <= self.memoryBudget:
+            size, d, connection = queue.popleft()
+            self._useMemory(size)
+            d.callback(None)
+        if self._memoryWaiters and not self.overBudget():
+            waiters, self._memoryWaiters = self._memoryWaiters, []
+            for d in waiters:
+                d.callback(None)
+
+    def call(self, jsondata, codec=None, connection=None):
         """
         Calls jsonrpc service's method and returns its return value in a JSON
         string or None if there is none.
 
         Arguments:
         jsondata -- remote method call in jsonrpc format
+        codec -- the txjason.codec used to decode the call and encode its
+                 result, JSON by default
+        connection -- the protocol the call arrived on, if any; available to
+                      interceptors as request['connection']
+
+        With a memoryBudget, the call waits until its size fits in the
+        budget, and calls larger than the whole budget are rejected.
         """
-        result = yield self.call_py(jsondata)
-        if result is None:
-            defer.returnValue(None)
+        if codec is None:
+            codec = _codec.JSON
+        timing = tracing = None
+        if self.slowLog is not None:
+            timing = self.slowLog.start(len(jsondata), connection)
+        if self.tracer is not None:
+            tracing = self.tracer.begin(jsondata)
+        budget = self.memoryBudget
+        if budget is None:
+            # Without a budget, slow log or tracer nothing needs to happen
+            # around call_py, and synchronous methods are answered without
+            # any further Deferreds.
+            d = self.call_py(jsondata, codec, connection, timing, tracing)
+            d.addCallback(self._serialize, codec, timing, tracing)
         else:
-            defer.returnValue(json.dumps(result))
+            size = len(jsondata)
+            if size > budget:
+                self._memoryRejected.inc()
+                return defer.succeed(codec.dumps(self._get_hook_err(
+                    MemoryBudgetError(budget))))
+            d = self._reserveMemory(size, connection)
+            d.addCallbacks(self._reserved, self._notReserved, callbackArgs=(
+                size, jsondata, codec, connection, timing, tracing))
+        if timing is not None or tracing is not None:
+            d.addBoth(self._callDone, timing, tracing)
+        return d
+
+    def _serialize(self, result, codec, timing, tracing):
+        """
+        Encodes the result of call_py, after the beforeSerialize hooks.
+        """
+        if result is None:
+            return None
+        try:
+            for hook in self._beforeSerialize:
+                result = self._runHook(hook, result)
+        except JSONRPCError, e:
+            result = self._get_hook_err(e)
+        # Account for the response until it has been encoded; the encoded
+        # bytes are held by the protocol while its transport cannot take
+        # them (see holdMemory).
+        size = 0
+        if self.memoryBudget is not None:
+            size = estimateSize(result, self.memoryBudget)
+            self._useMemory(size)
+        if tracing is not None:
+            tracing.serializing = self.tracer.clock()
+        try:
+            data = codec.dumps(result)
+        finally:
+            if size:
+                self._releaseMemory(size)
+        if timing is not None:
+            timing.serialized = timing.clock()
+        if tracing is not None:
+            tracing.serialized = self.tracer.clock()
+        return data
+
+    def _reserved(self, ign, size, jsondata, codec, connection, timing,
+                  tracing):
+        d = self.call_py(jsondata, codec, connection, timing, tracing)
+        d.addCallback(self._serialize, codec, timing, tracing)
+        d.addBoth(self._released, size)
+        return d
+
+    def _notReserved(self, failure):
+        # The connection was lost while the call waited for memory.
+        failure.trap(defer.CancelledError)
+        return None
+
+    def _released(self, result, size):
+        self._releaseMemory(size)
+        return result
+
+    def _callDone(self, result, timing, tracing):
+        if timing is not None:
+            self.slowLog.finish(timing)
+        if tracing is not None:
+            self.tracer.finish(tracing)
+        return result
 
     @defer.inlineCallbacks
-    def call_py(self, jsondata):
+    def call_py(self, jsondata, codec=None, connection=None, timing=None,
+                tracing=None):
         """
         Calls jsonrpc service's method and returns its return value in python
         object format or None if there is none.
@@ -184,17 +593,34 @@ class JSONRPCService(object):
         object instead of JSON string. This method is mainly only useful for
         debugging purposes.
         """
+        if codec is None:
+            codec = _codec.JSON
+        try:
+            for hook in self._beforeParse:
+                jsondata = self._runHook(hook, jsondata)
+        except JSONRPCError, e:
+            defer.returnValue(self._get_hook_err(e))
         try:
             try:
-                rdata = json.loads(jsondata)
+                rdata = codec.loads(jsondata)
             except ValueError:
                 raise ParseError
         except ParseError, e:
             defer.returnValue(self._get_err(e))
             return
+        if timing is not None:
+            timing.parsed = timing.clock()
+        if tracing is not None:
+            tracing.parsed = self.tracer.clock()
+
+        if isinstance(rdata, dict) and rdata.get('method') == CANCEL:
+            params = rdata.get('params')
+            if isinstance(params, list) and len(params) == 1:
+                self.cancelRequest(connection, params[0])
+            defer.returnValue(None)
 
         # set some default values for error handling
-        request = self._get_default_vals()
+        request = self._get_default_vals(connection, timing, tracing)
 
         try:
             if isinstance(rdata, dict) and rdata:
@@ -210,40 +636,26 @@ class JSONRPCService(object):
                 return
             elif isinstance(rdata, list) and rdata:
                 # It's a batch.
-                requests = []
+                if self.maxBatchSize is not None and \
+                        len(rdata) > self.maxBatchSize:
+                    defer.returnValue(self._get_hook_err(
+                        BatchTooLargeError(self.maxBatchSize)))
                 responds = []
+                results = []
+                batch = self._start_batch(
+                    rdata, connection, responds, results, timing, tracing)
+                if self._cooperator is not None and \
+                        len(rdata) > self.batchQuantum:
+                    yield self._cooperator.coiterate(batch)
+                else:
+                    for _ in batch:
+                        pass
 
-                for rdata_ in rdata:
-                    # set some default values for error handling
-                    request_ = self._get_default_vals()
-                    try:
-                        self._fill_request(request_, rdata_)
-                    except InvalidRequestError, e:
-                        err = self._get_err(e, request_['id'])
-                        if err:
-                            responds.append(err)
-                        continue
-                    except JSONRPCError, e:
-                        err = self._get_err(e, request_['id'])
-                        if err:
-                            responds.append(err)
-                        continue
-
-                    requests.append(request_)
-
-                for request_ in requests:
-                    try:
-                        # TODO: We should use a deferred list so requests
-                        #       are processed in parallel
-                        respond = yield self._handle_request(request_)
-                    except JSONRPCError, e:
-                        respond = self._get_err(e,
-                                                request_['id'],
-                                                request_['jsonrpc'])
-
-                    # Don't respond to notifications
-                    if respond is not None:
-                        responds.append(respond)
+                # Process the requests in parallel.
+                results = yield self._gather_batch(results)
+                # Don't respond to notifications
+                responds.extend(
+                    respond for respond in results if respond is not None)
 
                 if responds:
                     defer.returnValue(responds)
@@ -262,6 +674,68 @@ class JSONRPCService(object):
                                             request['id'],
                                             request['jsonrpc']))
 
+    def _start_batch(self, rdata, connection, responds, results,
+                     timing=None, tracing=None):
+        """
+        Validates and starts each request of a batch, appending errors to
+        responds and (request, Deferred) to results. Yields after each
+        request, so that a large batch can be started in chunks.
+        """
+        for rdata_ in rdata:
+            # set some default values for error handling
+            request_ = self._get_default_vals(connection, timing, tracing)
+            try:
+                self._fill_request(request_, rdata_)
+            except InvalidRequestError, e:
+                err = self._get_err(e, request_['id'])
+                if err:
+                    responds.append(err)
+            except JSONRPCError, e:
+                err = self._get_err(e, request_['id'])
+                if err:
+                    responds.append(err)
+            else:
+                results.append((request_, self._handle_request(request_)))
+            yield None
+
+    def _quantum(self):
+        """
+        Termination predicate for the batch Cooperator: ends a reactor turn
+        after batchQuantum requests have been started.
+        """
+        steps = itertools.count(1)
+        return lambda: next(steps) >= self.batchQuantum
+
+    def _gather_batch(self, started):
+        """
+        Returns a Deferred firing with the responses to the (request,
+        Deferred) pairs of a batch, in order, with JSONRPCErrors turned into
+        error responses. Any other failure fails the whole batch, like
+        gatherResults, but with one callback per request instead of two.
+        """
+        responds = [None] * len(started)
+        remaining = [len(started)]
+        done = defer.Deferred()
+
+        def finished(result, i, request):
+            if isinstance(result, failure.Failure):
+                if not result.check(JSONRPCError):
+                    if not done.called:
+                        done.errback(result)
+                    return None
+                result = self._get_err(result.value, request['id'],
+                                       request['jsonrpc'])
+            responds[i] = result
+            remaining[0] -= 1
+            if not remaining[0] and not done.called:
+                done.callback(responds)
+
+        for i, (request, d) in enumerate(started):
+            d.addBoth(finished, i, request)
+        if not started:
+            done.callback(responds)
+        return done
+
     def _get_err(self, e, id=None, jsonrpc=DEFAULT_JSONRPC):
         """
         Returns jsonrpc error message.
@@ -299,40 +773,6 @@ class JSONRPCService(object):
         if iver == 11:
             respond['version'] = '1.1'
 
-    def _vargs(self, f):
-        """
-        Returns True if given function accepts variadic positional arguments,
-        otherwise False.
-        """
-        if f.func_code.co_flags & 4:
-            return True
-
-        return False
-
-    def _man_args(self, f):
-        """
-        Returns number of mandatory arguments required by given function.
-        """
-        argcount = f.func_code.co_argcount
-
-        # account for "self" getting passed to class instance methods
-        if isinstance(f, types.MethodType):
-            argcount -= 1
-
-        if f.func_defaults is None:
-            return argcount
-
-        return argcount - len(f.func_defaults)
-
-    def _max_args(self, f):
-        """
-        Returns maximum number of arguments accepted by given function.
-        """
-        if f.func_defaults is None:
-            return f.func_code.co_argcount
-
-        return f.func_code.co_argcount + len(f.func_defaults)
-
     def _get_jsonrpc(self, rdata):
         """
         Returns jsonrpc request's jsonrpc value.
@@ -362,11 +802,7 @@ class JSONRPCService(object):
         InvalidRequestError will be raised if the id value has invalid type.
         """
         if 'id' in rdata:
-            if isinstance(rdata['id'], basestring) or \
-                    isinstance(rdata['id'], int) or \
-                    isinstance(rdata['id'], long) or \
-                    isinstance(rdata['id'], float) or \
-                    rdata['id'] is None:
+            if _validId(rdata['id']):
                 return rdata['id']
             else:
                 # invalid type
@@ -418,44 +854,109 @@ class JSONRPCService(object):
         request['id'] = self._get_id(rdata)
         request['method'] = self._get_method(rdata)
         request['params'] = self._get_params(rdata)
+        request['stream'] = rdata.get(_stream.STREAM) is True
+        tracing = request.get('tracing')
+        if tracing is not None:
+            trace = request['trace'] = tracing.adopt(rdata.get(_trace.TRACE))
+            if trace is not None:
+                trace.method = request['method']
 
     @defer.inlineCallbacks
     def _call_method(self, request):
         """Calls given method with given params and returns it value."""
-        method = self.method_data[request['method']]['method']
+        timing = request.get('timing')
+        if timing is not None and timing.started is None:
+            timing.started = timing.clock()
+        trace = request.get('trace')
+        if trace is not None:
+            trace.started = trace.clock()
+        method_data = self.method_data[request['method']]
+        method = method_data['method']
+        mandatory, maximum = method_data['args']
         params = request['params']
         result = None
         try:
             if isinstance(params, list):
                 # Does it have enough arguments?
-                if len(params) < self._man_args(method):
+                if mandatory is not None and len(params) < mandatory:
                     raise InvalidParamsError('not enough arguments')
                 # Does it have too many arguments?
-                if not self._vargs(method) \
-                        and len(params) > self._max_args(method):
+                if maximum is not None and len(params) > maximum:
                     raise InvalidParamsError('too many arguments')
 
-                result = yield defer.maybeDeferred(method, *params)
+                running = defer.maybeDeferred(method, *params)
             elif isinstance(params, dict):
                 # Do not accept keyword arguments if the jsonrpc version is
                 # not >=1.1.
                 if request['jsonrpc'] < 11:
                     raise KeywordError
 
-                result = yield defer.maybeDeferred(method, **params)
+                running = defer.maybeDeferred(method, **params)
             else:  # No params
-                result = yield defer.maybeDeferred(method)
-        except JSONRPCError:
+                running = defer.maybeDeferred(method)
+            # Kept so that cancelling the request cancels the method's own
+            # Deferred (see _cancellable).
+            request['running'] = running
+            result = yield running
+            if method_data['stream']:
+                result = yield self._stream(request, result)
+        except (JSONRPCError, defer.CancelledError):
             raise
         except Exception:
             # Exception was raised inside the method.
-            log.msg('Exception raised while invoking RPC method "{}".'.format(
-                    request['method']))
-            log.err()
+            self.errorReporter.report(request['method'], failure.Failure())
             raise ServerError
 
         defer.returnValue(result)
 
+    def _stream(self, request, chunks):
+        """
+        Sends the chunks returned by a streaming method to the connection if
+        the client asked for a stream, or else collects them into a list.
+        """
+        connection = request['connection']
+        if request['stream'] and request['id'] is not None and \
+                getattr(connection, 'sendChunk', None) is not None:
+            return _stream.send(connection, request, chunks)
+        return _stream.collect(chunks)
+
+    def _track(self, request, d):
+        connection = request['connection']
+        inflight = self.connections.get(connection)
+        if inflight is None:
+            inflight = self.connections[connection] = {}
+        key = request['id'] if request['id'] is not None else d
+        inflight[key] = (d, request, self.reactor.seconds())
+
+    def _finished(self, request, d, completed=False):
+        self._remove_pending(d)
+        timing = request.get('timing')
+        if timing is not None:
+            timing.finished = timing.clock()
+        trace = request.get('trace')
+        if trace is not None:
+            trace.finished = trace.clock()
+        connection = request['connection']
+        if connection is None:
+            return
+        inflight = self.connections.get(connection)
+        key = request['id'] if request['id'] is not None else d
+        if inflight is None or key not in inflight or inflight[key][0] is not d:
+            return
+        start = inflight.pop(key)[2]
+        if not inflight:
+            del self.connections[connection]
+        if completed:
+            # Keep a moving average of each method's duration, to estimate
+            # the time saved by cancelling it.
+            method_data = self.method_data[request['method']]
+            duration = self.reactor.seconds() - start
+            average = method_data.get('duration')
+            if average is None:
+                method_data['duration'] = duration
+            else:
+                method_data['duration'] = average + (duration - average) / 8
+
     def _remove_pending(self, d):
         self.pending.remove(d)
         if self.out_of_service_deferred and not self.pending:
@@ -464,13 +965,24 @@ class JSONRPCService(object):
     @defer.inlineCallbacks
     def _handle_request(self, request):
         """Handles given request and returns its response."""
+        for hook in self._afterParse:
+            self._runHook(hook, request)
         if 'types' in self.method_data[request['method']]:
             self._validate_params_types(request['method'], request['params'])
+        timing = request.get('timing')
+        if timing is not None:
+            timing.methods.append(request['method'])
+            if timing.validated is None:
+                timing.validated = timing.clock()
 
         if self.serve_exception:
             raise self.serve_exception()
-        d = self._call_method(request)
+        d = self._start(request)
+        if not d.called:
+            d = self._cancellable(request, d)
         self.pending.add(d)
+        if request['connection'] is not None:
+            self._track(request, d)
         if self.timeout:
             timeout_deferred = self.reactor.callLater(self.timeout, d.cancel)
 
@@ -487,12 +999,16 @@ class JSONRPCService(object):
         except defer.CancelledError:
             # The request was cancelled due to a timeout or by cancelPending
             # having been called. We return a TimeoutError to the client.
-            self._remove_pending(d)
+            request['abandoned'] = True
+            self._finished(request, d)
+            if request.get('cancelled'):
+                # Cancelled by the client, which no longer wants a response.
+                defer.returnValue(None)
             raise TimeoutError()
         except Exception as e:
-            self._remove_pending(d)
+            self._finished(request, d)
             raise e
-        self._remove_pending(d)
+        self._finished(request, d, completed=True)
         # Do not respond to notifications.
         if request['id'] is None:
             defer.returnValue(None)
@@ -504,12 +1020,36 @@ class JSONRPCService(object):
 
         defer.returnValue(respond)
 
-    def _get_default_vals(self):
+    def _cancellable(self, request, started):
+        """
+        Returns a Deferred for the result of ``started`` whose cancellation
+        (on timeout, disconnect, cancelPending or a cancel notification) also
+        cancels the Deferred returned by the method. Cancelling the
+        inlineCallbacks Deferred of _call_method alone does not reach it.
+        """
+        def cancel(d):
+            request['abandoned'] = True
+            running = request.get('running')
+            if running is not None and not running.called:
+                running.cancel()
+            started.cancel()
+
+        def deliver(result):
+            # d may already have been cancelled.
+            if not d.called:
+                d.callback(result)
+        d = defer.Deferred(cancel)
+        started.addBoth(deliver)
+        return d
+
+    def _get_default_vals(self, connection=None, timing=None, tracing=None):
         """
         Returns dictionary containing default jsonrpc request/responds values
         for error handling purposes.
         """
-        return {"jsonrpc": DEFAULT_JSONRPC, "id": None}
+        return {"jsonrpc": DEFAULT_JSONRPC, "id": None,
+                "connection": connection, "timing": timing,
+                "tracing": tracing, "trace": None}
 
     def _validate_params_types(self, method, params):
         """
@@ -689,6 +1229,42 @@ class ServiceUnavailableError(JSONRPCError):
     message = 'Service Unavailable'
 
 
+class RateLimitedError(JSONRPCError):
+    """The client has exceeded its request rate."""
+    code = -32096
+    message = 'Rate limit exceeded'
+
+    def __init__(self, retryAfter=None):
+        if retryAfter is not None:
+            self.data = {'retryAfter': retryAfter}
+
+
+class OverloadedError(JSONRPCError):
+    """The server is at its concurrency limit."""
+    code = -32095
+    message = 'Server overloaded'
+
+
+class MemoryBudgetError(JSONRPCError):
+    """The request is larger than the service's memory budget."""
+    code = -32093
+    message = 'Request too large'
+
+    def __init__(self, memoryBudget=None):
+        if memoryBudget is not None:
+            self.data = {'memoryBudget': memoryBudget}
+
+
+class BatchTooLargeError(JSONRPCError):
+    """The batch has more requests than the service accepts."""
+    code = -32094
+    message = 'Batch too large'
+
+    def __init__(self, maxBatchSize=None):
+        if maxBatchSize is not None:
+            self.data = {'maxBatchSize': maxBatchSize}
+
+
 class ServerError(JSONRPCError):
     """Generic server error."""
     code = -32000
@@ -0,0 +1,114 @@
+"""
+Stage timings and a log of slow requests.
+
+Give a JSONRPCService a SlowLog and a sample of the calls it handles record
+when they reach each stage:
+
+- received: the call arrived;
+- parsed: it has been decoded (including any wait for the memory budget or
+  the thread pool);
+- validated: its parameters have been checked;
+- started: its handler was called (the time in between was spent waiting
+  in the scheduler or the reactor);
+- finished: its handler's result was available;
+- serialized: the response has been encoded.
+
+Sampled calls taking at least ``threshold`` seconds are logged with their
+method, payload size, connection and the time spent in each stage, and kept
+in ``entries``. Calls that are not sampled record nothing, so the log can
+stay enabled in production with a small ``sampleRate``:
+
+    factory = JSONRPCServerFactory(slowLog=SlowLog(threshold=0.5,
+                                                   sampleRate=0.01))
+
+For a batch, the timings cover the whole batch: validated and started are
+those of its first request, finished that of its last.
+"""
+import collections
+import random
+import time
+
+from twisted.python import log
+
+
+STAGES = ('parse', 'validate', 'queue', 'handler', 'serialize')
+
+
+class Timing(object):
+    """
+    The stage timestamps of one sampled call.
+    """
+    __slots__ = ('clock', 'size', 'connection', 'methods', 'received',
+                 'parsed', 'validated', 'started', 'finished', 'serialized')
+
+    def __init__(self, clock, size, connection):
+        self.clock = clock
+        self.size = size
+        self.connection = connection
+        self.methods = []
+        self.received = clock()
+        self.parsed = self.validated = self.started = None
+        self.finished = self.serialized = None
+
+    def durations(self):
+        """
+        Returns the seconds spent in each of STAGES, and the total. Stages
+        the call did not reach (e.g. because it failed) take no time.
+        """
+        marks = (self.received, self.parsed, self.validated, self.started,
+                 self.finished, self.serialized)
+        durations = {}
+        last = self.received
+        for stage, mark in zip(STAGES, marks[1:]):
+            if mark is None:
+                mark = last
+            durations[stage] = max(0, mark - last)
+            last = mark
+        return durations, last - self.received
+
+
+class SlowLog(object):
+    def __init__(self, threshold=1.0, sampleRate=1.0, maxEntries=100,
+                 clock=None):
+        if clock is None:
+            clock = getattr(time, 'monotonic', time.time)
+        self.threshold = threshold
+        self.sampleRate = sampleRate
+        self.clock = clock
+        self.entries = collections.deque(maxlen=maxEntries)
+        self._random = random.random
+
+    def start(self, size, connection):
+        """
+        Returns a Timing for a call of ``size`` bytes if it is sampled, or
+        None.
+        """
+        if self.sampleRate < 1 and self._random() >= self.sampleRate:
+            return None
+        return Timing(self.clock, size, connection)
+
+    def finish(self, timing):
+        """
+        Logs the call if it took at least ``threshold`` seconds.
+        """
+        durations, total = timing.durations()
+        if total < self.threshold:
+            return
+        entry = {'methods': timing.methods, 'size': timing.size,
+                 'connection': _describe(timing.connection),
+                 'total': total, 'stages': durations}
+        self.entries.append(entry)
+        log.msg('Slow JSON-RPC request: %s, %d bytes from %s, %.3fs (%s)' % (
+            ','.join(timing.methods) or '-', timing.size, entry['connection'],
+            total, ' '.join('%s=%.3f' % (stage, durations[stage])
+                            for stage in STAGES)))
+
+
+def _describe(connection):
+    transport = getattr(connection, 'transport', None)
+    if transport is not None:
+        try:
+            return str(transport.getPeer())
+        except Exception:
+            pass
+    return repr(connection)
@@ -0,0 +1,187 @@
+"""
+Streamed results for methods that produce many chunks.
+
+A streaming method is added with ``service.add(f, stream=True)`` or
+``@exportRPC(stream=True)``. It returns an iterator of chunks (e.g. a
+generator, which may yield Deferreds) instead of a result. Each chunk is sent as a ``txjason.stream`` notification whose params
+are the request id and the chunk, and the response that ends the stream has
+the number of chunks as its result:
+
+    {"jsonrpc": "2.0", "method": "txjason.stream", "params": [1, chunk]}
+    {"jsonrpc": "2.0", "id": 1, "result": 2}
+
+Chunks are only streamed to clients that ask for it by setting the
+``txjason.stream`` member of the request to true. Other clients get a normal
+response with the list of chunks as its result.
+
+The next chunk is only produced once the connection's transport can take
+more data, so a slow reader pauses the method. Clients get the chunks from a
+ChunkStream (see JSONRPCClientFactory.callRemoteStream), which stops reading
+from the connection while too many chunks are waiting to be consumed.
+"""
+import collections
+
+from twisted.internet import defer, error
+
+
+STREAM = 'txjason.stream'
+
+_END = object()
+
+
+def _iterate(chunks):
+    """
+    Returns a function returning a Deferred that fires with the next of
+    ``chunks``, or _END when there are no more.
+    """
+    it = iter(chunks)
+
+    def next_():
+        try:
+            chunk = next(it)
+        except StopIteration:
+            return defer.succeed(_END)
+        except:
+            return defer.fail()
+        if isinstance(chunk, defer.Deferred):
+            return chunk
+        return defer.succeed(chunk)
+    return next_
+
+
+def _close(chunks):
+    close = getattr(chunks, 'close', None)
+    if close is not None:
+        close()
+
+
+@defer.inlineCallbacks
+def send(connection, request, chunks):
+    """
+    Sends ``chunks`` to ``connection`` with its ``sendChunk`` method, waiting
+    for the Deferred it returns before producing the next one. Returns a
+    Deferred firing with the number of chunks sent. Stops early if the
+    connection is lost or the request is abandoned (timed out or
+    cancelled).
+    """
+    next_ = _iterate(chunks)
+    count = 0
+    try:
+        while not request.get('abandoned'):
+            chunk = yield next_()
+            if chunk is _END or request.get('abandoned'):
+                break
+            try:
+                yield connection.sendChunk(request['id'], chunk)
+            except error.ConnectionDone:
+                # Nobody is left to read the rest.
+                break
+            count += 1
+    finally:
+        _close(chunks)
+    defer.returnValue(count)
+
+
+@defer.inlineCallbacks
+def collect(chunks):
+    """
+    Returns a Deferred firing with the list of ``chunks``, for requests that
+    did not ask for a stream.
+    """
+    next_ = _iterate(chunks)
+    result = []
+    while True:
+        chunk = yield next_()
+        if chunk is _END:
+            break
+        result.append(chunk)
+    defer.returnValue(result)
+
+
+class ChunkStream(object):
+    """
+    The chunks of a streamed result, as returned by callRemoteStream.
+
+    Iterating over a ChunkStream yields the chunks received so far. ``wait``
+    returns a Deferred that fires with True once chunks are available, or
+    with False once the stream has ended and every chunk has been consumed:
+
+        stream = client.callRemoteStream('db.rows')
+        while (yield stream.wait()):
+            for row in stream:
+                process(row)
+
+    If the call fails, ``wait`` fails with the error once the chunks received
+    before it have been consumed. Once the stream has ended, ``result`` is
+    the final result (the number of chunks). Reading from the connection is
+    paused while more than ``maxBuffered`` chunks are waiting.
+    """
+    maxBuffered = 1024
+
+    def __init__(self):
+        self._chunks = collections.deque()
+        self._waiting = None
+        self._failure = None
+        self._paused = False
+        self.done = False
+        self.result = None
+        self.protocol = None
+        self._deferred = None
+
+    def _attach(self, d):
+        # The outcome is delivered by wait().
+        self._deferred = d
+        d.addCallbacks(self._finished, self._failed)
+
+    def _received(self, chunk):
+        self._chunks.append(chunk)
+        if (not self._paused and self.protocol is not None and
+                len(self._chunks) > self.maxBuffered):
+            self._paused = True
+            self.protocol.pauseReading()
+        self._wake(True)
+
+    def _finished(self, result):
+        self.done = True
+        self.result = result
+        if not self._chunks:
+            self._wake(False)
+        return result
+
+    def _failed(self, failure):
+        self.done = True
+        self._failure = failure
+        if not self._chunks:
+            waiting, self._waiting = self._waiting, None
+            if waiting is not None:
+                waiting.errback(failure)
+
+    def _wake(self, value):
+        waiting, self._waiting = self._waiting, None
+        if waiting is not None:
+            waiting.callback(value)
+
+    def __iter__(self):
+        while self._chunks:
+            yield self._chunks.popleft()
+        if self._paused:
+            self._paused = False
+            self.protocol.resumeReading()
+
+    def wait(self):
+        if self._chunks:
+            return defer.succeed(True)
+        if self._failure is not None:
+            return defer.fail(self._failure)
+        if self.done:
+            return defer.succeed(False)
+        if self._waiting is None:
+            self._waiting = defer.Deferred()
+        return self._waiting
+
+    def cancel(self):
+        """
+        Cancels the call. Chunks already received can still be consumed.
+        """
+        if self._deferred is not None:
+            self._deferred.cancel()
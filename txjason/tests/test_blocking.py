@@ -0,0 +1,74 @@
+from twisted.internet import defer, error, reactor, threads
+
+from txjason import blocking, client, handler
+from txjason.netstring import JSONRPCServerFactory
+
+from common import TXJasonTestCase
+
+
+class TestHandler(handler.Handler):
+    @handler.exportRPC()
+    def add(self, x, y):
+        return x + y
+
+    @handler.exportRPC()
+    def never(self):
+        return defer.Deferred()
+
+
+class BlockingClientTestCase(TXJasonTestCase):
+    """
+    Tests for BlockingJSONRPCClient against a loopback server, called from
+    threads other than the (already running) reactor thread.
+    """
+
+    def setUp(self):
+        factory = JSONRPCServerFactory()
+        factory.addHandler(TestHandler(), 'foo')
+        self.port = reactor.listenTCP(0, factory, interface='127.0.0.1')
+        self.client = blocking.BlockingJSONRPCClient(
+            'tcp:127.0.0.1:%d' % (self.port.getHost().port,), poolSize=2)
+
+    def tearDown(self):
+        disconnected = [
+            f.notifyDisconnect().addErrback(lambda f: None)
+            for f in self.client.pool.factories if f._proto is not None]
+        self.client.close()
+        d = defer.gatherResults(
+            disconnected + [defer.maybeDeferred(self.port.stopListening)])
+        d.addCallback(
+            lambda ign: self.flushLoggedErrors(error.ConnectionAborted))
+        return d
+
+    def test_concurrent_calls(self):
+        """
+        Several threads can call at once and each gets its own result.
+        """
+        d = defer.gatherResults([
+            threads.deferToThread(self.client.callRemote, 'foo.add', i, 1)
+            for i in range(8)])
+        d.addCallback(self.assertEqual, range(1, 9))
+        return d
+
+    def test_error(self):
+        """
+        Error responses are raised in the calling thread.
+        """
+        d = threads.deferToThread(self.client.callRemote, 'foo.missing')
+        return self.assertFailure(d, client.JSONRPCClientError)
+
+    def test_timeout(self):
+        """
+        A call that does not complete within its timeout raises
+        CancelledError.
+        """
+        d = threads.deferToThread(
+            self.client.callRemote, 'foo.never', timeout=0.1)
+        return self.assertFailure(d, defer.CancelledError)
+
+    def test_reactor_thread(self):
+        """
+        Calling from the reactor thread, which would deadlock, is an error.
+        """
+        self.assertRaises(
+            RuntimeError, self.client.callRemote, 'foo.add', 1, 2)
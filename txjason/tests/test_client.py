@@ -4,12 +4,11 @@ from txjason import client
 
 from common import TXJasonTestCase
 
-clock = task.Clock()
-
 
 class ClientTestCase(TXJasonTestCase):
     def setUp(self):
-        self.client = client.JSONRPCClient(reactor=clock)
+        self.clock = task.Clock()
+        self.client = client.JSONRPCClient(reactor=self.clock)
 
     def checkPayload(self, payload, expected, d=None):
         payload = json.loads(payload)
@@ -24,18 +23,18 @@ class ClientTestCase(TXJasonTestCase):
             called.append(r.value)
         payload, d = self.client.getRequest('foo')
         d.addErrback(eb)
-        clock.advance(self.client.timeout - 1)
+        self.clock.advance(self.client.timeout - 1)
         self.assertFalse(called)
-        clock.advance(1)
+        self.clock.advance(1)
         self.assertIsInstance(called[0], defer.CancelledError)
 
     def test_timeout_argument(self):
         called = []
         payload, d = self.client.getRequest('foo', timeout=4)
         d.addErrback(called.append)
-        clock.advance(3)
+        self.clock.advance(3)
         self.assertFalse(called)
-        clock.advance(1)
+        self.clock.advance(1)
         self.assertIsInstance(called[0].value, defer.CancelledError)
 
     def test_response(self):
@@ -111,3 +110,34 @@ class ClientTestCase(TXJasonTestCase):
         payload, d = self.client.getRequest('foo')
         response = {'jsonrpc': '2.0', 'id': 1}
         self.assertRaises(client.JSONRPCProtocolError, self.client.handleResponse, json.dumps(response))
+
+    def test_metrics(self):
+        payload, d1 = self.client.getRequest('foo')
+        payload, d2 = self.client.getRequest('foo')
+        d2.addErrback(lambda f: None)
+        self.clock.advance(2)
+        response = {'jsonrpc': '2.0', 'id': 1, 'result': 'bar'}
+        self.client.handleResponse(json.dumps(response))
+        response = {'jsonrpc': '2.0', 'id': 2, 'error': {'code': 1}}
+        self.client.handleResponse(json.dumps(response))
+        metrics = self.client.metrics
+        self.assertEqual(metrics.counter(
+            'client_requests', method='foo', endpoint=None).value, 2)
+        self.assertEqual(metrics.counter(
+            'client_error_responses', method='foo', endpoint=None).value, 1)
+        latency = metrics.histogram(
+            'client_latency_seconds', method='foo', endpoint=None)
+        self.assertEqual((latency.count, latency.sum), (2, 4))
+
+    def test_metrics_timeout(self):
+        payload, d = self.client.getRequest('foo')
+        d.addErrback(lambda f: None)
+        self.clock.advance(self.client.timeout)
+        self.assertEqual(self.client.metrics.counter(
+            'client_timeouts', method='foo', endpoint=None).value, 1)
+
+    def test_metrics_protocol_error(self):
+        self.assertRaises(client.JSONRPCProtocolError,
+                          self.client.handleResponse, '{')
+        self.assertEqual(self.client.metrics.counter(
+            'client_protocol_errors', endpoint=None).value, 1)
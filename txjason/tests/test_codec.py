@@ -0,0 +1,30 @@
+from txjason import codec
+
+from common import TXJasonTestCase
+
+
+class CodecTestCase(TXJasonTestCase):
+    message = {'jsonrpc': '2.0', 'id': 1, 'method': 'foo',
+               'params': [1, 2.5, u'\xe9', None, True, {'a': [1]}]}
+
+    def test_json_round_trip(self):
+        self.assertEqual(
+            codec.JSON.loads(codec.JSON.dumps(self.message)), self.message)
+
+    def test_msgpack_round_trip(self):
+        msgpack = codec.get('msgpack')
+        self.assertEqual(
+            msgpack.loads(msgpack.dumps(self.message)), self.message)
+
+    def test_msgpack_invalid(self):
+        self.assertRaises(ValueError, codec.get('msgpack').loads, '\xc1')
+
+    if codec.get('msgpack') is None:
+        test_msgpack_round_trip.skip = 'msgpack is not installed'
+        test_msgpack_invalid.skip = 'msgpack is not installed'
+
+    def test_choose(self):
+        self.assertIs(codec.choose(['bogus', 'json']), codec.JSON)
+        self.assertIs(codec.choose([]), codec.JSON)
+        self.assertIs(codec.choose(['msgpack'], allowed=['json']), codec.JSON)
+        self.assertIs(codec.get('bogus'), None)
@@ -0,0 +1,35 @@
+from txjason import compression
+
+from common import TXJasonTestCase
+
+
+class CompressionTestCase(TXJasonTestCase):
+    def test_zlib_round_trip(self):
+        zlib = compression.get('zlib')
+        data = 'spam' * 1000
+        compressed = zlib.compress(data)
+        self.assert_(len(compressed) < len(data))
+        self.assertEqual(zlib.decompress(compressed, len(data)), data)
+
+    def test_zlib_max_length(self):
+        zlib = compression.get('zlib')
+        compressed = zlib.compress('spam' * 1000)
+        self.assertRaises(ValueError, zlib.decompress, compressed, 100)
+
+    def test_max_length(self):
+        """
+        Every available algorithm refuses frames that decompress to more than
+        the maximum length, and accepts frames of exactly that length.
+        """
+        data = 'spam' * 1000
+        for name, compressor in sorted(compression.COMPRESSORS.items()):
+            compressed = compressor.compress(data)
+            self.assertEqual(compressor.decompress(compressed, len(data)),
+                             data, name)
+            self.assertRaises(ValueError, compressor.decompress, compressed,
+                              len(data) - 1)
+
+    def test_choose(self):
+        self.assertEqual(compression.choose(['bogus', 'zlib']).name, 'zlib')
+        self.assertIs(compression.choose(['zlib'], allowed=[]), None)
+        self.assertIs(compression.choose([]), None)
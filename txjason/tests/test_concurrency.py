@@ -0,0 +1,115 @@
+import json
+
+from twisted.internet import defer, task
+
+from txjason import concurrency, metrics, ratelimit, service
+
+from common import TXJasonTestCase
+
+
+class GradientLimitTestCase(TXJasonTestCase):
+    def test_grows_while_latency_is_stable(self):
+        limit = concurrency.GradientLimit(initial=10)
+        for i in range(50):
+            limit.update(0.01, limit.limit, False)
+        self.assertTrue(limit.limit > 10)
+
+    def test_shrinks_when_latency_rises(self):
+        limit = concurrency.GradientLimit(initial=100)
+        for i in range(20):
+            limit.update(0.01, 100, False)
+        before = limit.limit
+        for i in range(20):
+            limit.update(0.1, limit.limit, False)
+        self.assertTrue(limit.limit < before)
+
+    def test_ignores_idle_samples(self):
+        limit = concurrency.GradientLimit(initial=10)
+        for i in range(50):
+            limit.update(0.01, 1, False)
+        self.assertEqual(limit.limit, 10)
+
+    def test_bounds(self):
+        limit = concurrency.GradientLimit(initial=10, minLimit=5, maxLimit=12)
+        for i in range(50):
+            limit.update(0.01, limit.limit, False)
+        self.assertEqual(limit.limit, 12)
+        for i in range(50):
+            limit.update(10, limit.limit, False)
+        self.assertEqual(limit.limit, 5)
+
+
+class AIMDLimitTestCase(TXJasonTestCase):
+    def test_aimd(self):
+        limit = concurrency.AIMDLimit(initial=10, timeout=1)
+        limit.update(0.1, 5, False)
+        self.assertEqual(limit.limit, 11)
+        limit.update(0.1, 1, False)
+        self.assertEqual(limit.limit, 11)
+        limit.update(2, 5, False)
+        self.assertEqual(limit.limit, 9)
+        limit.update(0.1, 5, True)
+        self.assertEqual(limit.limit, 8)
+
+
+class ConcurrencyLimiterTestCase(TXJasonTestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.service = service.JSONRPCService(reactor=self.clock)
+        self.deferreds = []
+        self.service.add(self.wait, 'wait')
+        self.service.add(lambda: 'ok', 'ok')
+        self.metrics = metrics.MetricsRegistry()
+
+    def wait(self):
+        d = defer.Deferred()
+        self.deferreds.append(d)
+        return d
+
+    def call(self, method):
+        request = {'jsonrpc': '2.0', 'method': method, 'id': 1}
+        return self.service.call(json.dumps(request))
+
+    def test_rejects_over_limit(self):
+        limiter = concurrency.ConcurrencyLimiter(
+            lambda: concurrency.AIMDLimit(initial=2), metrics=self.metrics,
+            reactor=self.clock)
+        self.service.addInterceptor(limiter)
+        first, second = self.call('wait'), self.call('wait')
+        response = json.loads(self.successResultOf(self.call('ok')))
+        self.assertEqual(response['error'],
+                         {'code': -32095, 'message': 'Server overloaded'})
+        self.assertEqual(len(self.deferreds), 2)
+        self.deferreds[0].callback('done')
+        self.successResultOf(first)
+        self.assertEqual(limiter.limits(), {None: 3})
+        self.assertEqual(
+            json.loads(self.successResultOf(self.call('ok')))['result'], 'ok')
+        self.deferreds[1].callback('done')
+        self.successResultOf(second)
+        values = dict((m['name'], m['value']) for m in self.metrics.snapshot())
+        self.assertEqual(values['concurrency_rejected'], 1)
+        self.assertEqual(values['concurrency_limit'], 4)
+
+    def test_per_method(self):
+        limiter = concurrency.ConcurrencyLimiter(
+            lambda: concurrency.AIMDLimit(initial=1), key=ratelimit.byMethod,
+            reactor=self.clock)
+        self.service.addInterceptor(limiter)
+        self.call('wait')
+        self.assertEqual(
+            json.loads(self.successResultOf(self.call('ok')))['result'], 'ok')
+        self.assertIn('error', json.loads(self.successResultOf(
+            self.call('wait'))))
+        self.assertEqual(sorted(limiter.limits()), ['ok', 'wait'])
+
+    def test_cancelled_requests_back_off(self):
+        self.service.timeout = 5
+        limiter = concurrency.ConcurrencyLimiter(
+            lambda: concurrency.AIMDLimit(initial=10), reactor=self.clock)
+        self.service.addInterceptor(limiter)
+        d = self.call('wait')
+        self.clock.advance(5)
+        self.assertEqual(json.loads(self.successResultOf(d))['error']['code'],
+                         -32098)
+        self.assertEqual(limiter.limits(), {None: 9})
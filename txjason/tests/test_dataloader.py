@@ -0,0 +1,135 @@
+import json
+
+from twisted.internet import defer, task
+
+from txjason import handler, service
+from txjason.dataloader import DataLoader
+
+from common import TXJasonTestCase
+
+
+class DataLoaderTestCase(TXJasonTestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.batches = []
+        self.loader = DataLoader(self.batchLoad, reactor=self.clock)
+
+    def batchLoad(self, keys):
+        self.batches.append(keys)
+        return [key * 2 for key in keys]
+
+    def test_batch(self):
+        """
+        Keys asked for during a reactor turn are loaded with one call, and
+        duplicates are loaded once.
+        """
+        ds = [self.loader.load(k) for k in (1, 2, 1)]
+        self.assertEqual(self.batches, [])
+        self.clock.advance(0)
+        self.assertEqual(self.batches, [[1, 2]])
+        self.assertEqual([self.successResultOf(d) for d in ds], [2, 4, 2])
+
+    def test_cache(self):
+        """
+        Values stay cached until the reactor turn after they were loaded.
+        """
+        def nextTurn():
+            # Clock.advance would also run calls scheduled while advancing.
+            [call] = self.clock.getDelayedCalls()
+            self.clock.calls.remove(call)
+            call.func(*call.args, **call.kw)
+        self.loader.load(1)
+        nextTurn()
+        self.assertEqual(self.successResultOf(self.loader.load(1)), 2)
+        self.assertEqual(self.batches, [[1]])
+        nextTurn()
+        self.loader.load(1)
+        nextTurn()
+        self.assertEqual(self.batches, [[1], [1]])
+
+    def test_in_flight(self):
+        """
+        A key asked for while it is being loaded waits for that load.
+        """
+        pending = defer.Deferred()
+        self.loader.batchLoad = lambda keys: pending
+        d1 = self.loader.load('a')
+        self.clock.advance(0)
+        d2 = self.loader.load('a')
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        pending.callback({'a': 1})
+        self.assertEqual(self.successResultOf(d1), 1)
+        self.assertEqual(self.successResultOf(d2), 1)
+
+    def test_window_and_maxBatchSize(self):
+        self.loader.window = 0.01
+        self.loader.maxBatchSize = 2
+        d = self.loader.loadMany([1, 2, 3])
+        self.clock.advance(0)
+        self.assertEqual(self.batches, [])
+        self.clock.advance(0.01)
+        self.assertEqual(self.batches, [[1, 2], [3]])
+        self.assertEqual(self.successResultOf(d), [2, 4, 6])
+
+    def test_missing_key(self):
+        self.loader.batchLoad = lambda keys: {'a': 1}
+        d1 = self.loader.load('a')
+        d2 = self.loader.load('b')
+        self.clock.advance(0)
+        self.assertEqual(self.successResultOf(d1), 1)
+        self.failureResultOf(d2, KeyError)
+
+    def test_errors(self):
+        self.loader.batchLoad = lambda keys: [1]
+        d = self.loader.load('a')
+        d2 = self.loader.load('b')
+        self.clock.advance(0)
+        self.failureResultOf(d, ValueError)
+        self.failureResultOf(d2, ValueError)
+        self.clock.advance(0)
+        self.loader.batchLoad = lambda keys: 1 / 0
+        d = self.loader.load('a')
+        self.clock.advance(0)
+        self.failureResultOf(d, ZeroDivisionError)
+
+
+class Users(handler.Handler):
+    def __init__(self):
+        self.batches = []
+        self.users = DataLoader(self.getUsers)
+
+    def getUsers(self, ids):
+        self.batches.append(ids)
+        return dict((id, 'user%d' % id) for id in ids)
+
+    @handler.exportRPC()
+    def name(self, id):
+        return self.users.load(id)
+
+
+class ServiceDataLoaderTestCase(TXJasonTestCase):
+    def test_batch_request(self):
+        """
+        Lookups made by the requests of a batch are loaded together, with
+        the service's reactor.
+        """
+        clock = task.Clock()
+        svc = service.JSONRPCService(reactor=clock)
+        users = Users()
+        users.addToService(svc, 'users')
+        self.assertIdentical(users.users.reactor, clock)
+        d = svc.call(json.dumps([
+            {'jsonrpc': '2.0', 'method': 'users.name', 'params': [i],
+             'id': i} for i in (1, 2, 1)]))
+        clock.advance(0)
+        self.assertEqual(users.batches, [[1, 2]])
+        self.assertEqual(
+            [r['result'] for r in json.loads(self.successResultOf(d))],
+            ['user1', 'user2', 'user1'])
+
+    def test_service_dataLoader(self):
+        clock = task.Clock()
+        svc = service.JSONRPCService(reactor=clock)
+        loader = svc.dataLoader(lambda keys: keys, window=1)
+        self.assertIdentical(loader.reactor, clock)
+        self.assertEqual(loader.window, 1)
@@ -0,0 +1,86 @@
+import json
+
+from twisted.internet import defer, task
+from twisted.python import log
+
+from txjason import service
+from txjason.errorlog import SampledErrorReporter
+
+from common import TXJasonTestCase
+
+
+class Reporter(object):
+    def __init__(self):
+        self.reported = []
+
+    def report(self, method, failure):
+        self.reported.append((method, failure.type))
+
+
+class SampledErrorReporterTestCase(TXJasonTestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.reporter = SampledErrorReporter(
+            tracebacks=2, interval=10, reactor=self.clock)
+        self.service = service.JSONRPCService(
+            reactor=self.clock, errorReporter=self.reporter)
+        self.service.add(self.fail)
+        self.service.add(lambda: {}['key'], name='missing')
+        self.messages = []
+        log.addObserver(self.messages.append)
+        self.addCleanup(log.removeObserver, self.messages.append)
+
+    def fail(self):
+        1 / 0
+
+    @defer.inlineCallbacks
+    def callMethod(self, method):
+        result = yield self.service.call_py(json.dumps(
+            {'jsonrpc': '2.0', 'method': method, 'id': 1}))
+        self.assertEqual(result['error']['code'], -32000)
+
+    def summaries(self):
+        return [m['message'][0] for m in self.messages
+                if not m['isError'] and 'more' in m['message'][0]]
+
+    @defer.inlineCallbacks
+    def test_sampled(self):
+        """
+        Only the first tracebacks of each group are logged during an
+        interval, and the others are counted at its end.
+        """
+        for i in range(5):
+            yield self.callMethod('fail')
+        yield self.callMethod('missing')
+        self.assertEqual(len(self.flushLoggedErrors(ZeroDivisionError)), 2)
+        self.assertEqual(len(self.flushLoggedErrors(KeyError)), 1)
+        self.assertEqual(self.summaries(), [])
+        self.clock.advance(10)
+        [summary] = self.summaries()
+        self.assertIn('3 more ZeroDivisionError exceptions', summary)
+        self.assertIn('"fail"', summary)
+        self.assertIn('test_errorlog.py', summary)
+        self.assertEqual(self.reporter.counts, {})
+
+    @defer.inlineCallbacks
+    def test_new_interval(self):
+        for i in range(3):
+            yield self.callMethod('fail')
+        self.clock.advance(10)
+        yield self.callMethod('fail')
+        self.assertEqual(len(self.flushLoggedErrors(ZeroDivisionError)), 3)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+
+    def test_idle(self):
+        """
+        No timer runs while no exceptions are raised.
+        """
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    @defer.inlineCallbacks
+    def test_custom_reporter(self):
+        reporter = Reporter()
+        self.service.errorReporter = reporter
+        yield self.callMethod('fail')
+        self.assertEqual(reporter.reported, [('fail', ZeroDivisionError)])
+        self.assertEqual(self.flushLoggedErrors(), [])
@@ -0,0 +1,87 @@
+from twisted.test import proto_helpers
+
+from txjason.framing import BufferedNetstringReceiver
+
+from common import TXJasonTestCase
+
+
+class Receiver(BufferedNetstringReceiver):
+    initialBufferSize = 8
+
+    def __init__(self):
+        self.strings = []
+        self.exceeded = []
+
+    def stringReceived(self, string):
+        self.strings.append(string)
+
+    def lengthLimitExceeded(self, length):
+        self.exceeded.append(length)
+        BufferedNetstringReceiver.lengthLimitExceeded(self, length)
+
+
+class BufferedNetstringReceiverTestCase(TXJasonTestCase):
+    def setUp(self):
+        self.proto = Receiver()
+        self.transport = proto_helpers.StringTransport()
+        self.proto.makeConnection(self.transport)
+
+    def test_several_frames(self):
+        self.proto.dataReceived('3:foo,0:,5:hello,')
+        self.assertEqual(self.proto.strings, ['foo', '', 'hello'])
+
+    def test_byte_by_byte(self):
+        data = '3:foo,11:hello world,'
+        for c in data:
+            self.proto.dataReceived(c)
+        self.assertEqual(self.proto.strings, ['foo', 'hello world'])
+
+    def test_large_frame(self):
+        """
+        A frame larger than the buffer grows it, in any chunking.
+        """
+        payload = ''.join(chr(i % 256) for i in range(50000))
+        data = '%d:%s,1:x,' % (len(payload), payload)
+        for i in range(0, len(data), 4093):
+            self.proto.dataReceived(data[i:i + 4093])
+        self.assertEqual(self.proto.strings, [payload, 'x'])
+        self.assertEqual(self.proto._start, 0)
+        self.assertEqual(self.proto._end, 0)
+
+    def test_idle_buffer_released(self):
+        self.proto.maxIdleBufferSize = 16
+        self.proto.dataReceived('20:%s,' % ('x' * 20,))
+        self.assertEqual(self.proto._buffer, None)
+        self.proto.dataReceived('3:foo,')
+        self.assertEqual(self.proto.strings, ['x' * 20, 'foo'])
+
+    def test_bad_header(self):
+        self.proto.dataReceived('3x:foo,')
+        self.assert_(self.proto.brokenPeer)
+        self.assert_(self.transport.disconnecting)
+        self.proto.dataReceived('3:foo,')
+        self.assertEqual(self.proto.strings, [])
+
+    def test_leading_zero(self):
+        self.proto.dataReceived('03:foo,')
+        self.assert_(self.proto.brokenPeer)
+
+    def test_missing_colon(self):
+        self.proto.dataReceived('1234567')
+        self.assert_(self.proto.brokenPeer)
+
+    def test_bad_trailer(self):
+        self.proto.dataReceived('3:foo;')
+        self.assert_(self.proto.brokenPeer)
+        self.assertEqual(self.proto.strings, [])
+
+    def test_too_long(self):
+        self.proto.MAX_LENGTH = 10
+        self.proto.dataReceived('11:')
+        self.assertEqual(self.proto.exceeded, [11])
+        self.assert_(self.transport.disconnecting)
+
+    def test_sendString(self):
+        self.proto.sendString('foo')
+        self.proto.sendStrings(('\x00', 'hello'))
+        self.assertEqual(self.transport.value(), '3:foo,6:\x00hello,')
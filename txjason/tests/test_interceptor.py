@@ -0,0 +1,162 @@
+import json
+
+from twisted.internet import defer
+
+from txjason import interceptor, service
+
+from common import TXJasonTestCase
+
+
+def subtract(minuend, subtrahend):
+    return minuend - subtrahend
+
+
+class Forbidden(service.JSONRPCError):
+    code = -32001
+    message = 'Forbidden'
+
+
+class Recorder(interceptor.Interceptor):
+    def __init__(self, name, log):
+        self.name = name
+        self.log = log
+
+    def aroundCall(self, request, proceed):
+        self.log.append(('enter', self.name, request['method']))
+        d = proceed(request)
+
+        def exit(result):
+            self.log.append(('exit', self.name, result))
+            return result
+        return d.addCallback(exit)
+
+
+class Auth(interceptor.Interceptor):
+    def afterParse(self, request):
+        if request['method'] != 'subtract':
+            raise Forbidden()
+
+
+class Doubler(interceptor.Interceptor):
+    def beforeSerialize(self, response):
+        response['result'] *= 2
+        return response
+
+
+class Lowercase(interceptor.Interceptor):
+    def beforeParse(self, data):
+        return data.lower()
+
+
+class Cached(interceptor.Interceptor):
+    def aroundCall(self, request, proceed):
+        return 'cached'
+
+
+class Broken(interceptor.Interceptor):
+    def afterParse(self, request):
+        raise RuntimeError('oops')
+
+
+class HooksTestCase(TXJasonTestCase):
+    def test_only_overridden_hooks(self):
+        log = []
+        recorder, auth = Recorder('a', log), Auth()
+        self.assertEqual(interceptor.hooks([recorder, auth], 'aroundCall'),
+                         (recorder.aroundCall,))
+        self.assertEqual(interceptor.hooks([recorder, auth], 'afterParse'),
+                         (auth.afterParse,))
+        self.assertEqual(interceptor.hooks([recorder], 'beforeParse'), ())
+
+    def test_chain(self):
+        log = []
+        call = interceptor.chain(
+            (Recorder('outer', log).aroundCall,
+             Recorder('inner', log).aroundCall),
+            lambda request: defer.succeed(request['method']))
+        self.assertEqual(self.successResultOf(call({'method': 'm'})), 'm')
+        self.assertEqual(log, [('enter', 'outer', 'm'),
+                               ('enter', 'inner', 'm'),
+                               ('exit', 'inner', 'm'),
+                               ('exit', 'outer', 'm')])
+
+
+class ServiceInterceptorTestCase(TXJasonTestCase):
+    def setUp(self):
+        self.service = service.JSONRPCService()
+        self.service.add(subtract)
+        self.service.add(lambda: 1, 'one')
+
+    def call(self, method, params=None, id=1):
+        request = {'jsonrpc': '2.0', 'method': method, 'id': id}
+        if params is not None:
+            request['params'] = params
+        d = self.service.call(json.dumps(request))
+        return json.loads(self.successResultOf(d))
+
+    def test_no_interceptors(self):
+        self.assertEqual(self.service._invoke, self.service._call_method)
+
+    def deferredsCreated(self, method):
+        created = []
+        init = defer.Deferred.__init__
+
+        def counting(d, *args, **kwargs):
+            created.append(d)
+            init(d, *args, **kwargs)
+        self.patch(defer.Deferred, '__init__', counting)
+        self.call(method)
+        return len(created)
+
+    def test_dispatch_cost(self):
+        """
+        A synchronous method is answered on the synchronous path: one
+        Deferred each for call_py, _handle_request and _call_method and the
+        method's result. Interceptors that override no hooks add nothing.
+        """
+        self.assertEqual(self.deferredsCreated('one'), 4)
+        self.service.addInterceptor(interceptor.Interceptor())
+        self.assertEqual(self.deferredsCreated('one'), 4)
+
+    def test_around_call(self):
+        log = []
+        self.service.addInterceptor(Recorder('a', log))
+        self.service.addInterceptor(Recorder('b', log))
+        self.assertEqual(self.call('subtract', [3, 1])['result'], 2)
+        self.assertEqual(log, [('enter', 'a', 'subtract'),
+                               ('enter', 'b', 'subtract'),
+                               ('exit', 'b', 2),
+                               ('exit', 'a', 2)])
+
+    def test_around_call_short_circuit(self):
+        self.service.addInterceptor(Cached())
+        self.assertEqual(self.call('subtract', [3, 1])['result'], 'cached')
+
+    def test_after_parse_error(self):
+        self.service.addInterceptor(Auth())
+        self.assertEqual(self.call('subtract', [3, 1])['result'], 2)
+        self.assertEqual(self.call('one')['error'],
+                         {'code': -32001, 'message': 'Forbidden'})
+
+    def test_after_parse_batch(self):
+        self.service.addInterceptor(Auth())
+        request = [{'jsonrpc': '2.0', 'method': 'one', 'id': 1},
+                   {'jsonrpc': '2.0', 'method': 'subtract', 'params': [3, 1],
+                    'id': 2}]
+        d = self.service.call(json.dumps(request))
+        response = json.loads(self.successResultOf(d))
+        self.assertEqual(response[0]['error']['code'], -32001)
+        self.assertEqual(response[1]['result'], 2)
+
+    def test_before_parse(self):
+        self.service.addInterceptor(Lowercase())
+        self.assertEqual(self.call('SUBTRACT', [3, 1])['result'], 2)
+
+    def test_before_serialize(self):
+        self.service.addInterceptor(Doubler())
+        self.assertEqual(self.call('subtract', [3, 1])['result'], 4)
+
+    def test_unexpected_exception(self):
+        self.service.addInterceptor(Broken())
+        self.assertEqual(self.call('one')['error']['code'], -32000)
+        self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
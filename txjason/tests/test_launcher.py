@@ -0,0 +1,135 @@
+import os
+import socket
+
+from twisted.internet import defer, endpoints, error, reactor, task
+
+from txjason import handler, launcher
+from txjason.netstring import JSONRPCClientFactory, JSONRPCServerFactory
+
+from common import TXJasonTestCase
+
+
+class TestHandler(handler.Handler):
+    @handler.exportRPC()
+    def pid(self):
+        self.factory.service.metrics.counter('calls').inc()
+        return os.getpid()
+
+
+def makeFactory():
+    factory = JSONRPCServerFactory()
+    h = TestHandler()
+    h.factory = factory
+    factory.addHandler(h, 'foo')
+    return factory
+
+
+class ListeningSocketTestCase(TXJasonTestCase):
+    def test_reuse_port(self):
+        """
+        Several SO_REUSEPORT sockets can listen on the same port.
+        """
+        first = launcher.listeningSocket(0, '127.0.0.1', reusePort=True)
+        self.addCleanup(first.close)
+        port = first.getsockname()[1]
+        second = launcher.listeningSocket(port, '127.0.0.1', reusePort=True)
+        self.addCleanup(second.close)
+        self.assertEqual(second.getsockname()[1], port)
+
+    def test_no_reuse_port(self):
+        first = launcher.listeningSocket(0, '127.0.0.1')
+        self.addCleanup(first.close)
+        self.assertRaises(socket.error, launcher.listeningSocket,
+                          first.getsockname()[1], '127.0.0.1')
+
+
+class MergeSnapshotsTestCase(TXJasonTestCase):
+    def test_merge(self):
+        a = [{'name': 'calls', 'type': 'counter', 'labels': {'m': 'x'},
+              'value': 2},
+             {'name': 'latency', 'type': 'histogram', 'labels': {},
+              'buckets': [1], 'counts': [1, 0], 'count': 1, 'sum': 0.5}]
+        b = [{'name': 'calls', 'type': 'counter', 'labels': {'m': 'x'},
+              'value': 3},
+             {'name': 'latency', 'type': 'histogram', 'labels': {},
+              'buckets': [1], 'counts': [0, 2], 'count': 2, 'sum': 4}]
+        merged = launcher.mergeSnapshots([a, b])
+        self.assertEqual(merged[0]['value'], 5)
+        self.assertEqual(merged[1]['counts'], [1, 2])
+        self.assertEqual((merged[1]['count'], merged[1]['sum']), (3, 4.5))
+        self.assertEqual(a[0]['value'], 2)
+
+
+class WorkerTestCase(TXJasonTestCase):
+    def test_graceful_stop(self):
+        """
+        Stopping a worker waits for pending requests, and cancels them after
+        the shutdown timeout.
+        """
+        clock = task.Clock()
+        factory = makeFactory()
+        pending = defer.Deferred()
+        factory.service.pending.add(pending)
+        pending.addErrback(
+            lambda f: factory.service._remove_pending(pending))
+        worker = launcher.Worker(clock, factory, 0, shutdownTimeout=5)
+        d = worker.stop()
+        self.assertNoResult(d)
+        clock.advance(4)
+        self.assertNoResult(d)
+        clock.advance(1)
+        self.successResultOf(d)
+
+
+    def test_inherited_ipv6_socket(self):
+        """
+        An inherited socket is adopted with the family of its interface.
+        """
+        adopted = []
+
+        class Reactor(object):
+            def adoptStreamPort(self, fd, family, factory):
+                adopted.append(family)
+
+            def addSystemEventTrigger(self, *args):
+                pass
+        sock = launcher.listeningSocket(0, '::1')
+        self.addCleanup(sock.close)
+        worker = launcher.Worker(Reactor(), makeFactory(), 0)
+        worker.listen(interface='::1', fd=os.dup(sock.fileno()))
+        self.assertEqual(adopted, [socket.AF_INET6])
+
+
+class LauncherTestCase(TXJasonTestCase):
+    """
+    Starts real worker processes sharing one listening socket.
+    """
+    timeout = 60
+
+    @defer.inlineCallbacks
+    def test_workers(self):
+        statsDirectory = self.mktemp()
+        os.makedirs(statsDirectory)
+        workers = launcher.Launcher(
+            'txjason.tests.test_launcher.makeFactory', 0, workers=2,
+            interface='127.0.0.1', shareSocket=True,
+            statsDirectory=statsDirectory, shutdownTimeout=1)
+        workers.start()
+        self.addCleanup(workers.stop)
+        for i in range(200):
+            if len(os.listdir(statsDirectory)) == 2:
+                break
+            yield task.deferLater(reactor, 0.05, lambda: None)
+
+        client = JSONRPCClientFactory(
+            endpoints.TCP4ClientEndpoint(reactor, '127.0.0.1', workers.port))
+        pid = yield client.callRemote('foo.pid')
+        client.disconnect()
+        self.assertIn(pid, [p.transport.pid for p in workers.processes])
+
+        stats = yield launcher.collectStats(reactor, statsDirectory)
+        self.assertEqual(sorted(w['worker'] for w in stats['workers']), [0, 1])
+        calls = [m for m in stats['metrics'] if m['name'] == 'calls']
+        self.assertEqual(calls[0]['value'], 1)
+        yield workers.stop()
+        self.flushLoggedErrors(error.ConnectionAborted)
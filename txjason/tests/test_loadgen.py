@@ -0,0 +1,194 @@
+import json
+import random
+
+from twisted.internet import defer, error, reactor, task
+
+from txjason import client, handler, loadgen
+from txjason.netstring import JSONRPCServerFactory
+
+from common import TXJasonTestCase
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.calls = []
+
+    def callRemote(self, method, *args):
+        d = defer.Deferred()
+        self.calls.append((method, args, d))
+        return d
+
+
+class HistogramTestCase(TXJasonTestCase):
+    def test_percentiles(self):
+        h = loadgen.Histogram()
+        for ms in range(1, 101):
+            h.record(ms / 1000.0)
+        self.assertEqual(h.count, 100)
+        # Within the 1% width of a bucket.
+        self.assertTrue(0.050 <= h.percentile(50) <= 0.0506)
+        self.assertTrue(0.099 <= h.percentile(99) <= 0.1)
+        self.assertEqual(h.percentile(100), 0.1)
+        self.assertAlmostEqual(h.summary()['mean'], 0.0505)
+
+    def test_empty(self):
+        self.assertEqual(loadgen.Histogram().percentile(99), 0)
+
+
+class SpecTestCase(TXJasonTestCase):
+    def test_weights(self):
+        spec = loadgen.Spec([{'method': 'a', 'weight': 3},
+                             {'method': 'b', 'params': {'x': 1}}],
+                            random.Random(0))
+        picks = [spec.choose()[0] for i in range(1000)]
+        self.assertTrue(700 <= picks.count('a') <= 800)
+        self.assertIn(('b', {'x': 1}), spec.requests)
+
+    def test_fromFile(self):
+        path = self.mktemp()
+        with open(path, 'w') as f:
+            json.dump([{'method': 'echo', 'params': [1]}], f)
+        self.assertEqual(loadgen.Spec.fromFile(path).choose(), ('echo', [1]))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, loadgen.Spec, [])
+        self.assertRaises(ValueError, loadgen.Spec, [{'params': []}])
+        self.assertRaises(ValueError, loadgen.Spec,
+                          [{'method': 'a', 'params': 1}])
+
+
+class LoadGeneratorTestCase(TXJasonTestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.client = FakeClient()
+        self.spec = loadgen.Spec([{'method': 'echo', 'params': [1]}])
+
+    def generator(self, **kwargs):
+        return loadgen.LoadGenerator(
+            self.clock, self.client, self.spec, 10, 1, **kwargs)
+
+    def test_open_loop(self):
+        """
+        Requests are sent at the given rate whether or not earlier ones have
+        been answered.
+        """
+        d = self.generator().run()
+        for i in range(10):
+            self.clock.advance(0.1)
+        self.assertEqual(len(self.client.calls), 10)
+        self.assertNoResult(d)
+        for method, args, call in self.client.calls:
+            self.assertEqual((method, args), ('echo', (1,)))
+            call.callback(1)
+        report = self.successResultOf(d)
+        self.assertEqual((report['sent'], report['ok']), (10, 10))
+        self.assertAlmostEqual(report['latency']['p100'], 1)
+        self.assertAlmostEqual(report['serviceTime']['p100'], 1)
+
+    def test_coordinated_omission(self):
+        """
+        Requests sent late count the time since they should have been sent.
+        """
+        self.client.callRemote = lambda method, *args: defer.succeed(1)
+        d = self.generator().run()
+        # The requests due from 0.1s to 0.9s are all sent at 1s.
+        self.clock.advance(1)
+        report = self.successResultOf(d)
+        self.assertEqual(report['ok'], 10)
+        self.assertAlmostEqual(report['latency']['p100'], 0.9)
+        self.assertEqual(report['serviceTime']['p100'], 0)
+        self.assertAlmostEqual(report['maxLag'], 0.9)
+
+    def test_poisson(self):
+        d = self.generator(poisson=True, random=random.Random(1)).run()
+        while self.clock.getDelayedCalls():
+            self.clock.advance(0.01)
+        self.assertTrue(5 <= len(self.client.calls) <= 20)
+        for method, args, call in self.client.calls:
+            call.callback(1)
+        self.successResultOf(d)
+
+    def test_errors(self):
+        d = self.generator(maxOutstanding=3).run()
+        self.clock.advance(0.5)
+        calls = self.client.calls
+        calls[0][2].errback(client.JSONRPCClientError(
+            {'code': -32000, 'message': 'Server error'}))
+        calls[1][2].cancel()
+        calls[2][2].callback(1)
+        self.clock.advance(0.5)
+        for method, args, call in calls[3:]:
+            call.callback(1)
+        report = self.successResultOf(d)
+        # 3 of the first 6 requests and 1 of the last 4 were dropped.
+        self.assertEqual(report['errors'],
+                         {'error -32000': 1, 'timeout': 1, 'dropped': 4})
+        self.assertEqual(report['errorRate'], 0.6)
+        self.assertEqual(report['methods']['echo']['errors'], 6)
+
+    def test_stop(self):
+        generator = self.generator()
+        d = generator.run()
+        self.clock.advance(0.2)
+        generator.stop()
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        for method, args, call in self.client.calls:
+            call.callback(1)
+        self.assertEqual(self.successResultOf(d)['sent'], 3)
+
+
+class Echo(handler.Handler):
+    def __init__(self, factory):
+        self.factory = factory
+
+    @handler.exportRPC()
+    def echo(self, x):
+        return x
+
+    @handler.exportRPC()
+    def drop(self):
+        for connection in list(self.factory.connections):
+            connection.loseConnection()
+        return defer.Deferred()
+
+
+class MainTestCase(TXJasonTestCase):
+    @defer.inlineCallbacks
+    def main(self, *argv):
+        factory = JSONRPCServerFactory()
+        factory.addHandler(Echo(factory), 'main')
+        port = reactor.listenTCP(0, factory, interface='127.0.0.1')
+        self.addCleanup(port.stopListening)
+        output = []
+        self.patch(loadgen, 'formatReport',
+                   lambda report: output.append(report) or '')
+        yield loadgen.main(
+            reactor, '--rate', '100', '--duration', '0.1',
+            '--connections', '2', *(argv + (
+                'tcp:host=127.0.0.1:port=%d' % (port.getHost().port,),)))
+        self.flushLoggedErrors(error.ConnectionAborted, error.ConnectionDone)
+        [report] = output
+        defer.returnValue(report)
+
+    @defer.inlineCallbacks
+    def test_main(self):
+        report = yield self.main('--method', 'main.echo', '--params', '["x"]')
+        self.assertEqual(report['errors'], {})
+        self.assertTrue(report['ok'] > 0)
+
+    @defer.inlineCallbacks
+    def test_main_disconnected(self):
+        """
+        main finishes when connections were lost before the end of the run.
+        """
+        report = yield self.main('--method', 'main.drop')
+        self.assertEqual(report['ok'], 0)
+        self.assertEqual(sum(report['errors'].values()), report['sent'])
+
+    def test_options(self):
+        options = loadgen.Options()
+        self.assertRaises(loadgen.usage.UsageError, options.parseOptions,
+                          ['tcp:localhost:1'])
+        options.parseOptions(['--spec', 'x.json', '--poisson', 'unix:/s'])
+        self.assertEqual(options['endpoint'], 'unix:/s')
+        self.assertTrue(options['poisson'])
@@ -0,0 +1,47 @@
+from txjason import metrics
+
+from common import TXJasonTestCase
+
+
+class HistogramTestCase(TXJasonTestCase):
+    def test_observe(self):
+        h = metrics.Histogram([1, 2, 4])
+        for value in (0.5, 1, 3, 10):
+            h.observe(value)
+        self.assertEqual(h.counts, [2, 0, 1, 1])
+        self.assertEqual(h.count, 4)
+        self.assertEqual(h.sum, 14.5)
+
+    def test_percentile(self):
+        h = metrics.Histogram([1, 2, 4])
+        self.assertIs(h.percentile(50), None)
+        for value in (0.5, 1.5, 1.5, 3):
+            h.observe(value)
+        self.assertEqual(h.percentile(50), 2)
+        self.assertEqual(h.percentile(100), 4)
+        h.observe(5)
+        self.assertEqual(h.percentile(100), float('inf'))
+
+
+class RegistryTestCase(TXJasonTestCase):
+    def setUp(self):
+        self.registry = metrics.MetricsRegistry()
+
+    def test_same_metric(self):
+        c = self.registry.counter('calls', method='a', endpoint='b')
+        self.assertIs(
+            self.registry.counter('calls', endpoint='b', method='a'), c)
+        self.assertIsNot(self.registry.counter('calls', method='b'), c)
+
+    def test_type_mismatch(self):
+        self.registry.counter('calls')
+        self.assertRaises(TypeError, self.registry.histogram, 'calls')
+
+    def test_snapshot(self):
+        self.registry.counter('calls', method='a').inc(2)
+        self.registry.gauge('inflight').set(3)
+        self.assertEqual(self.registry.snapshot(), [
+            {'name': 'calls', 'type': 'counter', 'labels': {'method': 'a'},
+             'value': 2},
+            {'name': 'inflight', 'type': 'gauge', 'labels': {}, 'value': 3},
+        ])
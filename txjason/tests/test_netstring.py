@@ -1,9 +1,9 @@
 import json
 
-from twisted.internet import defer, task
+from twisted.internet import defer, error, task
 from twisted.test import proto_helpers
 from txjason.netstring import JSONRPCClientFactory, JSONRPCServerFactory
-from txjason import client, handler
+from txjason import client, codec, compression, handler, service
 
 from common import TXJasonTestCase
 
@@ -19,11 +19,27 @@ def makeNetstring(string):
     return '%d:%s,' % (len(string), string)
 
 
+def cancelledCounts(metrics):
+    return dict((m['labels']['reason'], m['value'])
+                for m in metrics.snapshot()
+                if m['name'] == 'requests_cancelled')
+
+
 class TestHandler(handler.Handler):
+    def __init__(self):
+        self.waiting = []
+        self.cancelled = []
+
     @handler.exportRPC()
     def add(self, x, y):
         return x + y
 
+    @handler.exportRPC()
+    def wait(self):
+        d = defer.Deferred(self.cancelled.append)
+        self.waiting.append(d)
+        return d
+
 
 class FakeReactor(object):
     def connectTCP(self, host, port, factory):
@@ -90,6 +106,335 @@ class ServerTestCase(TXJasonTestCase):
         request = self.client._getPayload('add', 'X', 1, 2)
         self._test(request, '87:{"jsonrpc": "2.0", "id": "X", "error": {"message": "Method not found", "code": -32601}},')
 
+    def test_negotiate(self):
+        """
+        A negotiation request as the first frame switches the connection to
+        the first offered codec the server supports.
+        """
+        request = self.client._getPayload(
+            codec.NEGOTIATE, 'N', {'codecs': ['bogus', 'msgpack', 'json']})
+        self.proto.dataReceived(makeNetstring(request))
+        self.assertEqual(json.loads(readNetstring(self.tr.value())),
+                         {'jsonrpc': '2.0', 'id': 'N',
+                          'result': {'codec': 'msgpack',
+                                     'compression': None}})
+        self.assertEqual(self.proto.codec.name, 'msgpack')
+        self.tr.clear()
+        request = self.client._getPayload(
+            'foo.add', 'X', 1, 2, codec=self.proto.codec)
+        self.proto.dataReceived(makeNetstring(request))
+        self.assertEqual(
+            self.proto.codec.loads(readNetstring(self.tr.value())),
+            {'jsonrpc': '2.0', 'result': 3, 'id': 'X'})
+
+    def test_negotiate_not_allowed(self):
+        """
+        Servers only agree to the codecs they allow.
+        """
+        self.factory.codecs = ['json']
+        request = self.client._getPayload(
+            codec.NEGOTIATE, 'N', {'codecs': ['msgpack', 'json']})
+        self.proto.dataReceived(makeNetstring(request))
+        self.assertIs(self.proto.codec, codec.JSON)
+
+    def test_negotiate_first_frame_only(self):
+        """
+        Negotiation is only possible as the first frame.
+        """
+        self.proto.dataReceived(makeNetstring(
+            self.client._getPayload('foo.add', 'X', 1, 2)))
+        self.tr.clear()
+        request = self.client._getPayload(
+            codec.NEGOTIATE, 'N', {'codecs': ['msgpack']})
+        self._test(request, '87:{"jsonrpc": "2.0", "id": "N", "error": '
+                   '{"message": "Method not found", "code": -32601}},')
+        self.assertIs(self.proto.codec, codec.JSON)
+
+    def negotiateCompression(self):
+        request = self.client._getPayload(
+            codec.NEGOTIATE, 'N', {'compression': ['bogus', 'zlib']})
+        self.proto.dataReceived(makeNetstring(request))
+        self.assertEqual(
+            json.loads(readNetstring(self.tr.value()))['result'],
+            {'codec': 'json', 'compression': 'zlib'})
+        self.tr.clear()
+
+    def test_compression(self):
+        """
+        Once compression is negotiated, responses at or above the threshold
+        are compressed and smaller ones are only prefixed with a flag.
+        """
+        self.factory.compressionThreshold = 100
+        self.negotiateCompression()
+        request = self.client._getPayload('foo.add', 'X', 'x' * 100, 'y')
+        self.proto.dataReceived(
+            makeNetstring(compression.RAW + request))
+        frame = readNetstring(self.tr.value())
+        self.assertEqual(frame[0], compression.COMPRESSED)
+        self.assertEqual(
+            json.loads(self.proto.decodeFrame(frame))['result'],
+            'x' * 100 + 'y')
+        self.tr.clear()
+        request = self.client._getPayload('foo.add', 'X', 1, 2)
+        self.proto.dataReceived(makeNetstring(
+            compression.COMPRESSED + compression.get('zlib').compress(request)))
+        self.assertEqual(
+            readNetstring(self.tr.value()),
+            compression.RAW + '{"jsonrpc": "2.0", "result": 3, "id": "X"}')
+        metrics = self.factory.service.metrics
+        labels = {'algorithm': 'zlib', 'side': 'server'}
+        self.assertEqual(
+            metrics.histogram('compression_ratio', **labels).count, 1)
+        self.assertEqual(
+            metrics.histogram('decompression_seconds', **labels).count, 2)
+
+    def test_bad_frame(self):
+        """
+        Frames without a valid flag byte drop the connection.
+        """
+        self.negotiateCompression()
+        self.proto.dataReceived(makeNetstring('\x07x'))
+        self.assertEqual(self.tr.value(), '')
+        self.assert_(self.tr.disconnecting)
+        # Unregistered first, or a TLS transport would not close.
+        self.assertIdentical(self.tr.producer, None)
+        self.assertEqual(len(self.flushLoggedErrors(ValueError)), 1)
+
+    def test_length_limit_exceeded(self):
+        self.proto.dataReceived('%d:' % (self.proto.MAX_LENGTH + 1,))
+        self.assert_(self.tr.disconnecting)
+        self.assertIdentical(self.tr.producer, None)
+
+    def disconnectDuringRequest(self):
+        handler = TestHandler()
+        self.factory.addHandler(handler, 'bar')
+        request = self.client._getPayload('bar.wait', 'W')
+        self.proto.dataReceived(makeNetstring(request))
+        self.assertEqual(len(self.factory.service.connections[self.proto]), 1)
+        self.proto.connectionLost(error.ConnectionLost())
+        self.assertNotIn(self.proto, self.factory.service.connections)
+        return handler
+
+    def test_disconnect_keeps_running(self):
+        """
+        By default, requests keep running after their connection is lost,
+        but their results are not written.
+        """
+        d = self.disconnectDuringRequest().waiting[0]
+        self.assertNoResult(d)
+        d.callback('done')
+        self.assertEqual(self.tr.value(), '')
+        self.assertEqual(self.factory.service.pending, set())
+
+    def test_cancel_on_disconnect(self):
+        self.factory.service.cancelOnDisconnect = True
+        handler = self.disconnectDuringRequest()
+        self.assertEqual(handler.cancelled, handler.waiting)
+        self.assertEqual(self.tr.value(), '')
+        self.assertEqual(self.factory.service.pending, set())
+        self.assertEqual(cancelledCounts(self.factory.service.metrics),
+                         {'disconnect': 1, 'client': 0})
+
+    def test_cancel_notification(self):
+        """
+        A txjason.cancel notification cancels the request with that id from
+        the same connection, which is then not answered.
+        """
+        handler = TestHandler()
+        self.factory.addHandler(handler, 'bar')
+        self.proto.dataReceived(makeNetstring(
+            self.client._getPayload('bar.wait', 'W')))
+        self.proto.dataReceived(makeNetstring(
+            self.client._getPayload(service.CANCEL, None, 'X')))
+        self.assertEqual(len(self.factory.service.pending), 1)
+        self.proto.dataReceived(makeNetstring(
+            self.client._getPayload(service.CANCEL, None, 'W')))
+        self.assertEqual(handler.cancelled, handler.waiting)
+        self.assertEqual(self.factory.service.pending, set())
+        self.assertEqual(self.tr.value(), '')
+        self.assertEqual(cancelledCounts(self.factory.service.metrics),
+                         {'disconnect': 0, 'client': 1})
+
+    def test_cancel_invalid_id(self):
+        """
+        A txjason.cancel notification whose id is not a valid request id is
+        ignored.
+        """
+        handler = TestHandler()
+        self.factory.addHandler(handler, 'bar')
+        self.proto.dataReceived(makeNetstring(
+            self.client._getPayload('bar.wait', 'W')))
+        for id in ([1], {}):
+            self.proto.dataReceived(makeNetstring(
+                self.client._getPayload(service.CANCEL, None, id)))
+        self.assertEqual(handler.cancelled, [])
+        self.assertEqual(len(self.factory.service.pending), 1)
+        self.assertEqual(self.tr.value(), '')
+        self.assertEqual(self.flushLoggedErrors(), [])
+
+    def test_memory_budget_pauses_reading(self):
+        """
+        The protocol stops reading while the service is over its memory
+        budget, and resumes once memory is released.
+        """
+        handler = TestHandler()
+        self.factory.addHandler(handler, 'bar')
+        request = self.client._getPayload('bar.wait', 'W')
+        self.factory.service.memoryBudget = len(request)
+        self.proto.dataReceived(makeNetstring(request))
+        self.assertEqual(self.factory.service.memoryUsage, len(request))
+        self.assertEqual(self.tr.producerState, 'paused')
+        handler.waiting.pop().callback('x')
+        self.assertEqual(self.factory.service.memoryUsage, 0)
+        self.assertEqual(self.tr.producerState, 'producing')
+        self.assertEqual(json.loads(readNetstring(self.tr.value())),
+                         {'jsonrpc': '2.0', 'id': 'W', 'result': 'x'})
+
+    def test_memory_budget_holds_unsent_responses(self):
+        """
+        Responses written while the transport's buffer is full count against
+        the memory budget until it drains.
+        """
+        handler = TestHandler()
+        self.factory.addHandler(handler, 'bar')
+        request = self.client._getPayload('bar.wait', 'W')
+        self.factory.service.memoryBudget = len(request) * 2
+        self.proto.pauseProducing()
+        self.proto.dataReceived(makeNetstring(request))
+        handler.waiting.pop().callback('x' * len(request) * 2)
+        response = readNetstring(self.tr.value())
+        self.assertEqual(self.factory.service.memoryUsage, len(response))
+        self.assertEqual(self.tr.producerState, 'paused')
+        self.proto.resumeProducing()
+        self.assertEqual(self.factory.service.memoryUsage, 0)
+        self.assertEqual(self.tr.producerState, 'producing')
+
+    def test_memory_budget_disconnect(self):
+        """
+        Responses still held when the connection is lost are released.
+        """
+        handler = TestHandler()
+        self.factory.addHandler(handler, 'bar')
+        request = self.client._getPayload('bar.wait', 'W')
+        self.factory.service.memoryBudget = len(request) * 2
+        self.proto.pauseProducing()
+        self.proto.dataReceived(makeNetstring(request))
+        handler.waiting.pop().callback('x')
+        self.assertNotEqual(self.factory.service.memoryUsage, 0)
+        self.proto.connectionLost(error.ConnectionLost())
+        self.assertEqual(self.factory.service.memoryUsage, 0)
+
+    def test_cancel_savings(self):
+        """
+        The time saved by cancelling is estimated from the method's average
+        duration.
+        """
+        clock = task.Clock()
+        service = self.factory.service
+        service.reactor = clock
+        service.cancelOnDisconnect = True
+        handler = TestHandler()
+        self.factory.addHandler(handler, 'bar')
+        request = self.client._getPayload('bar.wait', 'W')
+        self.proto.dataReceived(makeNetstring(request))
+        clock.advance(4)
+        handler.waiting[0].callback('done')
+        self.tr.clear()
+        self.proto.dataReceived(makeNetstring(request))
+        clock.advance(1)
+        self.proto.connectionLost(error.ConnectionLost())
+        metrics = dict((m['name'], m['value'])
+                       for m in service.metrics.snapshot())
+        self.assertEqual(metrics['cancelled_seconds_saved'], 3)
+
+    if codec.get('msgpack') is None:
+        test_negotiate.skip = 'msgpack is not installed'
+
+
+class BroadcastTestCase(TXJasonTestCase):
+    """
+    Tests for JSONRPCServerFactory.broadcast.
+    """
+
+    def setUp(self):
+        self.factory = JSONRPCServerFactory()
+        self.protos = []
+        for i in range(3):
+            proto = self.factory.buildProtocol(('127.0.0.1', 0))
+            proto.makeConnection(proto_helpers.StringTransport())
+            self.protos.append(proto)
+
+    def test_broadcast(self):
+        self.assertEqual(self.factory.broadcast('config', ['x']), 3)
+        frames = [p.transport.value() for p in self.protos]
+        self.assertEqual(json.loads(readNetstring(frames[0])),
+                         {'jsonrpc': '2.0', 'method': 'config',
+                          'params': ['x']})
+        self.assertEqual(frames, [frames[0]] * 3)
+
+    def test_encoded_once(self):
+        """
+        The notification is encoded once for each codec and compression
+        setting in use.
+        """
+        dumps = []
+
+        class Counting(object):
+            def dumps(self, obj):
+                dumps.append(obj)
+                return codec.JSON.dumps(obj)
+        self.protos[0].codec = self.protos[1].codec = Counting()
+        self.protos[2].setCompressor(compression.get('zlib'), 0,
+                                     self.factory.service.metrics, 'server')
+        self.factory.broadcast('config', ['x' * 1000])
+        self.assertEqual(len(dumps), 1)
+        self.assertEqual(self.protos[0].transport.value(),
+                         self.protos[1].transport.value())
+        frame = readNetstring(self.protos[2].transport.value())
+        self.assertEqual(frame[0], compression.COMPRESSED)
+
+    def test_groups(self):
+        self.factory.join(self.protos[0], 'routing')
+        self.factory.join(self.protos[2], 'routing')
+        self.assertEqual(self.factory.broadcast('update', group='routing'), 2)
+        self.assertEqual(self.protos[1].transport.value(), '')
+        self.protos[2].connectionLost(error.ConnectionDone())
+        self.assertEqual(self.factory.groups, {'routing': set([self.protos[0]])})
+        self.assertEqual(len(self.factory.connections), 2)
+        self.factory.leave(self.protos[0], 'routing')
+        self.assertEqual(self.factory.groups, {})
+        self.assertEqual(self.factory.broadcast('update', group='routing'), 0)
+
+    def test_slow_connection(self):
+        """
+        Connections whose write buffer is full are skipped, or dropped with
+        dropSlowConnections.
+        """
+        self.protos[0].pauseProducing()
+        self.assertEqual(self.factory.broadcast('config'), 2)
+        self.assertEqual(self.protos[0].transport.value(), '')
+        aborted = []
+        self.protos[0].transport.abortConnection = lambda: aborted.append(1)
+        self.factory.dropSlowConnections = True
+        self.factory.broadcast('config')
+        self.assertEqual(aborted, [1])
+        metrics = dict((m['name'], m['value'])
+                       for m in self.factory.service.metrics.snapshot()
+                       if m['name'].startswith('broadcast_'))
+        self.assertEqual(metrics, {'broadcast_sent': 4,
+                                   'broadcast_skipped': 1,
+                                   'broadcast_dropped': 1})
+
+    def test_client_notification_handler(self):
+        received = []
+        factory = JSONRPCClientFactory(FakeEndpoint(), reactor=task.Clock())
+        factory.addNotificationHandler('config', received.append)
+        factory.client.handleResponse(json.dumps(
+            {'jsonrpc': '2.0', 'method': 'config', 'params': ['x']}))
+        factory.client.handleResponse(json.dumps(
+            {'jsonrpc': '2.0', 'method': 'other', 'params': ['y']}))
+        self.assertEqual(received, ['x'])
+
 
 class ClientTestCase(TXJasonTestCase):
     """
@@ -127,6 +472,29 @@ class ClientTestCase(TXJasonTestCase):
                 'message': 'error', 'code': -19}}))
         self.failureResultOf(d, client.JSONRPCClientError)
 
+    def test_cancelRemote(self):
+        """
+        With cancelRemote, a call that times out sends a txjason.cancel
+        notification with its id, and a late response is ignored.
+        """
+        self.factory.cancelRemote = True
+        d = self.factory.callRemote('spam', timeout=1)
+        self.endpoint.transport.clear()
+        self.reactor.advance(1)
+        self.failureResultOf(d, defer.CancelledError)
+        self.assertEqual(
+            json.loads(readNetstring(self.endpoint.transport.value())),
+            {'params': [1], 'jsonrpc': '2.0', 'method': service.CANCEL})
+        self.assertEqual(self.factory.client.requests, {})
+        self.assertEqual(self.factory.client._sent, {})
+
+    def test_cancel_without_cancelRemote(self):
+        d = self.factory.callRemote('spam')
+        self.endpoint.transport.clear()
+        d.cancel()
+        self.failureResultOf(d, defer.CancelledError)
+        self.assertEqual(self.endpoint.transport.value(), '')
+
     def test_notifyRemote(self):
         """
         notifyRemote sends data but and returns a Deferred, but does not expect
@@ -369,3 +737,266 @@ class ClientTestCase(TXJasonTestCase):
         self.endpoint.disconnect(FakeDisconnectedError())
         self.failureResultOf(d, FakeDisconnectedError)
         self.assertEqual(len(self.flushLoggedErrors(FakeDisconnectedError)), 2)
+
+    def test_connection_metrics(self):
+        """
+        Connection attempts, reconnections and the time spent waiting for a
+        connection are recorded.
+        """
+        self.endpoint.deferred = defer.Deferred()
+        d = self.factory.connect()
+        self.reactor.advance(0.5)
+        self.endpoint.deferred.callback(self.factory.buildProtocol(None))
+        self.successResultOf(d)
+        self.factory.endpoint = FakeEndpoint()
+        self.factory._lostProtocol(FakeDisconnectedError())
+        self.flushLoggedErrors(FakeDisconnectedError)
+        self.successResultOf(self.factory.connect())
+        metrics = self.factory.metrics
+        name = self.factory.name
+        self.assertEqual(name, 'FakeEndpoint')
+        self.assertEqual(metrics.counter(
+            'client_connect_attempts', endpoint=name).value, 2)
+        self.assertEqual(metrics.counter(
+            'client_reconnects', endpoint=name).value, 1)
+        wait = metrics.histogram(
+            'client_connection_wait_seconds', endpoint=name)
+        self.assertEqual((wait.count, wait.sum), (2, 0.5))
+
+    def test_negotiate_codec(self):
+        """
+        A factory with preferred codecs negotiates on connection, and then
+        encodes requests and decodes responses with the agreed codec.
+        """
+        self.factory.codecs = ['msgpack']
+        d = self.factory.callRemote('spam')
+        request = json.loads(readNetstring(self.endpoint.transport.value()))
+        self.assertEqual(request['method'], codec.NEGOTIATE)
+        self.assertEqual(request['params'],
+                         {'codecs': ['msgpack', 'json'], 'compression': []})
+        self.endpoint.transport.clear()
+        self.endpoint.proto.stringReceived(json.dumps(
+            {'jsonrpc': '2.0', 'id': 1, 'result': {'codec': 'msgpack'}}))
+        msgpack = codec.get('msgpack')
+        self.assertEqual(
+            msgpack.loads(readNetstring(self.endpoint.transport.value())),
+            {'params': [], 'jsonrpc': '2.0', 'method': 'spam', 'id': 2})
+        self.endpoint.proto.stringReceived(msgpack.dumps(
+            {'jsonrpc': '2.0', 'id': 2, 'result': 'eggs'}))
+        self.assertEqual(self.successResultOf(d), 'eggs')
+
+    def test_negotiate_unsupported(self):
+        """
+        Servers that do not support negotiation answer with an error and the
+        connection stays on JSON.
+        """
+        self.factory.codecs = ['msgpack']
+        d = self.factory.callRemote('spam')
+        self.endpoint.transport.clear()
+        self.endpoint.proto.stringReceived(json.dumps(
+            {'jsonrpc': '2.0', 'id': 1, 'error': {
+                'message': 'Method not found', 'code': -32601}}))
+        self.assertEqual(
+            json.loads(readNetstring(self.endpoint.transport.value())),
+            {'params': [], 'jsonrpc': '2.0', 'method': 'spam', 'id': 2})
+        self.assertNoResult(d)
+
+    def test_negotiate_timeout(self):
+        """
+        If the server does not answer the negotiation request, the connection
+        is dropped instead of being used with a codec the server may not
+        expect.
+        """
+        self.factory.codecs = ['msgpack']
+        d = self.factory.callRemote('spam')
+        self.reactor.advance(5)
+        self.failureResultOf(d, defer.CancelledError)
+        self.assertFalse(self.endpoint.connected)
+        self.assertIdentical(self.factory._proto, None)
+        self.assertEqual(len(self.flushLoggedErrors(defer.CancelledError)), 1)
+
+    def test_negotiate_disconnect(self):
+        """
+        Callers waiting for a connection that is lost during negotiation get
+        the disconnection instead of the dead connection.
+        """
+        self.factory.codecs = ['msgpack']
+        d = self.factory.callRemote('spam')
+        self.endpoint.disconnect(FakeDisconnectedError())
+        self.failureResultOf(d, FakeDisconnectedError)
+        self.assertIdentical(self.factory._proto, None)
+        self.assertEqual(
+            len(self.flushLoggedErrors(FakeDisconnectedError)), 1)
+
+    def test_negotiate_compression(self):
+        """
+        A factory offering compression compresses large requests and
+        decompresses responses once the server agrees.
+        """
+        self.factory.compression = ['zlib']
+        self.factory.compressionThreshold = 10
+        d = self.factory.callRemote('spam', 'x' * 100)
+        self.endpoint.transport.clear()
+        self.endpoint.proto.stringReceived(json.dumps(
+            {'jsonrpc': '2.0', 'id': 1,
+             'result': {'codec': 'json', 'compression': 'zlib'}}))
+        frame = readNetstring(self.endpoint.transport.value())
+        self.assertEqual(frame[0], compression.COMPRESSED)
+        self.assertEqual(
+            json.loads(self.endpoint.proto.decodeFrame(frame))['params'],
+            ['x' * 100])
+        self.endpoint.proto.stringReceived(compression.RAW + json.dumps(
+            {'jsonrpc': '2.0', 'id': 2, 'result': 'eggs'}))
+        self.assertEqual(self.successResultOf(d), 'eggs')
+
+    if codec.get('msgpack') is None:
+        test_negotiate_codec.skip = 'msgpack is not installed'
+
+
+class RefusingEndpoint(FakeEndpoint):
+    def __init__(self, refusals):
+        FakeEndpoint.__init__(self)
+        self.refusals = refusals
+
+    def connect(self, fac):
+        if self.refusals:
+            self.refusals -= 1
+            return defer.fail(error.ConnectionRefusedError())
+        return FakeEndpoint.connect(self, fac)
+
+
+class IdempotentCallTestCase(TXJasonTestCase):
+    """
+    Tests for hedged and retried idempotent calls on JSONRPCClientFactory.
+    """
+
+    def setUp(self):
+        self.reactor = task.Clock()
+        self.endpoint = FakeEndpoint()
+        self.hedgeEndpoint = FakeEndpoint()
+        self.hedgeFactory = JSONRPCClientFactory(
+            self.hedgeEndpoint, reactor=self.reactor)
+        self.factory = JSONRPCClientFactory(
+            self.endpoint, reactor=self.reactor,
+            hedgeFactory=self.hedgeFactory, retries=2)
+        self.factory.latencies.extend([0.1] * 20)
+
+    def respond(self, endpoint, id, **response):
+        response.update({'jsonrpc': '2.0', 'id': id})
+        endpoint.proto.stringReceived(json.dumps(response))
+
+    def test_hedgeDelay(self):
+        """
+        The hedge delay is the configured percentile of observed latencies,
+        and there is none until enough responses have been seen.
+        """
+        self.factory.latencies.clear()
+        self.assertIs(self.factory.hedgeDelay(), None)
+        self.factory.latencies.extend([0.01 * i for i in range(1, 101)])
+        self.assertAlmostEqual(self.factory.hedgeDelay(), 0.96)
+
+    def test_latency_of_failures(self):
+        """
+        Calls answered with an error or timing out are counted in the
+        observed latencies.
+        """
+        self.factory.latencies.clear()
+        d = self.factory.callRemote('spam')
+        self.reactor.advance(0.5)
+        self.respond(self.endpoint, 1, error={'code': -1, 'message': 'x'})
+        self.failureResultOf(d, client.JSONRPCClientError)
+        d = self.factory.callRemote('spam')
+        self.reactor.advance(5)
+        self.failureResultOf(d, defer.CancelledError)
+        self.assertEqual(list(self.factory.latencies), [0.5, 5])
+
+    def test_latency_of_hedge_losers(self):
+        """
+        Attempts cancelled because the other one answered first are not
+        counted in the observed latencies.
+        """
+        d = self.factory.callRemote('spam', idempotent=True)
+        self.reactor.advance(0.1)
+        self.respond(self.hedgeEndpoint, 1, result='eggs')
+        self.successResultOf(d)
+        self.assertEqual(list(self.factory.latencies), [0.1] * 20)
+        self.assertEqual(list(self.factory.hedgeFactory.latencies), [0])
+
+    def test_not_idempotent(self):
+        """
+        Calls that are not marked idempotent are never hedged.
+        """
+        self.factory.callRemote('spam')
+        self.reactor.advance(1)
+        self.assertFalse(self.hedgeEndpoint.connected)
+
+    def test_hedge(self):
+        """
+        A slow idempotent call is duplicated on the hedge factory, the first
+        answer wins and the other request is cancelled.
+        """
+        d = self.factory.callRemote('spam', idempotent=True)
+        self.assertFalse(self.hedgeEndpoint.connected)
+        self.reactor.advance(0.1)
+        self.assert_(self.hedgeEndpoint.connected)
+        self.respond(self.hedgeEndpoint, 1, result='eggs')
+        self.assertEqual(self.successResultOf(d), 'eggs')
+        self.assert_(self.factory.client.requests[1].called)
+
+    def test_no_hedge_when_fast(self):
+        """
+        A call answered before the hedge delay is not duplicated.
+        """
+        d = self.factory.callRemote('spam', idempotent=True)
+        self.respond(self.endpoint, 1, result='eggs')
+        self.assertEqual(self.successResultOf(d), 'eggs')
+        self.reactor.advance(1)
+        self.assertFalse(self.hedgeEndpoint.connected)
+
+    def test_retry_service_unavailable(self):
+        """
+        An idempotent call is retried after a backoff when the server answers
+        with a ServiceUnavailableError.
+        """
+        self.factory.hedgeFactory = None
+        d = self.factory.callRemote('spam', idempotent=True)
+        self.respond(self.endpoint, 1,
+                     error=service.ServiceUnavailableError().dumps())
+        self.assertNoResult(d)
+        self.reactor.advance(self.factory.retryDelay)
+        self.respond(self.endpoint, 2, result='eggs')
+        self.assertEqual(self.successResultOf(d), 'eggs')
+
+    def test_retry_connection_refused(self):
+        """
+        An idempotent call is retried after a connection failure, and fails
+        once the retries are exhausted.
+        """
+        self.factory.hedgeFactory = None
+        self.factory.endpoint = RefusingEndpoint(3)
+        d = self.factory.callRemote('spam', idempotent=True)
+        self.reactor.advance(self.factory.retryDelay)
+        self.assertNoResult(d)
+        self.reactor.advance(self.factory.retryDelay * 2)
+        self.failureResultOf(d, error.ConnectionRefusedError)
+        self.assertEqual(
+            len(self.flushLoggedErrors(error.ConnectionRefusedError)), 3)
+
+    def test_application_error_not_retried(self):
+        """
+        Ordinary error responses are returned without retrying.
+        """
+        d = self.factory.callRemote('spam', idempotent=True)
+        self.respond(self.endpoint, 1, error={'code': -1, 'message': 'no'})
+        self.failureResultOf(d, client.JSONRPCClientError)
+
+    def test_cancel(self):
+        """
+        Cancelling an idempotent call cancels every attempt in flight.
+        """
+        d = self.factory.callRemote('spam', idempotent=True)
+        self.reactor.advance(0.1)
+        d.cancel()
+        self.failureResultOf(d, defer.CancelledError)
+        self.assert_(self.factory.client.requests[1].called)
+        self.assert_(self.hedgeFactory.client.requests[1].called)
@@ -0,0 +1,92 @@
+import json
+
+from twisted.internet import task
+from twisted.test import proto_helpers
+
+from txjason import netstring, ratelimit, service
+
+from common import TXJasonTestCase
+
+
+class RateLimiterTestCase(TXJasonTestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.service = service.JSONRPCService(reactor=self.clock)
+        self.calls = []
+        self.service.add(self.calls.append, 'record')
+        self.service.add(lambda: 'ok', 'other')
+
+    def call(self, method='record', connection=None):
+        request = {'jsonrpc': '2.0', 'method': method, 'id': 1}
+        if method == 'record':
+            request['params'] = [method]
+        d = self.service.call(json.dumps(request), connection=connection)
+        return json.loads(self.successResultOf(d))
+
+    def test_burst_and_refill(self):
+        self.service.addInterceptor(ratelimit.RateLimiter(
+            rate=2, burst=3, key=ratelimit.byMethod, reactor=self.clock))
+        for i in range(3):
+            self.assertNotIn('error', self.call())
+        response = self.call()
+        self.assertEqual(response['error'],
+                         {'code': -32096, 'message': 'Rate limit exceeded',
+                          'data': {'retryAfter': 0.5}})
+        self.assertEqual(len(self.calls), 3)
+        self.clock.advance(0.5)
+        self.assertNotIn('error', self.call())
+        self.assertIn('error', self.call())
+
+    def test_methods(self):
+        self.service.addInterceptor(ratelimit.RateLimiter(
+            rate=1, key=ratelimit.byMethod, methods=['record'],
+            reactor=self.clock))
+        self.assertNotIn('error', self.call())
+        self.assertIn('error', self.call())
+        self.assertEqual(self.call('other')['result'], 'ok')
+        self.assertEqual(self.call('other')['result'], 'ok')
+
+    def test_unkeyed_requests(self):
+        self.service.addInterceptor(ratelimit.RateLimiter(
+            rate=1, reactor=self.clock))
+        self.assertNotIn('error', self.call())
+        self.assertNotIn('error', self.call())
+
+    def test_by_connection(self):
+        self.service.addInterceptor(ratelimit.RateLimiter(
+            rate=1, key=ratelimit.byConnection, reactor=self.clock))
+        a, b = object(), object()
+        self.assertNotIn('error', self.call(connection=a))
+        self.assertIn('error', self.call(connection=a))
+        self.assertNotIn('error', self.call(connection=b))
+
+    def test_evict_least_recently_used(self):
+        limiter = ratelimit.RateLimiter(
+            rate=1, key=ratelimit.byConnection, reactor=self.clock)
+        limiter.maxBuckets = 2
+        self.service.addInterceptor(limiter)
+        self.call(connection=1)
+        self.call(connection=2)
+        self.call(connection=1)
+        # Neither bucket has refilled; 2 was used least recently.
+        self.call(connection=3)
+        self.assertEqual(list(limiter.buckets), [1, 3])
+
+
+class PeerRateLimitTestCase(TXJasonTestCase):
+    def test_by_peer(self):
+        clock = task.Clock()
+        factory = netstring.JSONRPCServerFactory()
+        factory.service.add(lambda: 'ok', 'ok')
+        factory.service.addInterceptor(ratelimit.RateLimiter(
+            rate=1, reactor=clock))
+        request = '{"jsonrpc": "2.0", "method": "ok", "id": 1}'
+        responses = []
+        for i in range(2):
+            proto = factory.buildProtocol(('127.0.0.1', 0))
+            transport = proto_helpers.StringTransport()
+            proto.makeConnection(transport)
+            proto.stringReceived(request)
+            responses.append(transport.value())
+        self.assertIn('"result": "ok"', responses[0])
+        self.assertIn('-32096', responses[1])
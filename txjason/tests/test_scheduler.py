@@ -0,0 +1,138 @@
+import json
+
+from twisted.internet import defer, task
+
+from txjason import handler, scheduler, service
+
+from common import TXJasonTestCase
+
+
+class FairSchedulerTestCase(TXJasonTestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.scheduler = scheduler.FairScheduler(
+            concurrency=1, reactor=self.clock)
+        self.order = []
+
+    def acquire(self, name, priority=scheduler.NORMAL, connection=None):
+        d = self.scheduler.acquire(priority, connection)
+        d.addCallback(lambda ign: self.order.append(name))
+        return d
+
+    def drain(self):
+        while self.scheduler.active:
+            self.scheduler.release()
+            self.clock.advance(0)
+
+    def test_immediate(self):
+        self.acquire('a')
+        self.assertEqual(self.order, ['a'])
+        self.assertEqual(self.scheduler.active, 1)
+
+    def test_round_robin(self):
+        self.acquire('busy')
+        for name in ('a1', 'a2', 'a3'):
+            self.acquire(name, connection='a')
+        self.acquire('b1', connection='b')
+        self.drain()
+        self.assertEqual(self.order, ['busy', 'a1', 'b1', 'a2', 'a3'])
+
+    def test_priority(self):
+        self.acquire('busy')
+        self.acquire('bulk', scheduler.BULK, 'a')
+        self.acquire('normal', scheduler.NORMAL, 'b')
+        self.acquire('interactive', scheduler.INTERACTIVE, 'c')
+        self.drain()
+        self.assertEqual(self.order,
+                         ['busy', 'interactive', 'normal', 'bulk'])
+
+    def test_control_not_queued(self):
+        self.acquire('busy')
+        self.acquire('queued')
+        self.acquire('control', scheduler.CONTROL)
+        self.assertEqual(self.order, ['busy', 'control'])
+
+    def test_cancel_queued(self):
+        self.acquire('busy')
+        d = self.acquire('cancelled', connection='a')
+        self.acquire('b', connection='b')
+        d.cancel()
+        self.failureResultOf(d, defer.CancelledError)
+        self.assertEqual(self.scheduler.queued, 1)
+        self.drain()
+        self.assertEqual(self.order, ['busy', 'b'])
+
+    def test_quantum(self):
+        sched = scheduler.FairScheduler(
+            concurrency=10, quantum=2, reactor=self.clock)
+        ds = [sched.acquire(scheduler.NORMAL, None) for i in range(5)]
+
+        def nextTurn():
+            # Clock.advance would also run calls scheduled while advancing;
+            # run just the one scheduled for the next reactor turn.
+            [call] = self.clock.getDelayedCalls()
+            self.clock.calls.remove(call)
+            call.func(*call.args, **call.kw)
+        self.assertEqual([d.called for d in ds],
+                         [True, True, False, False, False])
+        nextTurn()
+        self.assertEqual([d.called for d in ds],
+                         [True, True, True, True, False])
+        nextTurn()
+        self.assertTrue(ds[4].called)
+
+
+class Example(handler.Handler):
+    def __init__(self, log):
+        self.log = log
+
+    @handler.exportRPC()
+    def bulk(self, x):
+        self.log.append(('bulk', x))
+        return x
+
+    @handler.exportRPC(priority=scheduler.INTERACTIVE)
+    def interactive(self, x):
+        self.log.append(('interactive', x))
+        return x
+
+
+class ServiceSchedulingTestCase(TXJasonTestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.service = service.JSONRPCService(
+            reactor=self.clock,
+            scheduler=scheduler.FairScheduler(
+                concurrency=1, reactor=self.clock))
+        self.log = []
+        Example(self.log).addToService(self.service)
+
+    def test_export_priority(self):
+        self.assertEqual(self.service.method_data['interactive']['priority'],
+                         scheduler.INTERACTIVE)
+        self.assertEqual(self.service.method_data['bulk']['priority'], 0)
+
+    def test_batch_does_not_starve_other_connections(self):
+        batch = [{'jsonrpc': '2.0', 'method': 'bulk', 'params': [i], 'id': i}
+                 for i in range(4)]
+        d1 = self.service.call(json.dumps(batch), connection='a')
+        d2 = self.service.call(json.dumps(
+            {'jsonrpc': '2.0', 'method': 'interactive', 'params': ['x'],
+             'id': 'x'}), connection='b')
+        self.clock.advance(0)
+        self.assertEqual(self.log[:2], [('bulk', 0), ('interactive', 'x')])
+        self.clock.pump([0] * 4)
+        self.assertEqual([r['result'] for r in
+                          json.loads(self.successResultOf(d1))], [0, 1, 2, 3])
+        self.assertEqual(json.loads(self.successResultOf(d2))['result'], 'x')
+
+    def test_timeout_while_queued(self):
+        self.service.timeout = 1
+        self.service.scheduler.acquire(scheduler.NORMAL, None)
+        d = self.service.call(json.dumps(
+            {'jsonrpc': '2.0', 'method': 'bulk', 'params': [1], 'id': 1}))
+        self.clock.advance(1)
+        self.assertEqual(json.loads(self.successResultOf(d))['error']['code'],
+                         -32098)
+        self.assertEqual(self.service.scheduler.queued, 0)
+        self.assertEqual(self.log, [])
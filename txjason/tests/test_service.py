@@ -42,6 +42,26 @@ def delay(d):
     return task.deferLater(clock, d, lambda: 'x')
 
 
+def logged(f):
+    def wrapper(*args, **kwargs):
+        return f(*args, **kwargs)
+    wrapper.__wrapped__ = f
+    return wrapper
+
+
+@logged
+def wrapped_subtract(minuend, subtrahend=0):
+    return minuend-subtrahend
+
+
+class Adder(object):
+    def add(self, x, y):
+        return x + y
+
+    def __call__(self, x):
+        return x
+
+
 class ServiceTestCase(TXJasonTestCase):
     def setUp(self):
         self.service = service.JSONRPCService(reactor=clock)
@@ -267,6 +287,132 @@ class ServiceTestCase(TXJasonTestCase):
 
         yield self.makeRequest(request, expected)
 
+    @defer.inlineCallbacks
+    def test_batch_too_large(self):
+        self.service.maxBatchSize = 1
+        request = [
+            {"jsonrpc": "2.0", "method": "subtract", "params": [2, 1],
+             "id": 1},
+            {"jsonrpc": "2.0", "method": "subtract", "params": [3, 1],
+             "id": 2},
+        ]
+        expected = {"jsonrpc": "2.0",
+                    "error": {"code": -32094, "message": "Batch too large",
+                              "data": {"maxBatchSize": 1}},
+                    "id": None}
+        yield self.makeRequest(request, expected)
+
+    def test_batch_quantum(self):
+        """
+        With batchQuantum, a large batch is started batchQuantum requests per
+        reactor turn.
+        """
+        reactor = task.Clock()
+        calls = []
+        svc = service.JSONRPCService(reactor=reactor, batchQuantum=2)
+        svc.add(lambda x: calls.append(x) or x, 'echo')
+        request = [{"jsonrpc": "2.0", "method": "echo", "params": [i],
+                    "id": i} for i in range(1, 6)]
+        request.insert(2, {"foo": "bar"})
+
+        def nextTurn():
+            # Clock.advance would also run calls scheduled while advancing.
+            [call] = reactor.getDelayedCalls()
+            reactor.calls.remove(call)
+            call.func(*call.args, **call.kw)
+        d = svc.call(json.dumps(request))
+        self.assertEqual(calls, [])
+        nextTurn()
+        self.assertEqual(calls, [1, 2])
+        nextTurn()
+        self.assertEqual(calls, [1, 2, 3])
+        nextTurn()
+        self.assertEqual(calls, [1, 2, 3, 4, 5])
+        nextTurn()
+        self.assertEqual(json.loads(self.successResultOf(d)), [
+            {'error': {'code': -32600, 'message': 'Invalid request'},
+             'id': None, 'jsonrpc': '2.0'}] + [
+            {'jsonrpc': '2.0', 'result': i, 'id': i} for i in range(1, 6)])
+
+    def test_small_batch_not_deferred(self):
+        svc = service.JSONRPCService(reactor=task.Clock(), batchQuantum=2)
+        svc.add(subtract)
+        d = svc.call(json.dumps([
+            {"jsonrpc": "2.0", "method": "subtract", "params": [2, 1],
+             "id": 1}]))
+        self.assertEqual(json.loads(self.successResultOf(d)),
+                         [{'jsonrpc': '2.0', 'result': 1, 'id': 1}])
+
+    def test_memory_budget(self):
+        """
+        Calls wait until their size fits in the memory budget, in order.
+        """
+        waiting = []
+        self.service.add(lambda: waiting.append(defer.Deferred()) or
+                         waiting[-1], 'wait')
+        request = json.dumps({"jsonrpc": "2.0", "method": "wait", "id": 1})
+        self.service.memoryBudget = len(request) * 2
+        d1 = self.service.call(request)
+        d2 = self.service.call(request)
+        d3 = self.service.call(request)
+        self.assertEqual(len(waiting), 2)
+        self.assertEqual(self.service.memoryUsage, len(request) * 2)
+        self.assertTrue(self.service.overBudget())
+        resumed = self.service.whenMemoryAvailable()
+        waiting[0].callback(1)
+        self.assertEqual(len(waiting), 3)
+        self.assertNoResult(resumed)
+        waiting[1].callback(2)
+        waiting[2].callback(3)
+        self.successResultOf(resumed)
+        self.assertEqual(self.service.memoryUsage, 0)
+        self.assertEqual(
+            [json.loads(self.successResultOf(d))['result']
+             for d in (d1, d2, d3)], [1, 2, 3])
+
+    def test_memory_budget_disconnect(self):
+        """
+        Calls waiting for memory are dropped when their connection is lost,
+        letting the ones behind them in.
+        """
+        waiting = []
+        self.service.add(lambda: waiting.append(defer.Deferred()) or
+                         waiting[-1], 'wait')
+        request = json.dumps({"jsonrpc": "2.0", "method": "wait", "id": 1})
+        self.service.memoryBudget = len(request) * 2
+        first, lost, other = object(), object(), object()
+        self.service.call(request, connection=first)
+        self.service.call(request, connection=first)
+        d1 = self.service.call(request, connection=lost)
+        d2 = self.service.call(request, connection=other)
+        self.service.connectionLost(lost)
+        self.assertIsNone(self.successResultOf(d1))
+        self.assertEqual(len(self.service._memoryQueue), 1)
+        waiting[0].callback(1)
+        self.assertEqual(len(waiting), 3)
+        waiting[1].callback(2)
+        waiting[2].callback(3)
+        self.assertEqual(json.loads(self.successResultOf(d2))['result'], 3)
+        self.assertEqual(self.service.memoryUsage, 0)
+        self.assertFalse(self.service.overBudget())
+
+    def test_estimateSize(self):
+        self.assertEqual(service.estimateSize({'ab': [1, 'cd']}, 100), 26)
+        self.assertEqual(service.estimateSize(range(1000), 100), 100)
+        self.assertEqual(service.estimateSize(['x' * 1000], 100), 100)
+
+    @defer.inlineCallbacks
+    def test_memory_budget_exceeded(self):
+        request = {"jsonrpc": "2.0", "method": "subtract", "params": [2, 1],
+                   "id": 1}
+        self.service.memoryBudget = 10
+        expected = {"jsonrpc": "2.0",
+                    "error": {"code": -32093, "message": "Request too large",
+                              "data": {"memoryBudget": 10}},
+                    "id": None}
+        yield self.makeRequest(request, expected)
+        self.assertEqual(self.service.memoryUsage, 0)
+
     @defer.inlineCallbacks
     def test_timeout(self):
         request = {"jsonrpc": "2.0",
@@ -315,6 +461,46 @@ class ServiceTestCase(TXJasonTestCase):
         self.assertTrue(e[0].check(TypeError))
 
 
+    def test_positional_args(self):
+        self.assertEqual(service.positional_args(subtract), (2, 2))
+        self.assertEqual(service.positional_args(update), (0, None))
+        self.assertEqual(service.positional_args(wrapped_subtract), (1, 2))
+        self.assertEqual(service.positional_args(Adder().add), (2, 2))
+        self.assertEqual(service.positional_args(Adder()), (1, 1))
+        self.assertEqual(service.positional_args(len), (None, None))
+
+    @defer.inlineCallbacks
+    def test_wrapped_handler_arguments(self):
+        self.service.add(wrapped_subtract, 'wrapped_subtract')
+        request = {"jsonrpc": "2.0",
+                   "method": "wrapped_subtract",
+                   "params": [1, 2, 3],
+                   "id": 1}
+        expected = {"jsonrpc": "2.0",
+                    "error": {"code": -32602,
+                              "message": "Invalid params",
+                              "data": "too many arguments"},
+                    "id": 1}
+        yield self.makeRequest(request, expected)
+        request["params"] = [42]
+        expected = {"jsonrpc": "2.0", "result": 42, "id": 1}
+        yield self.makeRequest(request, expected)
+
+    @defer.inlineCallbacks
+    def test_bound_method_arguments(self):
+        self.service.add(Adder().add, 'add')
+        request = {"jsonrpc": "2.0",
+                   "method": "add",
+                   "params": [1, 2, 3],
+                   "id": 1}
+        expected = {"jsonrpc": "2.0",
+                    "error": {"code": -32602,
+                              "message": "Invalid params",
+                              "data": "too many arguments"},
+                    "id": 1}
+        yield self.makeRequest(request, expected)
+
+
 class FakeJSONRPCClientFactory(object):
     def __init__(self, failure=None):
         self.failure = failure
@@ -0,0 +1,116 @@
+import collections
+import json
+
+from twisted.internet import defer, task
+from twisted.python import log
+
+from txjason import service
+from txjason.slowlog import SlowLog, Timing
+
+from common import TXJasonTestCase
+
+
+class TimingTestCase(TXJasonTestCase):
+    def test_durations(self):
+        clock = task.Clock()
+        timing = Timing(clock.seconds, 10, None)
+        for stage, delay in [('parsed', 1), ('validated', 2), ('started', 3),
+                             ('finished', 4), ('serialized', 5)]:
+            clock.advance(delay)
+            setattr(timing, stage, clock.seconds())
+        self.assertEqual(timing.durations(), (
+            {'parse': 1, 'validate': 2, 'queue': 3, 'handler': 4,
+             'serialize': 5}, 15))
+
+    def test_missing_stages(self):
+        """
+        Stages a failed call did not reach take no time.
+        """
+        clock = task.Clock()
+        timing = Timing(clock.seconds, 10, None)
+        clock.advance(1)
+        timing.parsed = clock.seconds()
+        clock.advance(2)
+        timing.serialized = clock.seconds()
+        self.assertEqual(timing.durations(), (
+            {'parse': 1, 'validate': 0, 'queue': 0, 'handler': 0,
+             'serialize': 2}, 3))
+
+
+class SlowLogTestCase(TXJasonTestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.slowLog = SlowLog(threshold=1, clock=self.clock.seconds)
+        self.service = service.JSONRPCService(
+            reactor=self.clock, slowLog=self.slowLog)
+        self.service.add(self.sleep)
+        self.messages = []
+        log.addObserver(self.messages.append)
+        self.addCleanup(log.removeObserver, self.messages.append)
+
+    def sleep(self, seconds):
+        return task.deferLater(self.clock, seconds, lambda: seconds)
+
+    def request(self, seconds):
+        return json.dumps({'jsonrpc': '2.0', 'method': 'sleep',
+                           'params': [seconds], 'id': 1})
+
+    def test_slow_request(self):
+        data = self.request(2)
+        d = self.service.call(data)
+        self.clock.advance(2)
+        self.successResultOf(d)
+        [entry] = self.slowLog.entries
+        self.assertEqual(entry['methods'], ['sleep'])
+        self.assertEqual(entry['size'], len(data))
+        self.assertEqual(entry['total'], 2)
+        self.assertEqual(entry['stages']['handler'], 2)
+        [message] = [m for m in self.messages
+                     if 'Slow JSON-RPC request' in m['message'][0]]
+        self.assertIn('sleep', message['message'][0])
+        self.assertIn('handler=2.000', message['message'][0])
+
+    def test_fast_request(self):
+        d = self.service.call(self.request(0.5))
+        self.clock.advance(0.5)
+        self.successResultOf(d)
+        self.assertEqual(list(self.slowLog.entries), [])
+
+    def test_batch(self):
+        d = self.service.call(json.dumps([
+            {'jsonrpc': '2.0', 'method': 'sleep', 'params': [i], 'id': i}
+            for i in (1, 2)]))
+        self.clock.advance(1)
+        self.clock.advance(1)
+        self.successResultOf(d)
+        [entry] = self.slowLog.entries
+        self.assertEqual(entry['methods'], ['sleep', 'sleep'])
+        self.assertEqual(entry['total'], 2)
+
+    def test_sampling(self):
+        self.slowLog.sampleRate = 0.5
+        self.slowLog._random = lambda: 0.7
+        d = self.service.call(self.request(2))
+        self.clock.advance(2)
+        self.successResultOf(d)
+        self.assertEqual(list(self.slowLog.entries), [])
+
+    def test_maxEntries(self):
+        self.slowLog.entries = collections.deque(maxlen=1)
+        for seconds in (2, 3):
+            d = self.service.call(self.request(seconds))
+            self.clock.advance(seconds)
+            self.successResultOf(d)
+        [entry] = self.slowLog.entries
+        self.assertEqual(entry['total'], 3)
+
+    @defer.inlineCallbacks
+    def test_parse_error(self):
+        """
+        Calls that fail before reaching a handler are still timed.
+        """
+        self.slowLog.threshold = 0
+        yield self.service.call('{')
+        [entry] = self.slowLog.entries
+        self.assertEqual(entry['methods'], [])
+        self.assertEqual(entry['total'], 0)
@@ -0,0 +1,187 @@
+import json
+
+from twisted.internet import defer, task
+from twisted.test import proto_helpers
+
+from txjason import client, handler, stream
+from txjason.netstring import JSONRPCServerFactory, JSONRPCClientFactory
+
+from common import TXJasonTestCase
+from test_netstring import FakeEndpoint
+
+
+def readNetstrings(data):
+    messages = []
+    while data:
+        length, rest = data.split(':', 1)
+        messages.append(json.loads(rest[:int(length)]))
+        data = rest[int(length) + 1:]
+    return messages
+
+
+class Rows(handler.Handler):
+    def __init__(self):
+        self.produced = []
+        self.closed = False
+        self.pending = None
+
+    @handler.exportRPC(stream=True)
+    def rows(self, n):
+        try:
+            for i in range(n):
+                self.produced.append(i)
+                yield i
+        finally:
+            self.closed = True
+
+    @handler.exportRPC(stream=True)
+    def slow(self):
+        yield 'a'
+        self.pending = defer.Deferred()
+        yield self.pending
+
+    @handler.exportRPC(stream=True)
+    def broken(self):
+        yield 'a'
+        raise ValueError('broken')
+
+
+class ServerStreamTestCase(TXJasonTestCase):
+    def setUp(self):
+        self.factory = JSONRPCServerFactory()
+        self.handler = Rows()
+        self.factory.addHandler(self.handler, 'db')
+        self.proto = self.factory.buildProtocol(('127.0.0.1', 0))
+        self.tr = proto_helpers.StringTransport()
+        self.proto.makeConnection(self.tr)
+
+    def request(self, method, params, streamed=True):
+        request = {'jsonrpc': '2.0', 'method': method, 'params': params,
+                   'id': 1}
+        if streamed:
+            request[stream.STREAM] = True
+        data = json.dumps(request)
+        self.proto.dataReceived('%d:%s,' % (len(data), data))
+
+    def test_stream(self):
+        self.request('db.rows', [3])
+        self.assertEqual(readNetstrings(self.tr.value()), [
+            {'jsonrpc': '2.0', 'method': stream.STREAM, 'params': [1, 0]},
+            {'jsonrpc': '2.0', 'method': stream.STREAM, 'params': [1, 1]},
+            {'jsonrpc': '2.0', 'method': stream.STREAM, 'params': [1, 2]},
+            {'jsonrpc': '2.0', 'id': 1, 'result': 3}])
+
+    def test_not_streamed(self):
+        """
+        Clients that do not ask for a stream get the list of chunks.
+        """
+        self.request('db.rows', [3], streamed=False)
+        self.assertEqual(readNetstrings(self.tr.value()),
+                         [{'jsonrpc': '2.0', 'id': 1, 'result': [0, 1, 2]}])
+
+    def test_deferred_chunks(self):
+        self.request('db.slow', [])
+        self.assertEqual(len(readNetstrings(self.tr.value())), 1)
+        self.handler.pending.callback('b')
+        self.assertEqual(readNetstrings(self.tr.value())[1:], [
+            {'jsonrpc': '2.0', 'method': stream.STREAM, 'params': [1, 'b']},
+            {'jsonrpc': '2.0', 'id': 1, 'result': 2}])
+
+    def test_flow_control(self):
+        """
+        The method is paused while the transport's write buffer is full.
+        """
+        self.request('db.rows', [1])
+        self.assertIdentical(self.tr.producer, self.proto)
+        self.tr.clear()
+        self.handler.produced = []
+        self.proto.pauseProducing()
+        self.request('db.rows', [3])
+        self.assertEqual(self.handler.produced, [0])
+        self.proto.resumeProducing()
+        self.assertEqual(self.handler.produced, [0, 1, 2])
+        self.assertEqual(readNetstrings(self.tr.value())[-1],
+                         {'jsonrpc': '2.0', 'id': 1, 'result': 3})
+
+    def test_disconnect(self):
+        """
+        A stream stops, and its generator is closed, when the connection is
+        lost.
+        """
+        self.proto.pauseProducing()
+        self.request('db.rows', [3])
+        self.proto.connectionLost(None)
+        self.assertEqual(self.handler.produced, [0])
+        self.assertTrue(self.handler.closed)
+
+    def test_error(self):
+        self.request('db.broken', [])
+        self.assertEqual(readNetstrings(self.tr.value())[-1],
+                         {'jsonrpc': '2.0', 'id': 1,
+                          'error': {'code': -32000,
+                                    'message': 'Server error'}})
+        self.assertEqual(len(self.flushLoggedErrors(ValueError)), 1)
+
+
+class ClientStreamTestCase(TXJasonTestCase):
+    def setUp(self):
+        self.reactor = task.Clock()
+        self.endpoint = FakeEndpoint()
+        self.factory = JSONRPCClientFactory(
+            self.endpoint, reactor=self.reactor)
+
+    def receive(self, message):
+        self.endpoint.proto.stringReceived(json.dumps(message))
+
+    def chunk(self, chunk):
+        self.receive({'jsonrpc': '2.0', 'method': stream.STREAM,
+                      'params': [1, chunk]})
+
+    def test_callRemoteStream(self):
+        chunks = self.factory.callRemoteStream('db.rows', 2)
+        [request] = readNetstrings(self.endpoint.transport.value())
+        self.assertTrue(request[stream.STREAM])
+        d = chunks.wait()
+        self.assertNoResult(d)
+        self.chunk('a')
+        self.assertTrue(self.successResultOf(d))
+        self.chunk('b')
+        self.assertEqual(list(chunks), ['a', 'b'])
+        d = chunks.wait()
+        self.receive({'jsonrpc': '2.0', 'id': 1, 'result': 2})
+        self.assertFalse(self.successResultOf(d))
+        self.assertEqual(chunks.result, 2)
+        self.assertEqual(self.factory.client.streams, {})
+
+    def test_error_after_chunks(self):
+        chunks = self.factory.callRemoteStream('db.rows', 2)
+        self.chunk('a')
+        self.receive({'jsonrpc': '2.0', 'id': 1,
+                      'error': {'code': -32000, 'message': 'Server error'}})
+        self.assertTrue(self.successResultOf(chunks.wait()))
+        self.assertEqual(list(chunks), ['a'])
+        self.failureResultOf(chunks.wait(), client.JSONRPCClientError)
+
+    def test_timeout_reset_by_chunks(self):
+        chunks = self.factory.callRemoteStream('db.rows', 2, timeout=2)
+        self.reactor.advance(1.5)
+        self.chunk('a')
+        self.reactor.advance(1.5)
+        self.assertFalse(chunks.done)
+        self.reactor.advance(1)
+        self.assertEqual(list(chunks), ['a'])
+        self.failureResultOf(chunks.wait(), defer.CancelledError)
+        # Late chunks are ignored.
+        self.chunk('b')
+        self.assertEqual(list(chunks), [])
+
+    def test_pause_reading(self):
+        chunks = self.factory.callRemoteStream('db.rows', 3)
+        chunks.maxBuffered = 1
+        transport = self.endpoint.transport
+        self.chunk('a')
+        self.assertEqual(transport.producerState, 'producing')
+        self.chunk('b')
+        self.assertEqual(transport.producerState, 'paused')
+        self.assertEqual(list(chunks), ['a', 'b'])
+        self.assertEqual(transport.producerState, 'producing')
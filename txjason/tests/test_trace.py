@@ -0,0 +1,188 @@
+import json
+
+from twisted.internet import defer, task
+
+from txjason import client, service, trace
+from txjason.trace import TRACE, Tracer, TraceHandler
+
+from common import TXJasonTestCase
+
+
+class TracerTestCase(TXJasonTestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.tracer = Tracer(maxSpans=3, clock=self.clock.seconds)
+
+    def test_ring_buffer(self):
+        for i in range(5):
+            self.tracer.record('t%d' % i, None, 'call', i, i + 1)
+        self.assertEqual([s['traceId'] for s in self.tracer.dump()],
+                         ['t2', 't3', 't4'])
+        [span] = self.tracer.dump('t3')
+        self.assertEqual(span['start'], 3)
+        self.assertEqual(span['duration'], 1)
+
+    def test_sampling(self):
+        self.tracer.sampleRate = 0.5
+        self.tracer._random = lambda: 0.7
+        self.assertFalse(self.tracer.sample())
+        self.tracer._random = lambda: 0.2
+        self.assertTrue(self.tracer.sample())
+
+    def test_export(self):
+        self.tracer.record('t', None, 'call', 0, 1, 'echo')
+        path = self.mktemp()
+        self.assertEqual(self.tracer.export(path), 1)
+        self.assertEqual(self.tracer.export(path), 1)
+        with open(path) as f:
+            spans = [json.loads(line) for line in f]
+        self.assertEqual(len(spans), 2)
+        self.assertEqual(spans[0]['method'], 'echo')
+
+
+class ServiceTraceTestCase(TXJasonTestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.tracer = Tracer(clock=self.clock.seconds)
+        self.service = service.JSONRPCService(
+            reactor=self.clock, tracer=self.tracer)
+        self.service.add(self.sleep)
+
+    def sleep(self, seconds):
+        return task.deferLater(self.clock, seconds, lambda: seconds)
+
+    def request(self, id, envelope=None):
+        request = {'jsonrpc': '2.0', 'method': 'sleep', 'params': [id],
+                   'id': id}
+        if envelope is not None:
+            request[TRACE] = envelope
+        return request
+
+    def test_adopt(self):
+        """
+        A request carrying a trace context records its stages as children of
+        the client's span.
+        """
+        d = self.service.call(json.dumps(self.request(
+            2, {'traceId': 'abc', 'spanId': 'def'})))
+        self.clock.advance(2)
+        self.successResultOf(d)
+        spans = self.tracer.dump()
+        self.assertEqual([s['name'] for s in spans],
+                         ['parse', 'queue', 'execute', 'serialize'])
+        for span in spans:
+            self.assertEqual(span['traceId'], 'abc')
+            self.assertEqual(span['parentId'], 'def')
+            self.assertEqual(span['method'], 'sleep')
+        self.assertEqual(spans[2]['duration'], 2)
+
+    def test_sampled(self):
+        self.tracer.sampleRate = 0
+        d = self.service.call(json.dumps(self.request(0)))
+        self.clock.advance(0)
+        self.successResultOf(d)
+        self.assertEqual(self.tracer.dump(), [])
+        self.tracer.sampleRate = 1
+        d = self.service.call(json.dumps(self.request(0)))
+        self.clock.advance(0)
+        self.successResultOf(d)
+        spans = self.tracer.dump()
+        self.assertEqual(len(spans), 4)
+        self.assertEqual(len(set(s['traceId'] for s in spans)), 1)
+        self.assertIdentical(spans[0]['parentId'], None)
+
+    def test_not_sampled(self):
+        """
+        Calls that are not sampled and carry no trace context allocate no
+        trace objects and do not read the tracer's clock.
+        """
+        self.tracer.sampleRate = 0
+        allocated = []
+        for cls in (trace.CallTrace, trace.Trace):
+            init = cls.__init__
+            self.patch(cls, '__init__',
+                       lambda self, *a, **kw: allocated.append(self) or
+                       init(self, *a, **kw))
+        self.tracer.clock = lambda: allocated.append('clock') or 0
+        d = self.service.call(json.dumps([self.request(0), self.request(0)]))
+        self.clock.advance(0)
+        self.successResultOf(d)
+        self.assertEqual(allocated, [])
+        self.assertEqual(self.tracer.dump(), [])
+
+    def test_batch(self):
+        self.tracer.sampleRate = 0
+        d = self.service.call(json.dumps([
+            self.request(1, {'traceId': 'a'}), self.request(1)]))
+        self.clock.advance(1)
+        self.successResultOf(d)
+        self.assertEqual(set(s['traceId'] for s in self.tracer.dump()),
+                         set(['a']))
+
+    @defer.inlineCallbacks
+    def test_invalid_types(self):
+        """
+        Stages a failed request did not reach are not recorded.
+        """
+        self.service.add(self.sleep, name='typed', types=[int])
+        yield self.service.call(json.dumps(
+            {'jsonrpc': '2.0', 'method': 'typed', 'params': ['1'], 'id': 1,
+             TRACE: {'traceId': 'a'}}))
+        self.assertEqual([s['name'] for s in self.tracer.dump()],
+                         ['parse', 'serialize'])
+
+    @defer.inlineCallbacks
+    def test_handler(self):
+        TraceHandler(self.tracer).addToService(self.service)
+        self.tracer.record('a', None, 'call', 0, 1)
+        self.tracer.record('b', None, 'call', 0, 1)
+        result = yield self.service.call_py(json.dumps(
+            {'jsonrpc': '2.0', 'method': 'txjason.traces', 'params': ['b'],
+             'id': 1}))
+        self.assertEqual([s['traceId'] for s in result['result']], ['b'])
+
+
+class ClientTraceTestCase(TXJasonTestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.tracer = Tracer(clock=self.clock.seconds)
+        self.client = client.JSONRPCClient(
+            reactor=self.clock, tracer=self.tracer)
+
+    def test_propagation(self):
+        """
+        The client sends its span's ids, which the server adopts.
+        """
+        payload, d = self.client.getRequest('sleep', 1)
+        envelope = json.loads(payload)[TRACE]
+        svc = service.JSONRPCService(reactor=self.clock, tracer=self.tracer)
+        svc.add(lambda seconds: task.deferLater(
+            self.clock, seconds, lambda: seconds), name='sleep')
+        response = svc.call(payload)
+        self.clock.advance(1)
+        self.client.handleResponse(self.successResultOf(response))
+        self.assertEqual(self.successResultOf(d), 1)
+        spans = self.tracer.dump(envelope['traceId'])
+        self.assertEqual([s['name'] for s in spans],
+                         ['parse', 'queue', 'execute', 'serialize', 'call'])
+        call = spans[-1]
+        self.assertEqual(call['spanId'], envelope['spanId'])
+        self.assertEqual(call['duration'], 1)
+        self.assertEqual(call['method'], 'sleep')
+        for span in spans[:-1]:
+            self.assertEqual(span['parentId'], call['spanId'])
+
+    def test_timeout(self):
+        payload, d = self.client.getRequest('sleep', 1, timeout=2)
+        self.clock.advance(2)
+        self.failureResultOf(d, defer.CancelledError)
+        [span] = self.tracer.dump()
+        self.assertEqual(span['duration'], 2)
+
+    def test_not_sampled(self):
+        self.tracer.sampleRate = 0
+        payload, d = self.client.getRequest('sleep', 1)
+        self.assertNotIn(TRACE, json.loads(payload))
+        d.cancel()
+        self.failureResultOf(d, defer.CancelledError)
+        self.assertEqual(self.tracer.dump(), [])
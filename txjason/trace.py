@@ -0,0 +1,197 @@
+"""
+Trace context propagation and an in-memory span buffer.
+
+A JSONRPCClient given a Tracer starts a trace for a sample of its calls and
+sends its ids in the ``txjason.trace`` member of the request:
+
+    {"jsonrpc": "2.0", "method": "echo", "params": [1], "id": 1,
+     "txjason.trace": {"traceId": "...", "spanId": "..."}}
+
+A JSONRPCService given a Tracer adopts those ids, or starts a trace for a
+sample of the calls (a single request or a whole batch) that do not carry
+any. Each traced request records a
+span for each of its stages:
+
+- parse: from the call's arrival until it has been decoded;
+- queue: until its handler was called (validation, waiting in the scheduler
+  or the reactor);
+- execute: until its handler's result was available;
+- serialize: encoding the response.
+
+The client records a ``call`` span from sending the request to receiving its
+response. Server spans are children of the client's span, so both sides of a
+call can be matched by trace id.
+
+Spans are kept in a ring buffer of the last ``maxSpans``, so tracing costs
+no more memory the longer it runs and nothing at all for calls that are not
+sampled. ``dump`` returns them as JSON serializable dicts, ``export`` appends
+them to a file, one JSON object per line, and TraceHandler serves them as
+``txjason.traces``:
+
+    tracer = Tracer(sampleRate=0.01)
+    factory = JSONRPCServerFactory(tracer=tracer)
+    factory.addHandler(TraceHandler(tracer))
+"""
+import collections
+import json
+import random
+import time
+
+from txjason import handler
+
+
+TRACE = 'txjason.trace'
+
+
+def newId(bits=64):
+    return '%0*x' % (bits // 4, random.getrandbits(bits))
+
+
+class Span(object):
+    __slots__ = ('traceId', 'spanId', 'parentId', 'name', 'start', 'end',
+                 'method')
+
+    def __init__(self, traceId, spanId, parentId, name, start, end, method):
+        self.traceId = traceId
+        self.spanId = spanId
+        self.parentId = parentId
+        self.name = name
+        self.start = start
+        self.end = end
+        self.method = method
+
+    def toDict(self):
+        return {'traceId': self.traceId, 'spanId': self.spanId,
+                'parentId': self.parentId, 'name': self.name,
+                'start': self.start, 'duration': self.end - self.start,
+                'method': self.method}
+
+
+class Trace(object):
+    """
+    The trace context and stage timestamps of one traced request.
+    """
+    __slots__ = ('clock', 'traceId', 'parentId', 'method', 'started',
+                 'finished')
+
+    def __init__(self, clock, traceId, parentId):
+        self.clock = clock
+        self.traceId = traceId
+        self.parentId = parentId
+        self.method = None
+        self.started = self.finished = None
+
+
+class CallTrace(object):
+    """
+    The traced requests of one call (a single request or a batch), with the
+    timestamps they share.
+    """
+    __slots__ = ('tracer', 'sampled', 'received', 'parsed', 'serializing',
+                 'serialized', 'traces')
+
+    def __init__(self, tracer, sampled):
+        self.tracer = tracer
+        self.sampled = sampled
+        self.received = tracer.clock()
+        self.parsed = self.serializing = self.serialized = None
+        self.traces = []
+
+    def adopt(self, envelope):
+        """
+        Returns a Trace for a request with the ``envelope`` trace member, or
+        None if it is not traced.
+        """
+        clock = self.tracer.clock
+        if isinstance(envelope, dict) and \
+                isinstance(envelope.get('traceId'), basestring):
+            parentId = envelope.get('spanId')
+            if not isinstance(parentId, basestring):
+                parentId = None
+            trace = Trace(clock, envelope['traceId'], parentId)
+        elif self.sampled:
+            trace = Trace(clock, newId(128), None)
+        else:
+            return None
+        self.traces.append(trace)
+        return trace
+
+
+class Tracer(object):
+    def __init__(self, maxSpans=10000, sampleRate=1.0, clock=time.time):
+        self.sampleRate = sampleRate
+        self.clock = clock
+        self.spans = collections.deque(maxlen=maxSpans)
+        self._random = random.random
+
+    def sample(self):
+        """
+        Returns whether to start a new trace.
+        """
+        return self.sampleRate >= 1 or self._random() < self.sampleRate
+
+    def begin(self, data):
+        """
+        Returns a CallTrace for a call arriving as ``data``, or None if it is
+        not sampled and does not mention a trace context.
+        """
+        sampled = self.sample()
+        if not sampled and TRACE not in data:
+            return None
+        return CallTrace(self, sampled)
+
+    def record(self, traceId, parentId, name, start, end, method=None,
+               spanId=None):
+        """
+        Records a span and returns its id.
+        """
+        if spanId is None:
+            spanId = newId()
+        self.spans.append(
+            Span(traceId, spanId, parentId, name, start, end, method))
+        return spanId
+
+    def finish(self, call):
+        """
+        Records the spans of the requests of ``call``. Stages a request did
+        not reach (e.g. because it failed) are left out.
+        """
+        for trace in call.traces:
+            marks = (('parse', call.received, call.parsed),
+                     ('queue', call.parsed, trace.started),
+                     ('execute', trace.started, trace.finished),
+                     ('serialize', call.serializing, call.serialized))
+            for name, start, end in marks:
+                if start is not None and end is not None:
+                    self.record(trace.traceId, trace.parentId, name, start,
+                                end, trace.method)
+
+    def dump(self, traceId=None):
+        """
+        Returns the buffered spans, or those of ``traceId``, as dicts.
+        """
+        return [span.toDict() for span in self.spans
+                if traceId is None or span.traceId == traceId]
+
+    def export(self, path):
+        """
+        Appends the buffered spans to the file at ``path``, one JSON object
+        per line, and returns how many were written.
+        """
+        spans = self.dump()
+        with open(path, 'a') as f:
+            for span in spans:
+                f.write(json.dumps(span) + '\n')
+        return len(spans)
+
+
+class TraceHandler(handler.Handler):
+    """
+    Exports a tracer's spans as ``txjason.traces``.
+    """
+    def __init__(self, tracer):
+        self.tracer = tracer
+
+    @handler.exportRPC('txjason.traces')
+    def traces(self, traceId=None):
+        return self.tracer.dump(traceId)